@@ -0,0 +1,120 @@
+"""Measures get_calendar_events over many calendars, one after another and concurrently.
+
+Runs against the stub with a primary and --calendars - 1 shared calendars
+of --events events each, with events.list for every query (the store is
+off, see calendar_sync.py for it):
+
+    pages       max_items above the 2500 events Calendar returns per page,
+                one events.list call (as before) versus walking the pages
+    primary     the primary calendar only, for reference
+    sequential  all_calendars with MAX_CONCURRENT_CALENDARS = 1
+    concurrent  all_calendars with the default MAX_CONCURRENT_CALENDARS
+
+Every merged answer is checked: ordered by start, and the same events as
+all calendars together. Then the same queries from the synced stores, and
+once with a shared calendar that answers 403, which has to be left out.
+
+    python calendar_fanout.py --calendars 12 --events 3000 --calls 10
+"""
+import argparse
+import datetime
+import time
+
+from run_benchmark import _percentile, configure_google_apis
+from stub_server import start_stub_server
+
+
+def window():
+    monday = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    monday -= datetime.timedelta(days=monday.weekday() + 7)
+    return monday, monday + datetime.timedelta(days=21)
+
+
+def check(result, state, max_items):
+    if result["status"] != "success":
+        raise RuntimeError(result["message"])
+    starts = [event["start"]["dateTime"] for event in result["events"]]
+    if starts != sorted(starts):
+        raise RuntimeError("The merged events are not ordered by start")
+    expected = sorted(
+        event["start"]["dateTime"]
+        for calendar_id, events in state.calendars.items()
+        if calendar_id not in state.forbidden_calendars
+        for event in events
+    )[:max_items]
+    if starts != expected:
+        raise RuntimeError("The merged events differ from the events of all calendars")
+
+
+def time_calls(google_api_service, state, calls, max_items, all_calendars=True):
+    time_min, time_max = window()
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        result = google_api_service.get_calendar_events(time_min, time_max, max_items, all_calendars)
+        samples.append(time.perf_counter() - start)
+        if all_calendars:
+            check(result, state, max_items)
+    return samples
+
+
+def report(name, samples, digits=3):
+    print(f"{name:<22}{_percentile(samples, 50):>8.{digits}f}{_percentile(samples, 95):>8.{digits}f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calendars", type=int, default=12)
+    parser.add_argument("--events", type=int, default=3000, help="Events per calendar")
+    parser.add_argument("--calls", type=int, default=10)
+    parser.add_argument("--max-items", type=int, default=200)
+    parser.add_argument("--api-latency", default="lognormal:0.05:0.5")
+    args = parser.parse_args()
+
+    server = start_stub_server(api_latency=args.api_latency, events=args.events, calendars=args.calendars)
+    state = server.RequestHandlerClass.state
+    configure_google_apis(f"http://127.0.0.1:{server.server_port}")
+    from google_workspace_agent import google_api_service
+
+    google_api_service.USE_CALENDAR_STORE = False
+    time_min, time_max = window()
+    iso = "%Y-%m-%dT%H:%M:%SZ"
+    single_page = google_api_service.services.get("calendar", "v3").events().list(
+        calendarId="primary", timeMin=time_min.strftime(iso), timeMax=time_max.strftime(iso),
+        maxResults=args.events, singleEvents=True, orderBy="startTime",
+    ).execute()
+    result = google_api_service.get_calendar_events(time_min, time_max, args.events)
+    print(
+        f"max_items={args.events} on the primary calendar: one events.list call returns "
+        f"{len(single_page['items'])} events, get_calendar_events {len(result['events'])}\n"
+    )
+
+    default_concurrency = google_api_service.MAX_CONCURRENT_CALENDARS
+    print(f"{args.calendars} calendars{'p50 s':>14}{'p95 s':>8}")
+    report("primary only", time_calls(google_api_service, state, args.calls, args.max_items, False))
+    for name, concurrency in (("sequential", 1), ("concurrent", default_concurrency)):
+        google_api_service.MAX_CONCURRENT_CALENDARS = concurrency
+        google_api_service._fanout_pool = None  # sized on first use
+        report(name, time_calls(google_api_service, state, args.calls, args.max_items))
+
+    google_api_service.USE_CALENDAR_STORE = True
+    time_calls(google_api_service, state, 1, args.max_items)  # the full syncs
+    report("stores, synced", time_calls(google_api_service, state, args.calls, args.max_items), 4)
+
+    if args.calendars > 1:
+        forbidden = list(state.calendars)[-1]
+        state.forbidden_calendars.add(forbidden)
+        google_api_service.USE_CALENDAR_STORE = False
+        time_min, time_max = window()
+        result = google_api_service.get_calendar_events(time_min, time_max, args.max_items, True)
+        check(result, state, args.max_items)
+        if list(result.get("failed_calendars", {})) != [forbidden]:
+            raise RuntimeError(f"{forbidden} should be reported as failed")
+        print(f"\n{forbidden} answers 403: left out, the other calendars are merged")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
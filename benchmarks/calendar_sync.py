@@ -0,0 +1,120 @@
+"""Compares answering calendar range queries with events.list against the synced store.
+
+Asks the overlapping ranges of a weekly overview (last, this and next week,
+single days, the whole three weeks) --rounds times against the stub. Between
+two rounds an event is added, one moved and one cancelled.
+
+    api       events.list with timeMin/timeMax for every query
+    synced    the store, synced with the sync token before every query
+              (CALENDAR_SYNC_INTERVAL = 0)
+    local     the store within CALENDAR_SYNC_INTERVAL of the last sync
+
+Every store answer is checked against the answer of events.list. At the end
+the stub invalidates its sync tokens, so the next sync starts over.
+
+    python calendar_sync.py --events 2000 --rounds 20
+"""
+import argparse
+import datetime
+import random
+import statistics
+import time
+
+from run_benchmark import _percentile, configure_google_apis
+from stub_server import start_stub_server
+
+
+def ranges():
+    """(time_min, time_max) of the weekly overview queries."""
+    monday = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    monday -= datetime.timedelta(days=monday.weekday())
+    spans = [(-7, 0), (0, 7), (7, 14), (-7, 14), (0, 1), (2, 3), (4, 5), (-3, 4)]
+    return [
+        (monday + datetime.timedelta(days=start), monday + datetime.timedelta(days=end))
+        for start, end in spans
+    ]
+
+
+def ask(google_api_service, state, time_min, time_max):
+    """Returns (event ids, HTTP requests, seconds) of one query."""
+    before = state.request_counts.get("calendar.events.list", 0)
+    start = time.perf_counter()
+    result = google_api_service.get_calendar_events(time_min, time_max, 2500)
+    seconds = time.perf_counter() - start
+    if result["status"] != "success":
+        raise RuntimeError(result["message"])
+    requests = state.request_counts.get("calendar.events.list", 0) - before
+    return [event["id"] for event in result["events"]], requests, seconds
+
+
+def change_calendar(state, rng):
+    monday = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    state.add_event(monday + datetime.timedelta(days=rng.randrange(-7, 14), hours=rng.randrange(8, 18)))
+    ids = [event["id"] for event in state.events]
+    state.move_event(rng.choice(ids), minutes=rng.choice((-60, 30, 24 * 60)))
+    state.cancel_event(rng.choice(ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--api-latency", default="constant:0.05")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_stub_server(api_latency=args.api_latency, events=args.events)
+    state = server.RequestHandlerClass.state
+    configure_google_apis(f"http://127.0.0.1:{server.server_port}")
+    from google_workspace_agent import google_api_service
+
+    rng = random.Random(args.seed)
+    samples = {"api": [], "synced": [], "local": []}
+    first_sync = None
+    for _ in range(args.rounds):
+        change_calendar(state, rng)
+        for time_min, time_max in ranges():
+            google_api_service.USE_CALENDAR_STORE = False
+            expected, *row = ask(google_api_service, state, time_min, time_max)
+            samples["api"].append(row)
+            google_api_service.USE_CALENDAR_STORE = True
+            for mode, interval in (("synced", 0.0), ("local", 3600.0)):
+                google_api_service.CALENDAR_SYNC_INTERVAL = interval
+                ids, *row = ask(google_api_service, state, time_min, time_max)
+                if first_sync is None:
+                    first_sync = row  # the full sync, not a query like the others
+                else:
+                    samples[mode].append(row)
+                if ids != expected:
+                    raise RuntimeError(f"{mode} answer differs from events.list for {time_min}..{time_max}")
+
+    print(f"{'query':<8}{'requests':>9}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode, rows in samples.items():
+        requests = statistics.mean(row[0] for row in rows)
+        latencies = [row[1] * 1000 for row in rows]
+        print(
+            f"{mode:<8}{requests:>9.2f}{_percentile(latencies, 50):>10.3f}{_percentile(latencies, 95):>10.3f}"
+        )
+    print(f"\nfirst full sync: {first_sync[0]} requests, {first_sync[1] * 1000:.1f} ms")
+
+    state.expire_sync_tokens()
+    change_calendar(state, rng)
+    time_min, time_max = ranges()[1]
+    google_api_service.USE_CALENDAR_STORE = False
+    expected = ask(google_api_service, state, time_min, time_max)[0]
+    google_api_service.USE_CALENDAR_STORE = True
+    google_api_service.CALENDAR_SYNC_INTERVAL = 0.0
+    ids, requests, seconds = ask(google_api_service, state, time_min, time_max)
+    print(
+        f"after the sync token expired: {requests} requests, {seconds * 1000:.1f} ms, "
+        f"{'same' if ids == expected else 'DIFFERENT'} answer"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
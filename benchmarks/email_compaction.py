@@ -0,0 +1,108 @@
+"""Measures how much shorter the compacted email text is, and what it saves the agent.
+
+Runs against the stub serving recordings/mailbox.json: a newsletter, replies
+with quoted history and signatures, an Outlook reply with a legal notice,
+nested multipart messages with attachments, a receipt, a calendar invitation,
+a long report and a Latin-9 message. For every message the get_email_body
+result is compared:
+
+    raw        COMPACT_EMAILS = False, the text as before: the top-level
+               plain part, else the HTML. It misses the text of nested
+               parts and fails on charsets other than UTF-8, so those
+               messages are shorter raw than compacted
+    compacted  COMPACT_EMAILS = True, see email_text.py
+
+Tokens are estimated at 4 characters per token, like email_text.py does.
+Then the workspace agent is asked --runs times what needs attention in the
+mailbox, the model reads every message with get_email_body and answers. The
+stub adds --prefill-per-1k-tokens seconds for every 1000 prompt tokens, so
+the longer prompt of the raw text shows in the latency.
+
+    python email_compaction.py --runs 10 --prefill-per-1k-tokens 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import warnings
+
+from run_benchmark import _percentile, configure_google_apis
+from stub_server import MAILBOX_PATH, start_stub_server
+
+PROMPT = "What needs my attention in my fixture mailbox?"
+
+
+def tool_tokens(google_api_service, email_text, message_id):
+    """Estimated tokens of the get_email_body result, as the model gets it."""
+    return email_text.estimate_tokens(json.dumps(google_api_service.get_email_body(message_id)))
+
+
+async def ask_agent(agent, runs):
+    """Returns the seconds of every run and the prompt tokens of the last model call."""
+    from google.adk.runners import InMemoryRunner
+    from google.genai import types
+
+    runner = InMemoryRunner(agent=agent.root_agent, app_name="email_compaction")
+    samples, prompt_tokens = [], None
+    for _ in range(runs):
+        session = await runner.session_service.create_session(app_name="email_compaction", user_id="bench")
+        message = types.Content(role="user", parts=[types.Part(text=PROMPT)])
+        start = time.perf_counter()
+        async for event in runner.run_async(user_id="bench", session_id=session.id, new_message=message):
+            if event.usage_metadata and event.usage_metadata.prompt_token_count:
+                prompt_tokens = event.usage_metadata.prompt_token_count
+        samples.append(time.perf_counter() - start)
+    return samples, prompt_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mailbox", default=MAILBOX_PATH)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget", type=int, default=1000, help="EMAIL_TOKEN_BUDGET")
+    parser.add_argument("--latency", default="constant:0.4", help="Gemini latency distribution")
+    parser.add_argument("--prefill-per-1k-tokens", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = start_stub_server(
+        latency=args.latency,
+        api_latency="constant:0.01",
+        mailbox=args.mailbox,
+        prefill_per_1k_tokens=args.prefill_per_1k_tokens,
+    )
+    state = server.RequestHandlerClass.state
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    # The ADK model builds its client from the environment
+    os.environ["GOOGLE_GEMINI_BASE_URL"] = base_url
+    agent = configure_google_apis(base_url)
+    from google_workspace_agent import email_text, google_api_service
+
+    google_api_service.EMAIL_TOKEN_BUDGET = args.budget
+    print(f"{'message':<12}{'raw':>8}{'compacted':>11}  subject")
+    totals = {False: 0, True: 0}
+    for message in state.messages:
+        tokens = {}
+        for compact in (False, True):
+            google_api_service.COMPACT_EMAILS = compact
+            tokens[compact] = tool_tokens(google_api_service, email_text, message["id"])
+            totals[compact] += tokens[compact]
+        subject = next(h["value"] for h in message["payload"]["headers"] if h["name"] == "Subject")
+        print(f"{message['id']:<12}{tokens[False]:>8}{tokens[True]:>11}  {subject[:40]}")
+    print(
+        f"{'total':<12}{totals[False]:>8}{totals[True]:>11}  "
+        f"{1 - totals[True] / totals[False]:.0%} fewer tokens\n"
+    )
+
+    # Experimental ADK features warn on every request
+    warnings.simplefilter("ignore", UserWarning)
+    print(f"agent, {args.runs} runs{'p50 s':>10}{'p95 s':>8}{'prompt tokens':>15}")
+    for name, compact in (("raw", False), ("compacted", True)):
+        google_api_service.COMPACT_EMAILS = compact
+        samples, prompt_tokens = asyncio.run(ask_agent(agent, args.runs))
+        print(f"{name:<16}{_percentile(samples, 50):>10.3f}{_percentile(samples, 95):>8.3f}{prompt_tokens:>15}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
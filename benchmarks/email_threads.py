@@ -0,0 +1,153 @@
+"""Compares reading an email thread message by message with get_email_thread.
+
+Builds a thread of --replies replies between four people, every reply
+quoting the whole history below it: Gmail style ("On ... wrote:" and ">"
+lines), Outlook style (a From:/Sent: block) and now and then a paragraph
+of an earlier message pasted without any marker. The stub serves it and
+the thread is read
+
+    raw        with get_email_body for every message, COMPACT_EMAILS = False
+    compacted  with get_email_body for every message, COMPACT_EMAILS = True
+    thread     with one get_email_thread call
+
+Tokens are the estimated tokens of the tool results, at 4 characters per
+token like email_text.py. The thread record is checked: every reply's new
+text is in it exactly once.
+
+    python email_threads.py --replies 15
+"""
+import argparse
+import datetime
+import json
+import os
+import tempfile
+import time
+
+from run_benchmark import configure_google_apis
+from stub_server import start_stub_server
+
+PEOPLE = [
+    ("Maria Lopez", "maria@example.com"),
+    ("Sam Chen", "sam@example.com"),
+    ("Priya Raman", "priya@example.com"),
+    ("Jonas Weber", "jonas@example-legal.com"),
+]
+TOPICS = ("venue", "catering", "travel budget", "agenda", "hotel rooms", "team dinner")
+
+
+def new_text(i):
+    """The text reply i adds to the thread, with a marker to find it again."""
+    topic = TOPICS[i % len(TOPICS)]
+    return (
+        f"I looked at the {topic} again (point {i}). The quote we have is fine, but we should decide "
+        f"by the end of the week, otherwise the {topic} gets more expensive.\n"
+        f"Can someone from the team confirm the numbers for point {i} before Friday?"
+    )
+
+
+def thread_mailbox(replies):
+    """The messages of the thread, newest first like the stub's mailbox files."""
+    start = datetime.datetime(2026, 10, 5, 9, 0)
+    entries, plain, html = [], "", ""
+    for i in range(replies + 1):
+        name, address = PEOPLE[i % len(PEOPLE)]
+        previous_name, previous_address = PEOPLE[(i - 1) % len(PEOPLE)]
+        sent = start + datetime.timedelta(hours=5 * i)
+        body = f"Hi all,\n\n{new_text(i)}\n\n"
+        if i % 5 == 4:
+            # A paragraph of an earlier message, pasted without a quote marker
+            body += f"As {PEOPLE[(i - 3) % len(PEOPLE)][0]} wrote earlier:\n{new_text(i - 3)}\n\n"
+        signature = f"{name}\n\n--\n{name} | Example Inc.\n+1 555 01{i:02d} | https://example.com\n"
+        body_html = "".join(f"<p>{paragraph}</p>" for paragraph in body.strip().split("\n\n"))
+        body_html += f'<p>{name}</p><div class="gmail_signature">{name} | Example Inc.</div>'
+        if not plain:
+            plain, html = body + signature, body_html
+        elif i % 3 == 2:
+            plain = (
+                f"{body}{signature}\n________________________________\nFrom: {previous_name} <{previous_address}>\n"
+                f"Sent: {(sent - datetime.timedelta(hours=5)):%A, %B %d, %Y %H:%M}\nTo: team@example.com\n"
+                f"Subject: Offsite planning\n\n{plain}"
+            )
+            html = (
+                f'{body_html}<div id="divRplyFwdMsg"><b>From:</b> {previous_name}<br>'
+                f"<b>Sent:</b> {(sent - datetime.timedelta(hours=5)):%A, %B %d, %Y %H:%M}</div>{html}"
+            )
+        else:
+            quoted = "\n".join(f"> {line}" if line else ">" for line in plain.split("\n"))
+            plain = (
+                f"{body}{signature}\nOn {(sent - datetime.timedelta(hours=5)):%a, %b %d, %Y at %H:%M} "
+                f"{previous_name} <{previous_address}> wrote:\n{quoted}"
+            )
+            html = (
+                f'{body_html}<div class="gmail_quote">On {(sent - datetime.timedelta(hours=5)):%a, %b %d, %Y} '
+                f"{previous_name} wrote:<blockquote>{html}</blockquote></div>"
+            )
+        entries.append({
+            "id": f"reply{i:02d}",
+            "threadId": "offsite-thread",
+            "from": f"{name} <{address}>",
+            "to": "team@example.com",
+            "cc": ", ".join(f"{n} <{a}>" for n, a in PEOPLE if a != address),
+            "subject": "Offsite planning" if i == 0 else "Re: Offsite planning",
+            "body": {"mimeType": "multipart/alternative", "parts": [
+                {"mimeType": "text/plain", "text": plain},
+                {"mimeType": "text/html", "text": html},
+            ]},
+        })
+    return entries[::-1]
+
+
+def check(record, replies):
+    if record["status"] != "success":
+        raise RuntimeError(record["message"])
+    texts = [message["new_text"] for message in record["earlier_messages"]] + [record["latest"]["text"]]
+    if len(texts) != replies + 1:
+        raise RuntimeError(f"{len(texts)} messages in the thread record, expected {replies + 1}")
+    for i in range(replies + 1):
+        count = sum(text.count(f"(point {i})") for text in texts)
+        if count != 1 or f"(point {i})" not in texts[i]:
+            raise RuntimeError(f"The new text of reply {i} is in the thread record {count} times")
+    if len(record["participants"]) != len(PEOPLE) + 1:  # and the team list
+        raise RuntimeError(f"Unexpected participants {record['participants']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--replies", type=int, default=15)
+    parser.add_argument("--api-latency", default="constant:0.05")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    mailbox_path = os.path.join(directory, "thread.json")
+    with open(mailbox_path, "w", encoding="utf-8") as f:
+        json.dump(thread_mailbox(args.replies), f)
+    server = start_stub_server(api_latency=args.api_latency, mailbox=mailbox_path)
+    state = server.RequestHandlerClass.state
+    configure_google_apis(f"http://127.0.0.1:{server.server_port}")
+    from google_workspace_agent import email_text, google_api_service
+
+    ids = [message["id"] for message in state.messages]
+    print(f"thread of {len(ids)} messages{'requests':>11}{'seconds':>9}{'~tokens':>9}")
+    rows = {}
+    for name, compact in (("raw", False), ("compacted", True), ("thread", True)):
+        google_api_service.COMPACT_EMAILS = compact
+        before = sum(state.request_counts.values())
+        start = time.perf_counter()
+        if name == "thread":
+            results = [google_api_service.get_email_thread("offsite-thread")]
+            check(results[0], args.replies)
+        else:
+            results = [google_api_service.get_email_body(message_id) for message_id in ids]
+        seconds = time.perf_counter() - start
+        requests = sum(state.request_counts.values()) - before
+        rows[name] = email_text.estimate_tokens(json.dumps(results))
+        print(f"{name:<26}{requests:>11}{seconds:>9.3f}{rows[name]:>9}")
+    print(
+        f"\nthe thread record has {1 - rows['thread'] / rows['raw']:.0%} fewer tokens than the raw "
+        f"messages and {1 - rows['thread'] / rows['compacted']:.0%} fewer than the compacted ones"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compares fetching emails one request at a time with batched fetching.
+
+Runs against the stub in a separate process (so the two don't share a GIL),
+with a fixed latency per Gmail request:
+
+    sequential  messages.list, then one messages.get per message, the way
+                get_emails used to work
+    batched     get_emails: paginated listing and batch requests of 50,
+                several batches at once
+
+Then compares what the agent gets for --context-count emails: full
+messages with their text, or only the metadata (get_email_body() fetches
+the text of single messages on demand).
+
+    python gmail_fetch.py --counts 10,100,500,1000 --api-latency constant:0.05
+"""
+import argparse
+import json
+import time
+
+from run_benchmark import configure_google_apis
+from upload_memory import start_stub
+
+
+def fetch_sequentially(google_api_service, count):
+    service = google_api_service.services.get("gmail", "v1")
+    ids, page_token = [], None
+    while len(ids) < count:
+        results = service.users().messages().list(
+            userId="me", maxResults=min(count - len(ids), 500), pageToken=page_token
+        ).execute()
+        ids += [message["id"] for message in results.get("messages", [])]
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    messages = service.users().messages()
+    return [
+        google_api_service._parse_message(messages.get(userId="me", id=message_id).execute())
+        for message_id in ids[:count]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--counts", default="10,100,500,1000")
+    parser.add_argument("--api-latency", default="constant:0.05")
+    parser.add_argument("--max-sequential", type=int, default=500, help="Skip slower sequential runs")
+    parser.add_argument("--context-count", type=int, default=50)
+    args = parser.parse_args()
+    counts = [int(count) for count in args.counts.split(",")]
+
+    stub, base_url = start_stub("--api-latency", args.api_latency, "--messages", str(max(counts)))
+    try:
+        configure_google_apis(base_url)
+        from google_workspace_agent import google_api_service
+
+        google_api_service.USE_GMAIL_STORE = False  # every listing fetches, see gmail_sync.py
+        google_api_service.get_emails(1)  # build the clients and open the connection
+        print(f"{'emails':>7}{'sequential s':>14}{'batched s':>11}")
+        for count in counts:
+            sequential = "-"
+            if count <= args.max_sequential:
+                start = time.perf_counter()
+                fetch_sequentially(google_api_service, count)
+                sequential = f"{time.perf_counter() - start:.2f}"
+            start = time.perf_counter()
+            result = google_api_service.get_emails(count)
+            batched = time.perf_counter() - start
+            if result["status"] != "success" or len(result["messages"]) != count:
+                raise RuntimeError(f"get_emails({count}) failed: {result.get('message')}")
+            print(f"{count:>7}{sequential:>14}{batched:>11.2f}")
+
+        print(f"\n{'listing':<10}{'seconds':>8}{'chars':>9}{'~tokens':>9}")
+        for listing, include_body in (("full", True), ("metadata", False)):
+            start = time.perf_counter()
+            result = google_api_service.get_emails(args.context_count, include_body=include_body)
+            seconds = time.perf_counter() - start
+            chars = len(json.dumps(result))
+            print(f"{listing:<10}{seconds:>8.2f}{chars:>9}{chars // 4:>9}")
+    finally:
+        stub.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Compares listing a busy inbox from scratch with listing it from the synced store.
+
+Lists the newest --count emails --rounds times against the stub. Between
+two listings the inbox changes: --new messages arrive, one is deleted and
+one moved to the trash.
+
+    refetch   messages.list and batch requests of metadata on every listing
+    store     get_emails with the store: a full sync the first time, then
+              users.history.list and a batch of the changed messages
+
+Every store listing is checked against the listing from scratch. At the end
+the stub forgets its history, so the next listing has to sync from scratch.
+
+    python gmail_sync.py --messages 2000 --count 50 --rounds 20 --new 3
+"""
+import argparse
+import statistics
+import time
+
+from run_benchmark import configure_google_apis
+from stub_server import start_stub_server
+
+
+HTTP_ROUTES = ("batch", "gmail.messages.list", "gmail.history.list", "gmail.getProfile")
+
+
+def listing(google_api_service, state, count):
+    """Returns (ids, HTTP requests, messages fetched, bytes received, seconds) of one listing."""
+    counts_before, bytes_before = dict(state.request_counts), state.bytes_sent
+    start = time.perf_counter()
+    result = google_api_service.get_emails(count)
+    seconds = time.perf_counter() - start
+    if result["status"] != "success":
+        raise RuntimeError(result["message"])
+    counts = {
+        route: state.request_counts.get(route, 0) - counts_before.get(route, 0)
+        for route in (*HTTP_ROUTES, "gmail.messages.get")
+    }
+    requests = sum(counts[route] for route in HTTP_ROUTES)
+    ids = [message["id"] for message in result["messages"]]
+    return ids, requests, counts["gmail.messages.get"], state.bytes_sent - bytes_before, seconds
+
+
+def change_inbox(state, new):
+    state.deliver(new)
+    inbox = [message["id"] for message in state.messages if "TRASH" not in message["labelIds"]]
+    state.delete([inbox[len(inbox) // 4]])
+    state.relabel([inbox[5]], add=("TRASH",), remove=("INBOX",))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--new", type=int, default=3, help="New messages between two listings")
+    parser.add_argument("--api-latency", default="constant:0.05")
+    args = parser.parse_args()
+
+    server = start_stub_server(api_latency=args.api_latency, messages=args.messages)
+    state = server.RequestHandlerClass.state
+    configure_google_apis(f"http://127.0.0.1:{server.server_port}")
+    from google_workspace_agent import google_api_service
+
+    rows = {"refetch": [], "store": []}
+    for _ in range(args.rounds):
+        change_inbox(state, args.new)
+        google_api_service.USE_GMAIL_STORE = False
+        expected, *row = listing(google_api_service, state, args.count)
+        rows["refetch"].append(row)
+        google_api_service.USE_GMAIL_STORE = True
+        ids, *row = listing(google_api_service, state, args.count)
+        rows["store"].append(row)
+        if ids != expected:
+            raise RuntimeError("The store listing differs from the listing from scratch")
+
+    print(f"{'listing':<18}{'requests':>9}{'fetched':>9}{'KB':>8}{'ms':>8}")
+    for name, samples in rows.items():
+        # The first store listing is the full sync, show it on its own
+        for label, part in ((f"{name} first", samples[:1]), (f"{name} later", samples[1:])):
+            requests, fetched, received, seconds = (statistics.median(column) for column in zip(*part))
+            print(f"{label:<18}{requests:>9.0f}{fetched:>9.0f}{received / 1024:>8.1f}{seconds * 1000:>8.1f}")
+
+    change_inbox(state, args.new)
+    state.expire_history()
+    google_api_service.USE_GMAIL_STORE = False
+    expected = listing(google_api_service, state, args.count)[0]
+    google_api_service.USE_GMAIL_STORE = True
+    ids, requests, fetched, received, seconds = listing(google_api_service, state, args.count)
+    print(
+        f"\nafter the history expired: {requests} requests, {fetched} fetched, "
+        f"{received / 1024:.1f} KB, {seconds * 1000:.1f} ms, "
+        f"{'same' if ids == expected else 'DIFFERENT'} listing"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Measures the per-call overhead of the workspace tools with and without cached clients.
+
+Runs get_calendar_events and get_emails against the stub, once the old way
+(token.json read and the discovery document parsed on every call) and once
+with google_clients.py (credentials and clients cached). Then lets --threads
+threads call the calendar tool at once while the token is about to expire,
+and counts the requests to the token endpoint.
+
+    python google_client_overhead.py --calls 50 --threads 16
+"""
+import argparse
+import concurrent.futures
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "gemini-agent-demo"))
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from googleapiclient import discovery
+
+from google_workspace_agent import google_api_service, google_clients
+from stub_server import start_stub_server
+
+
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+
+class StubRequest(Request):
+    """Sends token refreshes to the stub, the token URI in token.json is always Google's."""
+
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url
+
+    def __call__(self, url, *args, **kwargs):
+        return super().__call__(url.replace(GOOGLE_TOKEN_URI, f"{self.base_url}/token"), *args, **kwargs)
+
+
+class UncachedServices(google_clients.ServiceCache):
+    """What every tool call did before: read token.json and build the client from scratch."""
+
+    def __init__(self, token_path, endpoints, base_url):
+        super().__init__(None, endpoints)
+        self.token_path = token_path
+        self.base_url = base_url
+
+    def get(self, name, version):
+        creds = Credentials.from_authorized_user_file(self.token_path, google_api_service.SCOPES)
+        if not creds.valid:
+            creds.refresh(StubRequest(self.base_url))
+            with open(self.token_path, "w") as token:
+                token.write(creds.to_json())
+        return discovery.build(
+            name,
+            version,
+            credentials=creds,
+            static_discovery=True,
+            client_options={"api_endpoint": self.endpoints[name]},
+        )
+
+
+def write_token(path, expires_in):
+    creds = Credentials(
+        token="stub-token",
+        refresh_token="stub-refresh-token",
+        client_id="stub",
+        client_secret="stub",
+        scopes=google_api_service.SCOPES,
+        expiry=google_clients._utcnow() + datetime.timedelta(seconds=expires_in),
+    )
+    with open(path, "w") as token:
+        token.write(creds.to_json())
+
+
+def time_calls(services, calls):
+    google_api_service.services = services
+    # Every call reaches the API
+    google_api_service.USE_GMAIL_STORE = False
+    google_api_service.USE_CALENDAR_STORE = False
+    tools = {
+        "get_calendar_events": lambda: google_api_service.get_calendar_events("week start", "week end", 50),
+        "get_emails": lambda: google_api_service.get_emails(10),
+    }
+    results = {}
+    for name, tool in tools.items():
+        samples, client_samples = [], []
+        for _ in range(calls):
+            start = time.perf_counter()
+            services.get(*(("calendar", "v3") if name == "get_calendar_events" else ("gmail", "v1")))
+            client_samples.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            result = tool()
+            samples.append(time.perf_counter() - start)
+            if result["status"] != "success":
+                raise RuntimeError(result["message"])
+        results[name] = (statistics.median(samples), statistics.median(client_samples))
+    return results
+
+
+def count_refreshes(state, services, threads):
+    """Calls the calendar tool from many threads at once, returns the token requests."""
+    google_api_service.services = services
+    google_api_service.USE_CALENDAR_STORE = False
+    before = state.request_counts.get("oauth.token", 0)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(
+            lambda _: google_api_service.get_calendar_events("week start", "week end", 10),
+            range(threads),
+        ))
+    return state.request_counts.get("oauth.token", 0) - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--events", type=int, default=50)
+    args = parser.parse_args()
+
+    server = start_stub_server(api_latency="constant:0", events=args.events)
+    state = server.RequestHandlerClass.state
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    endpoints = {"calendar": f"{base_url}/calendar/v3/", "gmail": f"{base_url}/"}
+
+    with tempfile.TemporaryDirectory() as directory:
+        token_path = os.path.join(directory, "token.json")
+        write_token(token_path, expires_in=3600)
+
+        def cached():
+            provider = google_clients.CredentialsProvider(
+                google_api_service.SCOPES, token_path=token_path, request=StubRequest(base_url)
+            )
+            return provider, google_clients.ServiceCache(provider.get, endpoints)
+
+        provider, services = cached()
+        modes = {"uncached": UncachedServices(token_path, endpoints, base_url), "cached": services}
+        print(f"{'tool':<22}{'clients':>10}{'call ms':>10}{'client ms':>11}")
+        for mode, mode_services in modes.items():
+            for tool, (call_s, client_s) in time_calls(mode_services, args.calls).items():
+                print(f"{tool:<22}{mode:>10}{call_s * 1000:>10.2f}{client_s * 1000:>11.3f}")
+        provider.close()
+
+        # A token that expires within the refresh margin, hit by many threads at once
+        print(f"\n{args.threads} concurrent calls with an expiring token:")
+        write_token(token_path, expires_in=-1)
+        refreshes = count_refreshes(state, UncachedServices(token_path, endpoints, base_url), args.threads)
+        print(f"  uncached  {refreshes} token refreshes")
+        write_token(token_path, expires_in=3600)
+        provider, services = cached()
+        provider.get()
+        provider._creds.expiry = google_clients._utcnow() + datetime.timedelta(minutes=1)
+        refreshes = count_refreshes(state, services, args.threads)
+        print(f"  cached    {refreshes} token refreshes")
+        provider.close()
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
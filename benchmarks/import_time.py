@@ -0,0 +1,80 @@
+"""Checks that importing the app modules stays within a time budget.
+
+Each module is imported in a fresh interpreter a few times and the median
+import time is compared with its budget. The check also fails if importing a
+module already loads google.genai, which should only happen on the first
+Gemini call (see genai_client.py).
+
+    python import_time.py
+    python import_time.py --scale 1.5   # slower machine
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (directory, module, budget in seconds)
+BUDGETS = (
+    ("food-assistant", "gemini_service", 0.6),
+    ("gemini-agent-demo", "gemini_tools", 0.9),
+)
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "genai_loaded": "google.genai" in sys.modules}}))
+"""
+
+
+def measure(directory, module, runs):
+    samples, genai_loaded = [], False
+    env = dict(os.environ, GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "stub"))
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module)],
+            cwd=os.path.join(ROOT, directory),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(probe["seconds"])
+        genai_loaded = genai_loaded or probe["genai_loaded"]
+    return statistics.median(samples), genai_loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies every budget")
+    args = parser.parse_args()
+
+    ok = True
+    for directory, module, budget in BUDGETS:
+        budget *= args.scale
+        try:
+            seconds, genai_loaded = measure(directory, module, args.runs)
+        except subprocess.CalledProcessError as e:
+            ok = False
+            error = (e.stderr.strip().splitlines() or ["unknown error"])[-1]
+            print(f"FAIL {directory}/{module}: import failed: {error}")
+            continue
+        passed = seconds <= budget and not genai_loaded
+        ok = ok and passed
+        note = " (imports google.genai eagerly)" if genai_loaded else ""
+        print(
+            f"{'ok  ' if passed else 'FAIL'} {directory}/{module}: "
+            f"{seconds:.3f}s (budget {budget:.2f}s){note}"
+        )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Times the analytics queries of the invoice store on a large synthetic store.
+
+Fills a temporary store with --items line items (spread over three years,
+a few thousand products and ~20 items per invoice) and runs every query of
+the Spending page a few times. Fails if the median of any query is above
+--budget seconds.
+
+    python invoice_store_queries.py --items 5000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "food-assistant"))
+
+from invoice_store import InvoiceStore
+
+
+ITEMS_PER_INVOICE = 20
+PRODUCTS = 5000
+
+
+def fill(store, items):
+    """Bulk-generates the rows in SQL, inserting millions through add() would take minutes."""
+    connection = store._connection
+    connection.execute(
+        f"""
+        INSERT INTO invoices
+        SELECT 'inv' || i, 'synthetic', DATE '2022-01-01' + CAST(i % 1095 AS INTEGER),
+            0.0, now()
+        FROM range({items // ITEMS_PER_INVOICE}) t(i)
+        """
+    )
+    connection.execute(
+        f"""
+        INSERT INTO line_items
+        SELECT 'inv' || (i // {ITEMS_PER_INVOICE}),
+            DATE '2022-01-01' + CAST((i // {ITEMS_PER_INVOICE}) % 1095 AS INTEGER),
+            'PRODUCT ' || (hash(i) % {PRODUCTS}),
+            'product ' || (hash(i) % {PRODUCTS}),
+            ['healthy', 'neutral', 'unhealthy'][1 + CAST(hash(i) % {PRODUCTS} % 3 AS INTEGER)],
+            round(0.5 + (hash(i) % 1000) / 100.0, 2)
+        FROM range({items}) t(i)
+        """
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=2_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="Seconds per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = InvoiceStore(os.path.join(directory, "invoices.duckdb"))
+        start = time.perf_counter()
+        fill(store, args.items)
+        print(f"Filled {store.stats()['line_items']:,} line items in {time.perf_counter() - start:.1f}s")
+
+        queries = {
+            "spend_by_category": lambda: store.spend_by_category(),
+            "spend_by_category (one year)": lambda: store.spend_by_category("2023-01-01", "2024-01-01"),
+            "price_history": lambda: store.price_history("PRODUCT 42"),
+            "top_items": lambda: store.top_items(20),
+            "top_items (purchases)": lambda: store.top_items(20, by="purchases"),
+        }
+        ok = True
+        for name, query in queries.items():
+            samples = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                query()
+                samples.append(time.perf_counter() - start)
+            median = statistics.median(samples)
+            passed = median <= args.budget
+            ok = ok and passed
+            print(f"{'ok  ' if passed else 'FAIL'} {name:<30}{median * 1000:>9.1f} ms")
+        store.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compares extraction on the strong model alone with tiered extraction.
+
+Runs analyze_pdf against the stub, once with every call on MODEL and once
+with FAST_MODEL first and escalation on failed checks. The stub answers
+FAST_MODEL faster, and makes --defect-rate of its answers wrong (one item
+dropped), so the escalation path really runs:
+
+    python model_tiering.py --requests 200 --defect-rate 0.1
+
+Accuracy is the share of results identical to the extraction of MODEL. Cost
+is estimated from the token counts with the per-token prices below.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from run_benchmark import PDF_PATH, _percentile, configure_gemini
+from stub_server import start_stub_server
+
+
+# USD per million (prompt, output) tokens, list prices at the time of writing
+PRICES = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+}
+
+
+async def run(gemini_service, pdf_bytes, requests, concurrency, reference):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, correct = [], 0
+
+    async def one():
+        nonlocal correct
+        async with semaphore:
+            start = loop.time()
+            result = await gemini_service.analyze_pdf_async(pdf_bytes)
+            latencies.append(loop.time() - start)
+            correct += json.dumps(result, sort_keys=True) == reference
+
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, correct
+
+
+def cost(usage_log):
+    total = 0.0
+    for entry in usage_log:
+        prompt_price, output_price = PRICES[entry["model"]]
+        total += (entry["prompt_tokens"] * prompt_price + entry["output_tokens"] * output_price) / 1e6
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", default="lognormal:0.8:0.4", help="Latency of the strong model")
+    parser.add_argument("--fast-latency", default="lognormal:0.4:0.4", help="Latency of the fast model")
+    parser.add_argument("--defect-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(PDF_PATH, "rb") as f:
+        pdf_bytes = f.read()
+
+    import gemini_service
+
+    server = start_stub_server(
+        latency=args.latency,
+        model_latency={gemini_service.FAST_MODEL: args.fast_latency},
+        defect_rate=args.defect_rate,
+        defect_models=(gemini_service.FAST_MODEL,),
+    )
+    configure_gemini(f"http://127.0.0.1:{server.server_port}")
+
+    async def run_all():
+        # One event loop for all runs, the async client's connections are bound to it
+        gemini_service.USE_MODEL_TIERS = False
+        reference = json.dumps(await gemini_service.analyze_pdf_async(pdf_bytes), sort_keys=True)
+
+        print(
+            f"{'routing':<10}{'accuracy':>9}{'p50 s':>8}{'p95 s':>8}"
+            f"{'escalated':>11}{'USD/1k':>9}"
+        )
+        for name, tiered in (("strong", False), ("tiered", True)):
+            random.seed(args.seed)
+            gemini_service.USE_MODEL_TIERS = tiered
+            gemini_service.usage_log.clear()
+            gemini_service.routing_log.clear()
+            latencies, correct = await run(
+                gemini_service, pdf_bytes, args.requests, args.concurrency, reference
+            )
+            decisions = [entry["decision"] for entry in gemini_service.routing_log
+                         if entry["model"] == gemini_service.FAST_MODEL]
+            escalated = decisions.count("escalated") / len(decisions) if decisions else 0.0
+            print(
+                f"{name:<10}{correct / args.requests:>9.1%}{_percentile(latencies, 50):>8.2f}"
+                f"{_percentile(latencies, 95):>8.2f}{escalated:>11.1%}"
+                f"{cost(gemini_service.usage_log) / args.requests * 1000:>9.3f}"
+            )
+
+    asyncio.run(run_all())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
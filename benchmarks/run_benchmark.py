@@ -0,0 +1,247 @@
+"""Offline load test for the food assistant and the workspace agent tools.
+
+Starts the local stub (stub_server.py), points gemini_service and the Google
+API client at it and runs every scenario at increasing concurrency. The report
+is printed and written as JSON, so two commits can be compared:
+
+    python run_benchmark.py --output before.json
+    git checkout my-branch
+    python run_benchmark.py --output after.json --baseline before.json
+
+With --baseline the exit code is 1 if a p95 latency or throughput got worse
+than --max-regression allows.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "gemini-agent-demo"))
+sys.path.insert(0, os.path.join(ROOT, "food-assistant"))
+# The stub doesn't check the key, but the client refuses to start without one
+os.environ.setdefault("GOOGLE_API_KEY", "stub")
+
+from metrics import percentile as _percentile
+from stub_server import start_stub_server
+
+
+PDF_PATH = os.path.join(ROOT, "food-assistant", "rewe_invoice.pdf")
+SCENARIOS = ("analyze_pdf", "staged", "fused", "calendar_tool", "email_tool")
+
+
+def configure_gemini(base_url):
+    from google import genai
+    from google.genai import types
+
+    import gemini_service
+    from genai_client import set_client
+
+    set_client(genai.Client(api_key="stub", http_options=types.HttpOptions(base_url=base_url)))
+    # Every request should reach the stub
+    gemini_service.cache.enabled = False
+    gemini_service.recipe_cache.enabled = False
+    return gemini_service
+
+
+def configure_google_apis(base_url):
+    from google.auth.credentials import AnonymousCredentials
+
+    from google_workspace_agent import agent, calendar_store, gmail_store, google_api_service
+    from google_workspace_agent.google_clients import ServiceCache
+
+    credentials = AnonymousCredentials()
+    google_api_service.services = ServiceCache(
+        lambda: credentials,
+        endpoints={"calendar": f"{base_url}/calendar/v3/", "gmail": f"{base_url}/"},
+    )
+    # Fresh stores, not the ones of the real account
+    directory = tempfile.mkdtemp()
+    gmail_store._store = gmail_store.GmailStore(os.path.join(directory, "messages.sqlite"))
+    calendar_store.STORE_PATH = os.path.join(directory, "events.sqlite")
+    calendar_store._stores.clear()  # opened again in the new directory on first use
+    return agent
+
+
+def make_scenarios(base_url):
+    gemini_service = configure_gemini(base_url)
+    with open(PDF_PATH, "rb") as f:
+        pdf_bytes = f.read()
+
+    async def consume(stream):
+        async for _ in stream:
+            pass
+
+    async def analyze_pdf():
+        await gemini_service.analyze_pdf_async(pdf_bytes)
+
+    async def staged():
+        # Same flow as main.py: extraction, then both streams concurrently
+        invoice = await gemini_service.analyze_pdf_async(pdf_bytes)
+        await asyncio.gather(
+            consume(gemini_service.stream_unhealthy_items_async(invoice)),
+            consume(gemini_service.stream_recipes_async(invoice)),
+        )
+
+    async def fused():
+        await asyncio.to_thread(gemini_service.analyze_pdf_fused, pdf_bytes)
+
+    scenarios = {"analyze_pdf": analyze_pdf, "staged": staged, "fused": fused}
+
+    try:
+        agent = configure_google_apis(base_url)
+    except ImportError as e:
+        print(f"Skipping the agent tool scenarios: {e}", file=sys.stderr)
+        return scenarios
+
+    async def calendar_tool():
+        result = await asyncio.to_thread(agent.get_calendar_events, "week start", "week end", 200)
+        if result["status"] != "success":
+            raise RuntimeError(result["message"])
+
+    async def email_tool():
+        result = await asyncio.to_thread(agent.get_emails, 10)
+        if result["status"] != "success":
+            raise RuntimeError(result["message"])
+
+    scenarios.update(calendar_tool=calendar_tool, email_tool=email_tool)
+    return scenarios
+
+
+async def run_level(scenario, concurrency, requests):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await scenario()
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": _percentile(latencies, 50),
+        "p95_s": _percentile(latencies, 95),
+        "p99_s": _percentile(latencies, 99),
+    }
+
+
+async def run(scenarios, names, levels, requests):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=max(levels)))
+    results = {}
+    for name in names:
+        if name not in scenarios:
+            continue
+        results[name] = {}
+        for concurrency in levels:
+            result = await run_level(scenarios[name], concurrency, max(requests, concurrency))
+            results[name][str(concurrency)] = result
+            print(
+                f"{name:<14}{concurrency:>6}{result['throughput_rps']:>10.2f}"
+                f"{result['p50_s']:>9.3f}{result['p95_s']:>9.3f}{result['p99_s']:>9.3f}{result['errors']:>8}"
+            )
+    return results
+
+
+def compare(baseline, current, max_regression):
+    """Prints the change per scenario and level, returns False on a regression."""
+    ok = True
+    print(f"\n{'scenario':<14}{'conc':>6}{'p95 before':>12}{'p95 after':>11}{'rps before':>12}{'rps after':>11}")
+    for name, levels in current["results"].items():
+        for concurrency, after in levels.items():
+            before = baseline["results"].get(name, {}).get(concurrency)
+            if before is None:
+                continue
+            regressed = (
+                after["p95_s"] > before["p95_s"] * (1 + max_regression)
+                or after["throughput_rps"] < before["throughput_rps"] * (1 - max_regression)
+            )
+            ok = ok and not regressed
+            print(
+                f"{name:<14}{concurrency:>6}{before['p95_s']:>12.3f}{after['p95_s']:>11.3f}"
+                f"{before['throughput_rps']:>12.2f}{after['throughput_rps']:>11.2f}"
+                f"{'  REGRESSION' if regressed else ''}"
+            )
+    return ok
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated levels")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per level")
+    parser.add_argument("--latency", default="lognormal:0.8:0.4", help="Gemini latency distribution")
+    parser.add_argument("--api-latency", default="constant:0.05", help="Calendar/Gmail latency")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="Report of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.10)
+    args = parser.parse_args()
+
+    import random
+    random.seed(args.seed)
+
+    config = {
+        "latency": args.latency,
+        "api_latency": args.api_latency,
+        "error_rate": args.error_rate,
+        "requests": args.requests,
+    }
+    server = start_stub_server(
+        latency=args.latency, api_latency=args.api_latency, error_rate=args.error_rate
+    )
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    scenarios = make_scenarios(base_url)
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    print(f"{'scenario':<14}{'conc':>6}{'rps':>10}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'errors':>8}")
+    results = asyncio.run(run(scenarios, args.scenarios.split(","), levels, args.requests))
+    server.shutdown()
+
+    report = {
+        "commit": _git_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": config,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("Warning: the baseline was run with a different configuration", file=sys.stderr)
+        if not compare(baseline, report, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
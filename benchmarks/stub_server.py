@@ -0,0 +1,930 @@
+"""Local stand-in for the Gemini and Google Workspace REST endpoints.
+
+Replays the recorded Gemini responses in recordings/gemini.json (the first
+recording whose "match" string appears in the request wins) and serves
+synthetic Calendar events and Gmail messages (with the changes benchmarks
+make to them, for incremental syncs), or the emails of a mailbox file like
+recordings/mailbox.json, and OAuth token refreshes. Files API uploads are
+accepted with the resumable upload protocol and their bytes discarded as
+they arrive. Cached contents can be created, read and deleted, they expire
+after their TTL and requests referencing a missing one get a 404. Every response is delayed by a configurable latency
+distribution (per model if needed, plus some time per prompt token), and a
+share of requests can fail with 429/503 to exercise retries. A share of the
+structured answers of chosen models can be made wrong on purpose, with one
+invoice item dropped, to exercise the escalation of model tiers.
+
+    python stub_server.py --port 8765 --latency lognormal:0.8:0.4 --error-rate 0.02
+
+Point the clients at it with the base URL http://127.0.0.1:8765, see
+run_benchmark.py for how.
+"""
+import argparse
+import base64
+import datetime
+import http
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+RECORDINGS_PATH = os.path.join(os.path.dirname(__file__), "recordings", "gemini.json")
+# Real-world shaped emails: newsletters, replies with quotes, nested parts, ...
+MAILBOX_PATH = os.path.join(os.path.dirname(__file__), "recordings", "mailbox.json")
+# Gmail rejects batches with more requests
+MAX_BATCH_SIZE = 100
+# Calendar returns at most this many events per page, whatever maxResults says
+MAX_EVENTS_PAGE = 2500
+PRIMARY_CALENDAR = "me@example.com"
+# historyTypes of users.history.list and the record field each one selects
+HISTORY_TYPES = {
+    "messageAdded": "messagesAdded",
+    "messageDeleted": "messagesDeleted",
+    "labelAdded": "labelsAdded",
+    "labelRemoved": "labelsRemoved",
+}
+
+
+def parse_latency(spec: str):
+    """Returns a function that draws a latency in seconds.
+
+    Supported specs:
+        constant:SECONDS
+        uniform:LOW:HIGH
+        lognormal:MEDIAN:SIGMA
+    """
+    kind, *args = spec.split(":")
+    args = [float(arg) for arg in args]
+    if kind == "constant":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(args[0]), args[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _synthetic_events(count, seed=0, prefix="event"):
+    rng = random.Random(seed)
+    monday = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    monday -= datetime.timedelta(days=monday.weekday() + 7)
+    events = []
+    for i in range(count):
+        start = monday + datetime.timedelta(
+            days=rng.randrange(21), hours=rng.randrange(8, 18), minutes=rng.choice((0, 30))
+        )
+        end = start + datetime.timedelta(minutes=rng.choice((30, 60, 90)))
+        events.append({
+            "kind": "calendar#event",
+            "id": f"{prefix}{i:05d}",
+            "status": "confirmed",
+            "summary": rng.choice(("Standup", "1:1", "Planning", "Review", "Lunch", "Interview")),
+            "start": {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%SZ")},
+            "end": {"dateTime": end.strftime("%Y-%m-%dT%H:%M:%SZ")},
+            "attendees": [{"email": f"person{rng.randrange(50)}@example.com"} for _ in range(3)],
+        })
+    # orderBy=startTime, ties by id
+    events.sort(key=lambda event: (event["start"]["dateTime"], event["id"]))
+    return events
+
+
+def _synthetic_messages(count, seed=0):
+    rng = random.Random(seed)
+    now_ms = int(time.time() * 1000)
+    messages = []
+    for i in range(count):
+        text = f"Hi,\n\nthis is message {i} about the {rng.choice(('budget', 'launch', 'offsite', 'hiring'))}.\n" * 5
+        html = "<html><body>" + text.replace("\n", "<br>") + "</body></html>"
+        messages.append({
+            "id": f"msg{i:05d}",
+            "threadId": f"thread{i // 3:05d}",
+            "labelIds": ["INBOX"],
+            "snippet": text[:100],
+            "internalDate": str(now_ms - i * 3_600_000),
+            "payload": {
+                "mimeType": "multipart/alternative",
+                "headers": [
+                    {"name": "From", "value": f"Person {i % 17} <person{i % 17}@example.com>"},
+                    {"name": "Subject", "value": f"Message {i}"},
+                    {"name": "Date", "value": time.strftime("%a, %d %b %Y %H:%M:%S +0000")},
+                ],
+                "parts": [
+                    {"mimeType": "text/plain", "body": {"data": _b64(text), "size": len(text)}},
+                    {"mimeType": "text/html", "body": {"data": _b64(html), "size": len(html)}},
+                ],
+            },
+        })
+    return messages
+
+
+def _mailbox_messages(path):
+    """The messages of a mailbox file, with their parts as Gmail returns them."""
+    with open(path, encoding="utf-8") as f:
+        mailbox = json.load(f)
+    now_ms = int(time.time() * 1000)
+    messages = []
+    for i, entry in enumerate(mailbox):
+        payload = _payload(entry["body"], "")
+        payload["headers"] = [
+            {"name": "From", "value": entry["from"]},
+            *({"name": name.title(), "value": entry[name]} for name in ("to", "cc") if name in entry),
+            {"name": "Subject", "value": entry["subject"]},
+            {"name": "Date", "value": time.strftime("%a, %d %b %Y %H:%M:%S +0000")},
+            *payload["headers"],
+        ]
+        messages.append({
+            "id": entry["id"],
+            "threadId": entry.get("threadId", entry["id"]),
+            "labelIds": ["INBOX"],
+            "snippet": entry["subject"],
+            "internalDate": str(now_ms - i * 3_600_000),
+            "payload": payload,
+        })
+    return messages
+
+
+def _payload(part, part_id):
+    """A message part of a mailbox file as Gmail returns it, text base64url-encoded in its charset."""
+    mime_type = part["mimeType"]
+    charset = part.get("charset", "utf-8")
+    payload = {
+        "partId": part_id,
+        "mimeType": mime_type,
+        "filename": part.get("filename", ""),
+        "headers": [{
+            "name": "Content-Type",
+            "value": mime_type if mime_type.startswith("multipart/") else f'{mime_type}; charset="{charset}"',
+        }],
+    }
+    if "parts" in part:
+        payload["body"] = {"size": 0}
+        payload["parts"] = [
+            _payload(child, f"{part_id}.{k}" if part_id else str(k)) for k, child in enumerate(part["parts"])
+        ]
+    elif "text" in part:
+        data = part["text"].encode(charset)
+        payload["body"] = {"size": len(data), "data": base64.urlsafe_b64encode(data).decode("ascii")}
+    else:
+        # Attachments without content, fetched with the attachmentId by real clients
+        payload["body"] = {"size": part.get("size", 0), "attachmentId": f"attachment-{part_id}"}
+    return payload
+
+
+def _drop_an_item(response):
+    """Returns the response with one invoice item missing, if it has items."""
+    text = response["candidates"][0]["content"]["parts"][0]["text"]
+    try:
+        answer = json.loads(text)
+    except ValueError:
+        return response
+    if not isinstance(answer, dict) or not answer.get("items"):
+        return response
+    answer["items"].pop(random.randrange(len(answer["items"])))
+    response = json.loads(json.dumps(response))
+    response["candidates"][0]["content"]["parts"][0]["text"] = json.dumps(answer)
+    return response
+
+
+def _metadata_only(message, headers=None):
+    """The message as format=metadata returns it: no body, only the chosen headers."""
+    wanted = {header.lower() for header in headers} if headers else None
+    payload = {
+        "mimeType": message["payload"]["mimeType"],
+        "headers": [
+            header for header in message["payload"]["headers"]
+            if wanted is None or header["name"].lower() in wanted
+        ],
+    }
+    return {**{key: value for key, value in message.items() if key != "payload"}, "payload": payload}
+
+
+def _select_fields(resource, fields):
+    """Applies a fields mask like "id,snippet,payload/headers" (no parentheses)."""
+    selected = {}
+    for path in fields.split(","):
+        source, target = resource, selected
+        *parents, leaf = path.strip().split("/")
+        for name in parents:
+            if not isinstance(source.get(name), dict):
+                break
+            source = source[name]
+            target = target.setdefault(name, {})
+        else:
+            if leaf in source:
+                target[leaf] = source[leaf]
+    return selected
+
+
+def _not_found(message):
+    return {"error": {"code": 404, "message": message, "status": "NOT_FOUND"}}
+
+
+def _cached_content_resource(name, model, tokens, created_at, expires_at):
+    def timestamp(seconds):
+        return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+
+    resource = {"name": name, "expireTime": timestamp(expires_at), "usageMetadata": {"totalTokenCount": tokens}}
+    if model:
+        resource["model"] = model
+    if created_at:
+        resource["createTime"] = resource["updateTime"] = timestamp(created_at)
+    return resource
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+class StubState:
+    def __init__(
+        self,
+        latency="constant:0.5",
+        api_latency="constant:0.05",
+        chunk_delay=0.05,
+        error_rate=0.0,
+        error_codes=(429, 503),
+        events=300,
+        calendars=1,
+        messages=200,
+        mailbox=None,
+        recordings_path=RECORDINGS_PATH,
+        model_latency=None,
+        defect_rate=0.0,
+        defect_models=("gemini-2.0-flash-lite",),
+        prefill_per_1k_tokens=0.0,
+        min_cache_tokens=4096,
+    ):
+        self.latency = parse_latency(latency)
+        self.model_latency = {
+            model: parse_latency(spec) for model, spec in (model_latency or {}).items()
+        }
+        self.defect_rate = defect_rate
+        self.defect_models = defect_models
+        # Extra seconds per 1000 prompt tokens, for prompts that take longer to read
+        self.prefill_per_1k_tokens = prefill_per_1k_tokens
+        self.api_latency = parse_latency(api_latency)
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        with open(recordings_path, encoding="utf-8") as f:
+            self.recordings = json.load(f)
+        self.events = _synthetic_events(events)
+        # The primary calendar and calendars-1 shared ones with as many events
+        self.calendars = {"primary": self.events}
+        for k in range(1, calendars):
+            calendar_id = f"shared{k:02d}@group.calendar.google.com"
+            self.calendars[calendar_id] = _synthetic_events(events, seed=k, prefix=f"shared{k:02d}-")
+        # Calendars whose events.list answers 403, like a shared calendar the user lost access to
+        self.forbidden_calendars = set()
+        # Calendar changes for sync tokens: (version, event), oldest first.
+        # Tokens older than sync_floor get a 410, like expired ones
+        self.calendar_version = 1
+        self.sync_floor = self.calendar_version
+        self.event_changes = []
+        self.added_events = 0
+        self.messages = _mailbox_messages(mailbox) if mailbox else _synthetic_messages(messages)
+        self.messages_by_id = {message["id"]: message for message in self.messages}
+        # Mailbox changes for users.history.list, oldest first. Requests that
+        # start before history_floor get a 404, like after Gmail dropped the history
+        self.history_id = 1000
+        self.history_floor = self.history_id
+        self.history = []
+        self.delivered = 0
+        self.lock = threading.Lock()
+        self.request_counts = {}
+        self.bytes_sent = 0  # JSON and batch response bodies
+        self.uploads = {}  # upload id -> file metadata
+        # Cached contents: name -> (estimated tokens, expiry as time.time()).
+        # Smaller contents are refused with a 400, like by the real API
+        self.cached_contents = {}
+        self.min_cache_tokens = min_cache_tokens
+
+    def count(self, route):
+        with self.lock:
+            self.request_counts[route] = self.request_counts.get(route, 0) + 1
+
+    def sent(self, size):
+        with self.lock:
+            self.bytes_sent += size
+
+    def add_event(self, start, minutes=30, summary="New meeting"):
+        """Adds an event starting at the datetime start, returns its id."""
+        with self.lock:
+            self.added_events += 1
+            end = start + datetime.timedelta(minutes=minutes)
+            event = {
+                "kind": "calendar#event",
+                "id": f"added{self.added_events:05d}",
+                "status": "confirmed",
+                "summary": summary,
+                "start": {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%SZ")},
+                "end": {"dateTime": end.strftime("%Y-%m-%dT%H:%M:%SZ")},
+            }
+            self.events.append(event)
+            self._changed_event(event)
+            return event["id"]
+
+    def move_event(self, event_id, minutes):
+        """Moves an event by minutes."""
+        with self.lock:
+            event = next(event for event in self.events if event["id"] == event_id)
+            for when in ("start", "end"):
+                value = datetime.datetime.strptime(event[when]["dateTime"], "%Y-%m-%dT%H:%M:%SZ")
+                value += datetime.timedelta(minutes=minutes)
+                event[when] = {"dateTime": value.strftime("%Y-%m-%dT%H:%M:%SZ")}
+            self._changed_event(event)
+
+    def cancel_event(self, event_id):
+        with self.lock:
+            event = next(event for event in self.events if event["id"] == event_id)
+            self.events.remove(event)
+            self._changed_event({"kind": "calendar#event", "id": event_id, "status": "cancelled"})
+
+    def expire_sync_tokens(self):
+        """Makes every sync token handed out so far invalid."""
+        with self.lock:
+            self.calendar_version += 1
+            self.sync_floor = self.calendar_version
+
+    def _changed_event(self, event):
+        """Records a change for incremental syncs, keeps the events sorted. Needs the lock."""
+        self.events.sort(key=lambda event: (event["start"]["dateTime"], event["id"]))
+        self.calendar_version += 1
+        self.event_changes.append((self.calendar_version, json.loads(json.dumps(event))))
+
+    def deliver(self, count=1):
+        """Adds count new messages to the top of the inbox, returns their ids."""
+        with self.lock:
+            new_messages = _synthetic_messages(count, seed=self.delivered)
+            for message in new_messages:
+                self.delivered += 1
+                message["id"] = f"new{self.delivered:05d}"
+                # Strictly newer than the top of the inbox, messages.list sorts by date
+                newest = int(self.messages[0]["internalDate"]) if self.messages else 0
+                message["internalDate"] = str(max(int(time.time() * 1000), newest + 1))
+                self.messages.insert(0, message)
+                self.messages_by_id[message["id"]] = message
+                self._record("messagesAdded", message)
+            return [message["id"] for message in new_messages]
+
+    def delete(self, message_ids):
+        """Deletes messages for good, like users.messages.delete."""
+        with self.lock:
+            for message_id in message_ids:
+                message = self.messages_by_id.pop(message_id)
+                self.messages.remove(message)
+                self._record("messagesDeleted", message)
+
+    def relabel(self, message_ids, add=(), remove=()):
+        """Changes the labels of messages, e.g. add=("TRASH",) moves them to the trash."""
+        with self.lock:
+            for message_id in message_ids:
+                message = self.messages_by_id[message_id]
+                if add:
+                    message["labelIds"] = message["labelIds"] + [
+                        label for label in add if label not in message["labelIds"]
+                    ]
+                    self._record("labelsAdded", message, list(add))
+                if remove:
+                    message["labelIds"] = [label for label in message["labelIds"] if label not in remove]
+                    self._record("labelsRemoved", message, list(remove))
+
+    def expire_history(self):
+        """Forgets the history, every incremental sync has to start over."""
+        with self.lock:
+            self.history.clear()
+            self.history_floor = self.history_id
+
+    def expire_cached_contents(self):
+        """Lets every cached content expire now."""
+        with self.lock:
+            self.cached_contents.clear()
+
+    def cached_content(self, name):
+        """Returns (tokens, expires_at) of a live cached content, or None."""
+        with self.lock:
+            entry = self.cached_contents.get(name)
+            if entry is not None and entry[1] <= time.time():
+                del self.cached_contents[name]
+                entry = None
+            return entry
+
+    def _record(self, change, message, label_ids=None):
+        """Appends a history record. Needs the lock."""
+        self.history_id += 1
+        summary = {key: message[key] for key in ("id", "threadId", "labelIds")}
+        entry = {"message": summary}
+        if label_ids is not None:
+            entry["labelIds"] = label_ids
+        self.history.append({"id": str(self.history_id), "messages": [summary], change: [entry]})
+
+    def latency_for(self, model: str) -> float:
+        return self.model_latency.get(model, self.latency)()
+
+    def recording_for(self, body: str):
+        for recording in self.recordings:
+            if recording["match"] in body:
+                return recording
+        return self.recordings[-1]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoints
+    # Headers and body go out in separate writes, without this a reused
+    # connection waits for the client's delayed ACK on every response
+    disable_nagle_algorithm = True
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.state.sent(len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self):
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            code = random.choice(self.state.error_codes)
+            self._send_json(
+                {"error": {"code": code, "message": "Injected failure", "status": "UNAVAILABLE"}},
+                status=code,
+            )
+            return True
+        return False
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if re.fullmatch(r"/upload/[^/]+/files", url.path):
+            self._upload(url)
+            return
+        if re.fullmatch(r"/batch(/.*)?", url.path):
+            self._batch()
+            return
+        if re.fullmatch(r"/[^/]+/cachedContents", url.path):
+            self._create_cached_content()
+            return
+
+        body = self._read_body().decode("utf-8", errors="replace")
+        if url.path == "/token":
+            # OAuth token endpoint, every refresh gets a new access token
+            self.state.count("oauth.token")
+            time.sleep(self.state.api_latency())
+            self._send_json({
+                "access_token": f"stub-token-{time.monotonic_ns()}",
+                "expires_in": 3600,
+                "token_type": "Bearer",
+            })
+            return
+        match = re.fullmatch(r"/[^/]+/models/([^:]+):(generateContent|streamGenerateContent)", url.path)
+        if not match:
+            self._send_json({"error": {"code": 404, "message": f"No route for {url.path}"}}, 404)
+            return
+
+        model = match.group(1)
+        self.state.count(match.group(2))
+        self.state.count(f"{match.group(2)}:{model}")
+        time.sleep(self.state.latency_for(model))
+        if self.state.prefill_per_1k_tokens:
+            prompt_tokens = len(body) // 4  # about 4 characters per token
+            time.sleep(self.state.prefill_per_1k_tokens * prompt_tokens / 1000)
+        if self._maybe_fail():
+            return
+        cached_name = json.loads(body or "{}").get("cachedContent")
+        cached = cached_name and self.state.cached_content(cached_name)
+        if cached_name and not cached:
+            self._send_json(_not_found(f"CachedContent {cached_name} not found"), 404)
+            return
+
+        response = self.state.recording_for(body)["response"]
+        if self.state.prefill_per_1k_tokens:
+            usage = {**response.get("usageMetadata", {}), "promptTokenCount": prompt_tokens}
+            response = {**response, "usageMetadata": usage}
+        if cached:
+            usage = {**response.get("usageMetadata", {}), "cachedContentTokenCount": cached[0]}
+            response = {**response, "usageMetadata": usage}
+        if model in self.state.defect_models and random.random() < self.state.defect_rate:
+            response = _drop_an_item(response)
+        if match.group(2) == "generateContent":
+            self._send_json(response)
+        else:
+            self._stream(response)
+
+    def _create_cached_content(self):
+        self.state.count("caches.create")
+        request = json.loads(self._read_body() or b"{}")
+        time.sleep(self.state.api_latency())
+        if self._maybe_fail():
+            return
+        tokens = len(json.dumps(request.get("contents", []))) // 4  # about 4 characters per token
+        if tokens < self.state.min_cache_tokens:
+            self._send_json({"error": {
+                "code": 400,
+                "message": f"Cached content is too small, {tokens} tokens < {self.state.min_cache_tokens}",
+                "status": "INVALID_ARGUMENT",
+            }}, 400)
+            return
+        ttl = float(request.get("ttl", "3600s").rstrip("s"))
+        now = time.time()
+        with self.state.lock:
+            name = f"cachedContents/stub{self.state.request_counts['caches.create']}"
+            self.state.cached_contents[name] = (tokens, now + ttl)
+        self._send_json(_cached_content_resource(name, request.get("model"), tokens, now, now + ttl))
+
+    def _upload(self, url):
+        """Resumable upload: a "start" request, then chunks sent to the returned URL."""
+        query = dict(urllib.parse.parse_qsl(url.query))
+        command = self.headers.get("X-Goog-Upload-Command", "")
+        if "upload_id" not in query:
+            self.state.count("files.upload.start")
+            metadata = json.loads(self._read_body() or b"{}").get("file", {})
+            with self.state.lock:
+                upload_id = str(len(self.state.uploads))
+                self.state.uploads[upload_id] = {"metadata": metadata, "received": 0}
+            self.send_response(200)
+            self.send_header(
+                "X-Goog-Upload-URL",
+                f"http://{self.headers['Host']}{url.path}?upload_id={upload_id}",
+            )
+            self.send_header("X-Goog-Upload-Status", "active")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.state.count("files.upload.chunk")
+        upload = self.state.uploads[query["upload_id"]]
+        remaining = int(self.headers.get("Content-Length") or 0)
+        while remaining:
+            # Read and drop the chunk piece by piece, the stub never holds a whole upload
+            data = self.rfile.read(min(remaining, 1024 * 1024))
+            if not data:
+                break
+            remaining -= len(data)
+            upload["received"] += len(data)
+
+        if "finalize" not in command:
+            self.send_response(200)
+            self.send_header("X-Goog-Upload-Status", "active")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        name = f"files/upload{query['upload_id']}"
+        metadata = upload["metadata"]
+        body = json.dumps({"file": {
+            "name": name,
+            "displayName": metadata.get("displayName", metadata.get("display_name")),
+            "mimeType": metadata.get("mimeType", metadata.get("mime_type")),
+            "sizeBytes": str(upload["received"]),
+            "createTime": now.isoformat(),
+            "expirationTime": (now + datetime.timedelta(hours=48)).isoformat(),
+            "uri": f"http://{self.headers['Host']}/v1beta/{name}",
+            "state": "ACTIVE",
+        }}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("X-Goog-Upload-Status", "final")
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_DELETE(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if re.fullmatch(r"/[^/]+/files/[^/]+", path):
+            self.state.count("files.delete")
+            self._send_json({})
+            return
+        match = re.fullmatch(r"/[^/]+/(cachedContents/[^/]+)", path)
+        if match:
+            self.state.count("caches.delete")
+            with self.state.lock:
+                found = self.state.cached_contents.pop(match.group(1), None)
+            if found is None:
+                self._send_json(_not_found(f"CachedContent {match.group(1)} not found"), 404)
+            else:
+                self._send_json({})
+            return
+        self._send_json({"error": {"code": 404, "message": f"No route for {self.path}"}}, 404)
+
+    def _stream(self, response):
+        """Sends the recorded text in a few server-sent events."""
+        text = response["candidates"][0]["content"]["parts"][0]["text"]
+        size = max(1, len(text) // 8)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, piece in enumerate(pieces):
+            chunk = {
+                "candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}],
+                "modelVersion": response.get("modelVersion"),
+            }
+            if i == len(pieces) - 1:
+                chunk["candidates"][0]["finishReason"] = "STOP"
+                chunk["usageMetadata"] = response.get("usageMetadata")
+            self._write_chunk(f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8"))
+            if i < len(pieces) - 1:
+                time.sleep(self.state.chunk_delay)
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        time.sleep(self.state.api_latency())
+        if self._maybe_fail():
+            return
+        match = re.fullmatch(r"/[^/]+/(cachedContents/[^/]+)", url.path)
+        if match:
+            self.state.count("caches.get")
+            cached = self.state.cached_content(match.group(1))
+            if cached is None:
+                self._send_json(_not_found(f"CachedContent {match.group(1)} not found"), 404)
+            else:
+                tokens, expires_at = cached
+                self._send_json(_cached_content_resource(match.group(1), None, tokens, None, expires_at))
+            return
+        status, payload = self._route_get(url.path, url.query)
+        self._send_json(payload, status)
+
+    def _route_get(self, path, query_string):
+        """Returns (status, payload) of a Calendar or Gmail GET request."""
+        params = urllib.parse.parse_qs(query_string)
+        query = {name: values[-1] for name, values in params.items()}
+        match = re.fullmatch(r"/calendar/v3/calendars/([^/]+)/events", path)
+        if match:
+            self.state.count("calendar.events.list")
+            calendar_id = urllib.parse.unquote(match.group(1))
+            if calendar_id in self.state.forbidden_calendars:
+                return 403, {"error": {
+                    "code": 403, "message": "Forbidden", "errors": [{"reason": "forbidden"}],
+                }}
+            return self._list_events(
+                "primary" if calendar_id == PRIMARY_CALENDAR else calendar_id, query
+            )
+        if path == "/calendar/v3/users/me/calendarList":
+            self.state.count("calendar.calendarList.list")
+            return 200, self._list_calendars(query)
+        if path == "/gmail/v1/users/me/messages":
+            self.state.count("gmail.messages.list")
+            return 200, self._list_messages(query)
+        if path == "/gmail/v1/users/me/profile":
+            self.state.count("gmail.getProfile")
+            return 200, {
+                "emailAddress": "me@example.com",
+                "messagesTotal": len(self.state.messages),
+                "historyId": str(self.state.history_id),
+            }
+        if path == "/gmail/v1/users/me/history":
+            self.state.count("gmail.history.list")
+            return self._list_history(query, params.get("historyTypes"))
+        match = re.fullmatch(r"/gmail/v1/users/me/threads/([^/]+)", path)
+        if match:
+            self.state.count("gmail.threads.get")
+            messages = sorted(
+                (message for message in self.state.messages if message["threadId"] == match.group(1)),
+                key=lambda message: int(message["internalDate"]),
+            )
+            if not messages:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            thread = {"id": match.group(1), "historyId": str(self.state.history_id), "messages": messages}
+            if query.get("fields"):
+                thread = _select_fields(thread, query["fields"])
+            return 200, thread
+        match = re.fullmatch(r"/gmail/v1/users/me/messages/([^/]+)", path)
+        if match:
+            self.state.count("gmail.messages.get")
+            message = self.state.messages_by_id.get(match.group(1))
+            if message is None:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            if query.get("format") == "metadata":
+                message = _metadata_only(message, params.get("metadataHeaders"))
+            if query.get("fields"):
+                message = _select_fields(message, query["fields"])
+            return 200, message
+        return 404, {"error": {"code": 404, "message": f"No route for {path}"}}
+
+    def _batch(self):
+        """Batch requests: a multipart/mixed body with one application/http part per request.
+
+        The whole batch costs one latency draw, failures are injected per part.
+        """
+        self.state.count("batch")
+        content_type = self.headers.get("Content-Type", "")
+        boundary = re.search(r'boundary="?([^";]+)"?', content_type)
+        if not boundary:
+            self._send_json({"error": {"code": 400, "message": "Not a multipart request"}}, 400)
+            return
+        body = self._read_body().decode("utf-8").replace("\r\n", "\n")
+        parts = [
+            part for part in body.split(f"--{boundary.group(1)}")
+            if part.strip() and part.strip() != "--"
+        ]
+        if len(parts) > MAX_BATCH_SIZE:
+            message = f"Too many requests in a batch, the limit is {MAX_BATCH_SIZE}"
+            self._send_json({"error": {"code": 400, "message": message}}, 400)
+            return
+        time.sleep(self.state.api_latency())
+
+        response_boundary = f"batch_{random.getrandbits(64):x}"
+        responses = []
+        for part in parts:
+            part_headers, _, request = part.strip().partition("\n\n")
+            content_id = re.search(r"(?im)^content-id:\s*<?([^>\r\n]+)>?", part_headers)
+            method, target, _ = request.strip().split(" ", 2)
+            url = urllib.parse.urlsplit(target)
+            if self.state.error_rate and random.random() < self.state.error_rate:
+                status = random.choice(self.state.error_codes)
+                payload = {"error": {"code": status, "message": "Injected failure"}}
+            elif method != "GET":
+                status, payload = 405, {"error": {"code": 405, "message": "Only GET in batches"}}
+            else:
+                status, payload = self._route_get(url.path, url.query)
+            responses.append(
+                f"--{response_boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id.group(1) if content_id else ''}>\r\n\r\n"
+                f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        data = ("".join(responses) + f"--{response_boundary}--\r\n").encode("utf-8")
+        self.state.sent(len(data))
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={response_boundary}")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _list_events(self, calendar_id, query):
+        if calendar_id not in self.state.calendars:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        with self.state.lock:
+            sync_token = int(query.get("syncToken") or 0)
+            if sync_token and sync_token < self.state.sync_floor:
+                message = "Sync token is no longer valid, a full sync is required."
+                return 410, {"error": {"code": 410, "message": message}}
+            if sync_token:
+                # Only the latest version of every changed event, only the
+                # primary calendar changes
+                changed = {
+                    event["id"]: event
+                    for version, event in self.state.event_changes
+                    if version > sync_token and calendar_id == "primary"
+                }
+                events = sorted(changed.values(), key=lambda event: event["id"])
+            else:
+                events = [
+                    event for event in self.state.calendars[calendar_id]
+                    if (not query.get("timeMin") or event["end"]["dateTime"] > query["timeMin"])
+                    and (not query.get("timeMax") or event["start"]["dateTime"] < query["timeMax"])
+                ]
+            version = self.state.calendar_version
+        result = self._page(events, query, "items", default_size=250, max_size=MAX_EVENTS_PAGE)
+        result["timeZone"] = "UTC"
+        if "nextPageToken" not in result:
+            result["nextSyncToken"] = str(version)
+        return 200, result
+
+    def _list_calendars(self, query):
+        calendars = [
+            {
+                "kind": "calendar#calendarListEntry",
+                "id": PRIMARY_CALENDAR if calendar_id == "primary" else calendar_id,
+                "summary": calendar_id,
+                "accessRole": "owner" if calendar_id == "primary" else "reader",
+                **({"primary": True} if calendar_id == "primary" else {}),
+            }
+            for calendar_id in self.state.calendars
+        ]
+        return self._page(calendars, query, "items", default_size=100)
+
+    def _list_messages(self, query):
+        # Like Gmail, spam and trash only show up when asked for
+        messages = [
+            {"id": message["id"], "threadId": message["threadId"]}
+            for message in self.state.messages
+            if not {"SPAM", "TRASH"} & set(message["labelIds"])
+        ]
+        result = self._page(messages, query, "messages", default_size=100)
+        result["resultSizeEstimate"] = len(messages)
+        return result
+
+    def _list_history(self, query, history_types):
+        with self.state.lock:
+            start = int(query.get("startHistoryId") or 0)
+            if start < self.state.history_floor:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            records = [
+                record for record in self.state.history
+                if int(record["id"]) > start
+                and (not history_types or any(
+                    change in record for history_type, change in HISTORY_TYPES.items()
+                    if history_type in history_types
+                ))
+            ]
+            history_id = str(self.state.history_id)
+        result = self._page(records, query, "history", default_size=100)
+        if not result["history"]:
+            del result["history"]  # Gmail leaves out empty lists
+        result["historyId"] = history_id
+        return 200, result
+
+    def _page(self, items, query, field, default_size, max_size=None):
+        offset = int(query.get("pageToken") or 0)
+        size = int(query.get("maxResults") or default_size)
+        if max_size:
+            size = min(size, max_size)
+        result = {field: items[offset:offset + size]}
+        if offset + size < len(items):
+            result["nextPageToken"] = str(offset + size)
+        return result
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on purpose, e.g. on the losing request of a hedged call
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_stub_server(port=0, host="127.0.0.1", **state_options):
+    """Starts the stub in a background thread.
+
+    Returns:
+        The server, its base URL is f"http://{host}:{server.server_port}".
+    """
+    handler = type("Handler", (StubHandler,), {"state": StubState(**state_options)})
+    server = _StubServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.8:0.4", help="Gemini latency distribution")
+    parser.add_argument(
+        "--model-latency", action="append", default=[], metavar="MODEL=SPEC",
+        help="Latency distribution of one model, e.g. gemini-2.0-flash-lite=lognormal:0.4:0.4",
+    )
+    parser.add_argument("--defect-rate", type=float, default=0.0, help="Share of wrong flash-lite answers")
+    parser.add_argument("--api-latency", default="constant:0.05", help="Calendar/Gmail latency distribution")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="Seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--events", type=int, default=300, help="Events per calendar")
+    parser.add_argument("--calendars", type=int, default=1, help="The primary and shared calendars")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--mailbox", help=f"Serve the messages of a mailbox file, e.g. {MAILBOX_PATH}")
+    parser.add_argument(
+        "--prefill-per-1k-tokens", type=float, default=0.0, help="Extra Gemini seconds per 1000 prompt tokens"
+    )
+    args = parser.parse_args()
+
+    server = start_stub_server(
+        port=args.port,
+        latency=args.latency,
+        model_latency=dict(spec.split("=", 1) for spec in args.model_latency),
+        defect_rate=args.defect_rate,
+        api_latency=args.api_latency,
+        chunk_delay=args.chunk_delay,
+        error_rate=args.error_rate,
+        events=args.events,
+        calendars=args.calendars,
+        messages=args.messages,
+        mailbox=args.mailbox,
+        prefill_per_1k_tokens=args.prefill_per_1k_tokens,
+    )
+    print(f"Stub listening on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compares the tail latency of analyze_pdf with and without the request executor.
+
+Runs the same load against the stub with a heavy-tailed latency distribution
+and injected 429/503 errors, once per executor configuration:
+
+    none       a single attempt, errors reach the caller
+    retries    jittered exponential backoff
+    hedged     retries, plus a duplicate request after the observed p95
+
+    python tail_latency.py --requests 300 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from run_benchmark import PDF_PATH, _percentile, configure_gemini
+from stub_server import start_stub_server
+
+
+CONFIGURATIONS = {
+    "none": {"max_attempts": 1},
+    "retries": {"base_delay": 0.1},
+    "hedged": {"base_delay": 0.1, "hedge": True},
+}
+
+
+async def run(gemini_service, pdf_bytes, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await gemini_service.analyze_pdf_async(pdf_bytes)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", default="lognormal:0.3:1.0")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_stub_server(latency=args.latency, error_rate=args.error_rate)
+    gemini_service = configure_gemini(f"http://127.0.0.1:{server.server_port}")
+    with open(PDF_PATH, "rb") as f:
+        pdf_bytes = f.read()
+
+    from request_executor import RequestExecutor
+
+    async def run_all():
+        # One event loop for all runs, the async client's connections are bound to it
+        print(f"{'executor':<10}{'success':>9}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'max s':>8}")
+        for name, options in CONFIGURATIONS.items():
+            random.seed(args.seed)
+            gemini_service.executor = RequestExecutor(**options)
+            latencies, errors = await run(gemini_service, pdf_bytes, args.requests, args.concurrency)
+            print(
+                f"{name:<10}{1 - errors / args.requests:>9.1%}{_percentile(latencies, 50):>8.2f}"
+                f"{_percentile(latencies, 95):>8.2f}{_percentile(latencies, 99):>8.2f}"
+                f"{max(latencies, default=0):>8.2f}"
+            )
+
+    asyncio.run(run_all())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Tests of the Files API and context cache handles, against the local stub.
+
+    cd benchmarks && python -m unittest test_context_cache
+"""
+import datetime
+import time
+import unittest
+
+import run_benchmark  # puts food-assistant on the path
+from stub_server import start_stub_server
+
+from genai_handles import HandleRegistry
+
+
+class HandleRegistryTest(unittest.TestCase):
+    def test_returns_handles_until_shortly_before_they_expire(self):
+        registry = HandleRegistry(safety_margin=60)
+        registry.put("fresh", "a", time.time() + 3600)
+        registry.put("expiring", "b", time.time() + 30)
+        registry.put("forever", "c", None)
+        registry.put("datetime", "d", datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1))
+
+        self.assertEqual(registry.get("fresh"), "a")
+        self.assertIsNone(registry.get("expiring"))
+        self.assertEqual(registry.get("forever"), "c")
+        self.assertEqual(registry.get("datetime"), "d")
+        self.assertIsNone(registry.get("missing"))
+        self.assertEqual(len(registry), 3)
+
+    def test_evicts_the_least_recently_used_handle(self):
+        evicted = []
+        registry = HandleRegistry(max_entries=2, on_evict=evicted.append)
+        registry.put("a", "handle a", None)
+        registry.put("b", "handle b", None)
+        registry.get("a")
+        registry.put("c", "handle c", None)
+
+        self.assertEqual(evicted, ["handle b"])
+        self.assertEqual(registry.get("a"), "handle a")
+        self.assertEqual(registry.get("c"), "handle c")
+
+    def test_expired_handles_are_not_evicted(self):
+        evicted = []
+        registry = HandleRegistry(on_evict=evicted.append)
+        registry.put("a", "handle a", time.time() - 1)
+        registry.get("a")
+        registry.clear()
+        self.assertEqual(evicted, [])
+
+    def test_a_failing_eviction_is_ignored(self):
+        def fail(handle):
+            raise RuntimeError("server unreachable")
+
+        registry = HandleRegistry(max_entries=1, on_evict=fail)
+        registry.put("a", "handle a", None)
+        registry.put("b", "handle b", None)
+        registry.clear()
+        self.assertEqual(len(registry), 0)
+
+
+def _invoice(items):
+    return {
+        "date": "2026-10-14",
+        "total_cost": round(1.99 * items, 2),
+        "items": [{"item_name": f"PRODUCT NUMBER {i:04d}", "item_cost": 1.99} for i in range(items)],
+    }
+
+
+class ContextCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server(latency="constant:0", api_latency="constant:0", chunk_delay=0)
+        cls.state = cls.server.RequestHandlerClass.state
+        cls.gemini_service = run_benchmark.configure_gemini(f"http://127.0.0.1:{cls.server.server_port}")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        service = self.gemini_service
+        flags = ("USE_CONTEXT_CACHE", "USE_HEALTH_INDEX", "USE_MODEL_TIERS", "CONTEXT_CACHE_TTL")
+        saved = {flag: getattr(service, flag) for flag in flags}
+        saved_registry = (service.cached_contexts.max_entries, service.cached_contexts.safety_margin)
+
+        def restore():
+            for flag, value in saved.items():
+                setattr(service, flag, value)
+            service.cached_contexts.max_entries, service.cached_contexts.safety_margin = saved_registry
+
+        self.addCleanup(restore)
+        service.USE_HEALTH_INDEX = False
+        service.USE_MODEL_TIERS = False
+        service.cached_contexts.clear()
+        service._uncacheable.clear()
+        self.state.expire_cached_contents()
+        with self.state.lock:
+            self.state.request_counts.clear()
+
+    def count(self, route):
+        return self.state.request_counts.get(route, 0)
+
+    def test_creates_a_cached_context_once_per_key(self):
+        contents = [str(_invoice(400))]
+        first = self.gemini_service.get_cached_context("key", contents)
+        second = self.gemini_service.get_cached_context("key", contents)
+
+        self.assertIsNotNone(first)
+        self.assertEqual(first.name, second.name)
+        self.assertEqual(self.count("caches.create"), 1)
+        self.assertIsNotNone(self.state.cached_content(first.name))
+
+    def test_small_contents_are_refused_once_and_sent_inline(self):
+        self.assertIsNone(self.gemini_service.get_cached_context("small", ["tiny"]))
+        self.assertIsNone(self.gemini_service.get_cached_context("small", ["tiny"]))
+        self.assertEqual(self.count("caches.create"), 1)
+
+    def test_evicted_contexts_are_deleted_on_the_server(self):
+        self.gemini_service.cached_contexts.max_entries = 1
+        first = self.gemini_service.get_cached_context("first", [str(_invoice(400))])
+        second = self.gemini_service.get_cached_context("second", [str(_invoice(401))])
+
+        self.assertEqual(self.count("caches.delete"), 1)
+        self.assertIsNone(self.state.cached_content(first.name))
+        self.assertIsNotNone(self.state.cached_content(second.name))
+
+    def test_a_context_about_to_expire_is_created_again(self):
+        self.gemini_service.CONTEXT_CACHE_TTL = 30
+        contents = [str(_invoice(400))]
+        first = self.gemini_service.get_cached_context("key", contents)
+        second = self.gemini_service.get_cached_context("key", contents)
+
+        self.assertNotEqual(first.name, second.name)
+        self.assertEqual(self.count("caches.create"), 2)
+
+    def test_follow_up_questions_share_the_cached_invoice(self):
+        service = self.gemini_service
+        service.USE_CONTEXT_CACHE = True
+        invoice = _invoice(400)
+        cached_before = service.metrics.TOKENS.values[("suggest_recipes", service.MODEL, "cached")]
+
+        self.assertTrue(service.analyze_unhealthy_items(invoice))
+        self.assertTrue(service.suggest_recipes(invoice))
+
+        self.assertEqual(self.count("caches.create"), 1)
+        self.assertEqual(self.count("generateContent"), 2)
+        cached_tokens = service.metrics.TOKENS.values[("suggest_recipes", service.MODEL, "cached")] - cached_before
+        self.assertGreaterEqual(cached_tokens, service.MIN_CONTEXT_CACHE_TOKENS)
+
+    def test_small_invoices_are_sent_inline(self):
+        self.gemini_service.USE_CONTEXT_CACHE = True
+        self.assertTrue(self.gemini_service.analyze_unhealthy_items(_invoice(3)))
+        self.assertEqual(self.count("caches.create"), 0)
+        self.assertEqual(self.count("generateContent"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
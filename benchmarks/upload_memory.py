@@ -0,0 +1,138 @@
+"""Measures the peak memory of sending large documents to Gemini.
+
+For every size a file is created and sent to the stub server (started in a
+separate process, so its buffers don't count) from a fresh interpreter:
+
+    inline     the old path: read the file and send it with Part.from_bytes
+    streaming  analyze_pdf(open(path, "rb")), which streams the file into the
+               Files API in chunks above STREAMING_UPLOAD_THRESHOLD
+
+The reported number is the peak RSS during the call minus the RSS before it.
+Files below the threshold are sent inline on both paths. Linux only (reads
+/proc), and the inline mode needs several times the largest size in RAM.
+
+    python upload_memory.py --sizes 10,100,1000 --modes streaming,inline
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, logging, resource, sys
+logging.disable(logging.WARNING)  # pypdf complains about the fake PDFs
+import gemini_service
+from genai_client import get_client
+from google.genai import types
+
+gemini_service.cache.enabled = False
+path, mode = sys.argv[1], sys.argv[2]
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+# Load everything and open the connection first, so only the upload counts
+gemini_service.analyze_pdf(b"%PDF-1.4 warm up")
+before = rss()
+if mode == "inline":
+    with open(path, "rb") as f:
+        data = f.read()
+    get_client().models.generate_content(
+        model=gemini_service.MODEL,
+        contents=[gemini_service.EXTRACT_PROMPT, types.Part.from_bytes(data=data, mime_type="application/pdf")],
+        config=gemini_service.PDF_CONFIG,
+    )
+else:
+    with open(path, "rb") as f:
+        gemini_service.analyze_pdf(f)
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+print(json.dumps({"before": before, "peak": peak}))
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(*options):
+    """Starts the stub in a separate process, returns (process, base URL)."""
+    port = _free_port()
+    stub = subprocess.Popen(
+        [sys.executable, "stub_server.py", "--port", str(port), "--latency", "constant:0", *options],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return stub, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    stub.kill()
+    raise RuntimeError("The stub server didn't start")
+
+
+def measure(path, mode, base_url):
+    env = dict(
+        os.environ,
+        GOOGLE_API_KEY="stub",
+        GEMINI_BASE_URL=base_url,
+        GEMINI_CACHE_DISABLED="1",
+        GEMINI_TIMEOUT="600",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, path, mode],
+        cwd=os.path.join(ROOT, "food-assistant"),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return max(0, probe["peak"] - probe["before"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated sizes in MB")
+    parser.add_argument("--modes", default="streaming,inline")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub()
+    print(f"{'size':>8}{'mode':>12}{'peak RSS':>12}{'x size':>8}")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for size_mb in (int(size) for size in args.sizes.split(",")):
+                path = os.path.join(directory, f"{size_mb}mb.pdf")
+                with open(path, "wb") as f:
+                    f.truncate(size_mb * 1024 * 1024)  # sparse, costs no disk space
+                for mode in args.modes.split(","):
+                    try:
+                        peak = measure(path, mode, base_url)
+                    except subprocess.CalledProcessError as e:
+                        if e.returncode < 0:
+                            error = f"killed by signal {-e.returncode} (out of memory?)"
+                        else:
+                            error = (e.stderr.strip().splitlines() or ["unknown error"])[-1]
+                        print(f"{size_mb:>6}MB{mode:>12}  failed: {error}")
+                        continue
+                    print(
+                        f"{size_mb:>6}MB{mode:>12}{peak / 2**20:>10.0f}MB"
+                        f"{peak / (size_mb * 2**20):>8.2f}"
+                    )
+                os.remove(path)
+    finally:
+        stub.kill()
+
+
+if __name__ == "__main__":
+    main()
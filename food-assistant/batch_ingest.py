@@ -0,0 +1,282 @@
+"""Headless bulk extraction of supermarket invoices.
+
+Walks a directory (or reads a manifest with one PDF path per line), extracts
+every invoice with the SupermarketInvoice schema through a bounded pool of
+async workers and streams the results to JSONL or Parquet as they finish.
+
+    python batch_ingest.py invoices/ --output invoices.jsonl --concurrency 8 --rpm 120
+    python batch_ingest.py manifest.txt --output invoices.parquet
+    python batch_ingest.py invoices/ --store   # also feed the Spending page
+
+Successfully processed files are appended to a checkpoint file next to the
+output, so an interrupted run can be restarted and only does the missing work.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import gemini_service
+from gemini_service import STREAMING_UPLOAD_THRESHOLD, analyze_pdf_async, document_sha256
+from metrics import percentile
+from request_executor import RateLimiter, rate_limit_waits
+
+
+def find_pdfs(source: str) -> list[str]:
+    """Returns the PDF paths in a directory (recursively) or listed in a manifest."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(
+                os.path.join(root, name) for name in files if name.lower().endswith(".pdf")
+            )
+        return sorted(paths)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [
+        line if os.path.isabs(line) else os.path.join(base_dir, line)
+        for line in lines
+        if line and not line.startswith("#")
+    ]
+
+
+class JsonlWriter:
+    """Appends one JSON record per line.
+
+    write() and close() return the sources that are now durably written, which
+    is when they may be added to the checkpoint.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        return [record["source"]]
+
+    def close(self):
+        self._file.close()
+        return []
+
+
+class ParquetWriter:
+    """Buffers records and writes them out as Parquet row groups.
+
+    Parquet files can't be appended to, so a resumed run writes its rows to
+    the next free `<name>.<n>.parquet` file next to the original output.
+    """
+
+    def __init__(self, path: str, row_group_size: int = 100):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        stem, ext = os.path.splitext(path)
+        n = 0
+        while os.path.exists(path):
+            n += 1
+            path = f"{stem}.{n}{ext}"
+
+        self._pa = pa
+        self._pq = pq
+        self._path = path
+        self._schema = pa.schema([
+            ("source", pa.string()),
+            ("sha256", pa.string()),
+            ("date", pa.string()),
+            ("total_cost", pa.float64()),
+            ("items", pa.list_(pa.struct([
+                ("item_name", pa.string()),
+                ("item_cost", pa.float64()),
+            ]))),
+        ])
+        self._writer = None  # opened on the first flush, so empty runs leave no file
+        self._buffer = []
+        self._row_group_size = row_group_size
+
+    def write(self, record: dict):
+        invoice = record["invoice"]
+        self._buffer.append({
+            "source": record["source"],
+            "sha256": record["sha256"],
+            "date": invoice["date"],
+            "total_cost": invoice["total_cost"],
+            "items": invoice["items"],
+        })
+        if len(self._buffer) >= self._row_group_size:
+            return self._flush()
+        return []
+
+    def _flush(self):
+        if not self._buffer:
+            return []
+        table = self._pa.Table.from_pylist(self._buffer, schema=self._schema)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._path, self._schema)
+        self._writer.write_table(table)
+        written = [row["source"] for row in self._buffer]
+        self._buffer = []
+        return written
+
+    def close(self):
+        written = self._flush()
+        if self._writer is not None:
+            self._writer.close()
+        return written
+
+
+def _waited(waits: list[tuple[float, float]]) -> float:
+    """Seconds in which at least one of the (start, end) waits was running."""
+    total, covered_until = 0.0, float("-inf")
+    for start, end in sorted(waits):
+        start = max(start, covered_until)
+        if end > start:
+            total += end - start
+            covered_until = end
+    return total
+
+
+async def ingest(
+    paths: list[str],
+    output: str,
+    concurrency: int = 8,
+    requests_per_minute: float = 60,
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    store=None,
+) -> dict:
+    """Extracts all invoices in paths and writes them to output.
+
+    If an InvoiceStore is given, every invoice is also added to it.
+
+    Returns:
+        A dictionary with the run statistics.
+    """
+    checkpoint_path = f"{output}.checkpoint"
+    done = set()
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            done = {line.rstrip("\n") for line in f if line.strip()}
+
+    # Transient errors are retried with backoff by the executor of every model
+    # call, and every request (retries, page chunks and escalations to a
+    # stronger model included) waits for a slot of the requests-per-minute budget
+    gemini_service.executor.max_attempts = max_retries + 1
+    gemini_service.executor.base_delay = base_delay
+    gemini_service.executor.rate_limiter = RateLimiter(requests_per_minute)
+
+    pending = [path for path in paths if path not in done]
+    writer = ParquetWriter(output) if output.endswith(".parquet") else JsonlWriter(output)
+    checkpoint = open(checkpoint_path, "a")
+    queue = asyncio.Queue()
+    for path in pending:
+        queue.put_nowait(path)
+
+    latencies, failures = [], []
+
+    async def worker():
+        while True:
+            try:
+                path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            document = None
+            # The latency is the extraction's, not the wait for request slots
+            waits = []
+            rate_limit_waits.set(waits)
+            try:
+                document = await asyncio.to_thread(_open_document, path)
+                start = time.perf_counter()
+                invoice = await analyze_pdf_async(document)
+                sha256 = await asyncio.to_thread(document_sha256, document)
+            except Exception as e:
+                failures.append((path, e))
+                print(f"FAILED {path}: {e}", file=sys.stderr)
+                continue
+            finally:
+                if document is not None and not isinstance(document, bytes):
+                    document.close()
+            latencies.append(time.perf_counter() - start - _waited(waits))
+            if store is not None:
+                await asyncio.to_thread(store.add, invoice, sha256, path)
+            written = writer.write({"source": path, "sha256": sha256, "invoice": invoice})
+            _mark_done(checkpoint, written)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    finally:
+        gemini_service.executor.rate_limiter = None
+        _mark_done(checkpoint, writer.close())
+        checkpoint.close()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "total": len(paths),
+        "skipped": len(paths) - len(pending),
+        "succeeded": len(latencies),
+        "failed": len(failures),
+        "elapsed_s": elapsed,
+        "invoices_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+    }
+
+
+def _mark_done(checkpoint, paths):
+    for path in paths:
+        checkpoint.write(path + "\n")
+    checkpoint.flush()
+
+
+def _open_document(path):
+    """Reads small PDFs, large ones are returned as an open file and streamed on upload."""
+    if os.path.getsize(path) >= STREAMING_UPLOAD_THRESHOLD:
+        return open(path, "rb")
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("source", help="Directory with PDFs or a manifest file")
+    parser.add_argument("--output", default="invoices.jsonl", help=".jsonl or .parquet")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=60, help="Requests per minute, 0 = unlimited")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument(
+        "--store", action="store_true", help="Also add the invoices to the store of the Spending page"
+    )
+    args = parser.parse_args()
+
+    store = None
+    if args.store:
+        from invoice_store import get_store
+        store = get_store()
+
+    stats = asyncio.run(ingest(
+        find_pdfs(args.source),
+        args.output,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        max_retries=args.max_retries,
+        store=store,
+    ))
+
+    print(
+        f"{stats['succeeded']} succeeded, {stats['failed']} failed, "
+        f"{stats['skipped']} skipped (already done) of {stats['total']} invoices"
+    )
+    print(
+        f"{stats['invoices_per_s']:.2f} invoices/sec, "
+        f"p50 {stats['latency_p50_s']:.2f}s, p95 {stats['latency_p95_s']:.2f}s"
+    )
+    sys.exit(1 if stats["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Compares latency and token usage of the staged and fused analysis modes.
+
+    python compare_modes.py rewe_invoice.pdf --runs 3
+
+Both modes run with the configuration in PINNED, so they answer the same
+questions with the same model: every call goes to MODEL, the unhealthy
+items are asked of the model instead of the local health index, and the
+result and recipe caches are off so every run really calls Gemini. The
+staged run is the one of main.py: analyze_pdf, then the two answers
+streamed concurrently.
+"""
+import argparse
+import statistics
+import time
+
+import gemini_service
+from gemini_service import (
+    analyze_pdf,
+    analyze_pdf_fused,
+    stream_unhealthy_items_async,
+    stream_recipes_async,
+    run_coroutine,
+    usage_log,
+)
+
+# gemini_service flags of both runs, see the docstring. Only flags that are
+# read on every call: HEDGE_REQUESTS and USE_RECIPE_CACHE are read at import,
+# main() turns off the executor's hedging and the recipe cache themselves
+PINNED = {
+    "USE_MODEL_TIERS": False,
+    "USE_HEALTH_INDEX": False,
+    "USE_FILES_API": False,
+    "USE_CONTEXT_CACHE": False,
+}
+
+
+async def consume(stream):
+    async for _ in stream:
+        pass
+
+
+def run_staged(data_bytes):
+    invoice = analyze_pdf(data_bytes)
+    # Same as main.py: the two answers are streamed concurrently on the background loop
+    futures = [
+        run_coroutine(consume(stream_unhealthy_items_async(invoice))),
+        run_coroutine(consume(stream_recipes_async(invoice))),
+    ]
+    for future in futures:
+        future.result()
+
+
+def run_fused(data_bytes):
+    analyze_pdf_fused(data_bytes)
+
+
+def measure(fn, data_bytes, runs):
+    wall_times, prompt_tokens, output_tokens, calls = [], [], [], []
+    for _ in range(runs):
+        usage_log.clear()
+        start = time.perf_counter()
+        fn(data_bytes)
+        wall_times.append(time.perf_counter() - start)
+        prompt_tokens.append(sum(entry["prompt_tokens"] for entry in usage_log))
+        output_tokens.append(sum(entry["output_tokens"] for entry in usage_log))
+        calls.append(len(usage_log))
+    return {
+        "calls": statistics.mean(calls),
+        "wall_s": statistics.median(wall_times),
+        "prompt_tokens": statistics.mean(prompt_tokens),
+        "output_tokens": statistics.mean(output_tokens),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("pdf", nargs="?", default="rewe_invoice.pdf")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for name, value in PINNED.items():
+        setattr(gemini_service, name, value)
+    gemini_service.executor.hedge = False
+    gemini_service.cache.enabled = False
+    gemini_service.recipe_cache.enabled = False
+    with open(args.pdf, "rb") as f:
+        data_bytes = f.read()
+
+    print(
+        f"model {gemini_service.MODEL}, "
+        + ", ".join(f"{name}={value}" for name, value in PINNED.items())
+        + f", hedging={gemini_service.executor.hedge}, result cache={gemini_service.cache.enabled}"
+        + f", recipe cache={gemini_service.recipe_cache.enabled}"
+    )
+    print(f"{'mode':<8}{'calls':>7}{'median wall s':>15}{'prompt tok':>12}{'output tok':>12}")
+    for name, fn in (("staged", run_staged), ("fused", run_fused)):
+        result = measure(fn, data_bytes, args.runs)
+        print(
+            f"{name:<8}{result['calls']:>7.0f}{result['wall_s']:>15.2f}"
+            f"{result['prompt_tokens']:>12.0f}{result['output_tokens']:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Measures bytes saved and accuracy impact of the PDF pre-processing.
+
+Every invoice is extracted twice, once from the original PDF and once from the
+pre-processed payload. The extraction from the original PDF is the reference.
+The bytes are those of the requests analyze_pdf makes, so an invoice that is
+extracted in page chunks counts with its pre-processed chunks.
+
+    python evaluate_preprocess.py fixtures/
+    python evaluate_preprocess.py rewe_invoice.pdf other_invoice.pdf
+
+The result cache is disabled so both variants really call Gemini, and both
+only use MODEL, so an escalation to another model doesn't blur the comparison.
+"""
+import argparse
+import os
+
+import gemini_service
+
+
+def _item_set(invoice):
+    return {
+        (item["item_name"].strip().lower(), round(item["item_cost"], 2))
+        for item in invoice["items"]
+    }
+
+
+def compare(reference, candidate) -> dict:
+    expected, actual = _item_set(reference), _item_set(candidate)
+    matched = len(expected & actual)
+    precision = matched / len(actual) if actual else 1.0
+    recall = matched / len(expected) if expected else 1.0
+    return {
+        "item_f1": 2 * precision * recall / (precision + recall) if matched else 0.0,
+        "total_matches": round(reference["total_cost"], 2) == round(candidate["total_cost"], 2),
+        "date_matches": reference["date"].strip() == candidate["date"].strip(),
+    }
+
+
+def requests(data_bytes):
+    """The contents of the requests analyze_pdf sends for the PDF, one per page chunk."""
+    chunks = gemini_service._pdf_chunks(data_bytes)
+    return [contents for _, _, contents in chunks] or [gemini_service._pdf_contents(data_bytes)]
+
+
+def _kind(all_contents):
+    kinds = {"text" if isinstance(contents[1], str) else "pdf" for contents in all_contents}
+    return kinds.pop() if len(kinds) == 1 else "mixed"
+
+
+def evaluate(path):
+    with open(path, "rb") as f:
+        data_bytes = f.read()
+
+    gemini_service.PREPROCESS_PDFS = False
+    original = requests(data_bytes)
+    reference = gemini_service.analyze_pdf(data_bytes)
+    gemini_service.PREPROCESS_PDFS = True
+    preprocessed = requests(data_bytes)
+    candidate = gemini_service.analyze_pdf(data_bytes)
+
+    return {
+        "file": os.path.basename(path),
+        "kind": _kind(preprocessed),
+        "requests": len(preprocessed),
+        "bytes_in": sum(gemini_service._payload_size(contents) for contents in original),
+        "bytes_sent": sum(gemini_service._payload_size(contents) for contents in preprocessed),
+        **compare(reference, candidate),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="*", default=["rewe_invoice.pdf"])
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            paths.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(".pdf")
+            )
+        else:
+            paths.append(path)
+
+    gemini_service.cache.enabled = False
+    gemini_service.USE_MODEL_TIERS = False
+    # Inline payloads, uploads would only count with their name
+    gemini_service.USE_FILES_API = False
+    print(
+        f"{'file':<30}{'kind':>9}{'requests':>9}{'bytes in':>11}{'bytes sent':>12}"
+        f"{'item F1':>9}{'total':>7}{'date':>6}"
+    )
+    results = []
+    for path in paths:
+        result = evaluate(path)
+        results.append(result)
+        print(
+            f"{result['file']:<30}{result['kind']:>9}{result['requests']:>9}"
+            f"{result['bytes_in']:>11}{result['bytes_sent']:>12}"
+            f"{result['item_f1']:>9.2f}{'ok' if result['total_matches'] else 'DIFF':>7}"
+            f"{'ok' if result['date_matches'] else 'DIFF':>6}"
+        )
+
+    if results:
+        bytes_in = sum(result["bytes_in"] for result in results)
+        bytes_sent = sum(result["bytes_sent"] for result in results)
+        print(
+            f"\n{len(results)} invoices, {bytes_in - bytes_sent} bytes saved "
+            f"({1 - bytes_sent / bytes_in:.0%}), "
+            f"mean item F1 {sum(result['item_f1'] for result in results) / len(results):.2f}, "
+            f"{sum(result['total_matches'] for result in results)}/{len(results)} totals match"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Writes the invoice PDFs in this directory, for evaluate_preprocess.py.
+
+    single_page.pdf   one page with a text layer
+    multi_page.pdf    a header page with only the date, two pages of items,
+                      a page of ads and a last page with only the total
+    long_invoice.pdf  twelve pages of items, extracted in page chunks
+    scanned.pdf       the single page invoice as a large image, no text layer
+
+The PDFs are written by hand with the standard fonts, so only the scan needs
+pillow. Run it again after changing the invoices:
+
+    python make_fixtures.py
+"""
+import io
+import os
+import random
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+LINES_PER_PAGE = 40
+
+PRODUCTS = [
+    ("BUTTERKAESE", 1.79), ("BRIOCHE BUNS 4ER", 1.69), ("HUMMUS NATUR", 0.99), ("BIO BANANEN", 1.49),
+    ("VOLLMILCH 3,5%", 1.15), ("HAFERFLOCKEN", 0.89), ("KARTOFFEL CHIPS PAPRIKA", 1.99),
+    ("CHERRY TOMATEN", 2.29), ("EISBERGSALAT", 0.99), ("SUESSKARTOFFELN", 2.49), ("PISTAZIENCREME", 4.99),
+    ("MILCH SCHOKOLADE", 1.29), ("APFELSAFT NATURTRUEB", 1.79), ("VOLLKORNBROT", 2.19),
+    ("GOUDA JUNG", 2.39), ("PAPRIKA ROT", 0.79), ("EIER FREILAND 10ER", 3.29), ("SPAGHETTI", 0.99),
+]
+
+
+def items(count, seed):
+    rng = random.Random(seed)
+    return [rng.choice(PRODUCTS) for _ in range(count)]
+
+
+def item_lines(invoice_items):
+    return [f"{name:<32}{cost:>8.2f} B".replace(".", ",") for name, cost in invoice_items]
+
+
+def header(date):
+    return ["REWE Markt GmbH", "Domstr. 20, 50668 Koeln", "UID Nr.: DE812706034", "", f"Datum: {date}", ""]
+
+
+def footer(invoice_items):
+    total = sum(cost for _, cost in invoice_items)
+    return ["-" * 42, f"SUMME EUR {total:>30.2f}".replace(".", ","), "", "Vielen Dank fuer Ihren Einkauf!"]
+
+
+def pages_of(lines):
+    return [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+
+
+def write_pdf(path, pages, images=()):
+    """Writes text pages (lists of lines) and image pages ((JPEG bytes, width, height))."""
+    objects = []  # bodies, numbered from 1
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>")
+    pages_id = len(objects) + 1 + 2 * (len(pages) + len(images)) + len(images)
+    page_ids = []
+    for lines in pages:
+        text = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(
+            "({}) '".format(line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")) for line in lines
+        ) + " ET"
+        data = zlib.compress(text.encode("cp1252"))
+        content = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data) + data + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, PAGE_WIDTH, PAGE_HEIGHT, content, font)
+        ))
+    for jpeg, width, height in images:
+        image = add(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+            b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n" % (width, height, len(jpeg))
+            + jpeg + b"\nendstream"
+        )
+        draw = b"q %d 0 0 %d 0 0 cm /Im1 Do Q" % (PAGE_WIDTH, PAGE_HEIGHT)
+        content = add(b"<< /Length %d >>\nstream\n" % len(draw) + draw + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+            b"/Resources << /XObject << /Im1 %d 0 R >> >> >>" % (pages_id, PAGE_WIDTH, PAGE_HEIGHT, content, image)
+        ))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    assert add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))) == pages_id
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+    with open(os.path.join(HERE, path), "wb") as f:
+        f.write(out.getvalue())
+
+
+def scan(lines):
+    """The lines rendered like a scanned receipt, as a large grayscale JPEG."""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    width, height = 2480, 3508  # A4 at 300 dpi
+    image = Image.new("L", (width, height), 245)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((200, 200 + i * 60), line, fill=20, font_size=44)
+    image = image.rotate(0.7, fillcolor=245).filter(ImageFilter.GaussianBlur(0.8))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue(), width, height
+
+
+def main():
+    single = items(14, seed=1)
+    write_pdf("single_page.pdf", [header("14.10.2026 18:42") + item_lines(single) + footer(single)])
+
+    multi = items(70, seed=2)
+    item_pages = pages_of(item_lines(multi))
+    write_pdf("multi_page.pdf", [
+        header("15.10.2026 09:15") + ["Kasse 3, Bon 4711"],
+        *item_pages,
+        ["Jetzt Punkte sammeln mit der REWE App!", "", "Diese Woche im Angebot: Kaffee, Obst und Gemuese.",
+         "Mehr unter rewe.de"],
+        footer(multi),
+    ])
+
+    long = items(460, seed=3)
+    write_pdf("long_invoice.pdf", pages_of(header("16.10.2026 17:03") + item_lines(long) + footer(long)))
+
+    write_pdf("scanned.pdf", [], images=[scan(header("17.10.2026 11:20") + item_lines(single) + footer(single))])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,84 @@
-from google import genai
-from google.genai import types
+import asyncio
+import collections
+import concurrent.futures
+import gc
+import hashlib
+import io
+import logging
+import threading
+import time
+from typing import Literal
 
 from pydantic import BaseModel, Field
 
-from dotenv import load_dotenv
-load_dotenv()
-
-client = genai.Client()
+import metrics
+from genai_client import get_client
+from genai_handles import HandleRegistry
+from health_index import HealthIndex
+from pdf_preprocess import preprocess_pdf, split_pdf
+from recipe_cache import RecipeCache
+from request_executor import RequestExecutor
+from result_cache import ResultCache, canonical_json, make_key
+import validation
 
 MODEL = "gemini-2.0-flash"
+# Cheaper and faster, tried first when USE_MODEL_TIERS is on
+FAST_MODEL = "gemini-2.0-flash-lite"
+
+# Try FAST_MODEL first and only escalate to MODEL when its answer fails the
+# local checks in validation.py (items add up, the date parses, ...)
+USE_MODEL_TIERS = True
+
+# Send the text layer or a trimmed PDF instead of the original PDF when possible
+PREPROCESS_PDFS = True
+# Send a duplicate request when a call takes longer than the recent p95 of its task
+HEDGE_REQUESTS = False
+# Extract long invoices in page chunks concurrently instead of in one call
+PARALLEL_MIN_PAGES = 8
+PAGES_PER_CHUNK = 4
+MAX_PARALLEL_CHUNKS = 8
+# Files at least this large are streamed from disk into the Files API in chunks
+# instead of being read into memory (inline requests are limited to 20 MB anyway)
+STREAMING_UPLOAD_THRESHOLD = 20 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+UPLOAD_COLLECT_BYTES = 32 * 1024 * 1024
+# Upload PDFs once through the Files API and reference them instead of sending them inline
+USE_FILES_API = False
+# Put the invoice into a server-side cached context that all follow-up questions share
+USE_CONTEXT_CACHE = False
+CONTEXT_CACHE_TTL = 3600  # seconds
+# The API rejects cached contents below a model-dependent minimum size
+MIN_CONTEXT_CACHE_TOKENS = 4096
+# Classify known products locally and only ask the model about unknown ones
+USE_HEALTH_INDEX = True
+# Reuse the recipes of a similar basket instead of generating new ones
+USE_RECIPE_CACHE = True
+
+cache = ResultCache()
+# Every model call goes through the executor: retries with backoff, optional
+# hedging and a circuit breaker per model
+executor = RequestExecutor(
+    hedge=HEDGE_REQUESTS, on_retry=metrics.record_retry, on_hedge=metrics.record_hedge
+)
+health_index = HealthIndex()
+recipe_cache = RecipeCache()
+recipe_cache.enabled = USE_RECIPE_CACHE
+
+uploaded_files = HandleRegistry(
+    max_entries=100, on_evict=lambda handle: get_client().files.delete(name=handle.name)
+)
+cached_contexts = HandleRegistry(
+    max_entries=20, on_evict=lambda handle: get_client().caches.delete(name=handle.name)
+)
+# Keys of contents that the API refused to cache, so we don't ask again
+_uncacheable = set()
+
+logger = logging.getLogger(__name__)
+
+# Token usage and wall time of the most recent model calls
+usage_log = collections.deque(maxlen=1000)
+# The most recent routing decisions of tiered calls, with the failed checks
+routing_log = collections.deque(maxlen=1000)
 
 
 class SupermarketItem(BaseModel):
@@ -21,37 +91,873 @@ class SupermarketInvoice(BaseModel):
     total_cost: float = Field(description="The total cost of the invoice")
 
 
-def analyze_pdf(data_bytes):
-    response = client.models.generate_content(
-        model=MODEL,
-        contents=[
-            "Extract the structured data from the following PDF file",
-            types.Part.from_bytes(
-                data=data_bytes,
-                mime_type='application/pdf',
+class InvoicePages(BaseModel):
+    items: list[SupermarketItem] = Field(description="The list of items on these pages")
+    date: str = Field(description="The date of the invoice if it is on these pages, otherwise an empty string")
+    total_cost: float = Field(description="The total cost of the invoice if it is on these pages, otherwise 0")
+
+
+class FlaggedSupermarketItem(SupermarketItem):
+    is_unhealthy: bool = Field(description="Whether the product is unhealthy")
+    health_note: str = Field(description="A short reason why the product is or isn't unhealthy")
+
+class Recipe(BaseModel):
+    name: str = Field(description="The name of the recipe")
+    ingredients: list[str] = Field(description="The ingredients, preferably items from the invoice")
+    instructions: str = Field(description="Short cooking instructions")
+
+class FusedInvoiceAnalysis(SupermarketInvoice):
+    items: list[FlaggedSupermarketItem] = Field(description="The list of items")
+    recipes: list[Recipe] = Field(description="A few recipes based on the items")
+
+
+def _schema_hash(schema):
+    return hashlib.sha256(canonical_json(schema.model_json_schema()).encode("utf-8")).hexdigest()
+
+
+# Changing the schema changes the extraction result, so it is part of the key
+SCHEMA_HASH = _schema_hash(SupermarketInvoice)
+FUSED_SCHEMA_HASH = _schema_hash(FusedInvoiceAnalysis)
+
+
+def _payload_size(contents):
+    """Approximate request payload size in bytes.
+
+    Inline data counts with its raw size, uploaded files and cached contents
+    are sent by reference and only count with their name.
+    """
+    from google.genai import types
+
+    if not isinstance(contents, (list, tuple)):
+        contents = [contents]
+    size = 0
+    for part in contents:
+        if isinstance(part, str):
+            size += len(part.encode("utf-8"))
+        elif isinstance(part, types.Part) and part.inline_data is not None:
+            size += len(part.inline_data.data or b"")
+        else:
+            size += len(str(getattr(part, "name", None) or part))
+    return size
+
+
+def _record_usage(task, response, seconds, request_bytes=0, response_bytes=None, ttfb=None, model=MODEL):
+    usage = response.usage_metadata
+    prompt_tokens = (usage and usage.prompt_token_count) or 0
+    output_tokens = (usage and usage.candidates_token_count) or 0
+    cached_tokens = (usage and usage.cached_content_token_count) or 0
+    if response_bytes is None:
+        response_bytes = len((response.text or "").encode("utf-8"))
+
+    usage_log.append({
+        "task": task,
+        "model": model,
+        "seconds": seconds,
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+    })
+    metrics.record_call(
+        task,
+        model,
+        seconds,
+        ttfb_s=ttfb,
+        prompt_tokens=prompt_tokens,
+        output_tokens=output_tokens,
+        cached_tokens=cached_tokens,
+        request_bytes=request_bytes,
+        response_bytes=response_bytes,
+    )
+
+
+def _generate(task, contents, config=None, model=MODEL):
+    """Calls generate_content and records latency, tokens and payload sizes."""
+    start = time.perf_counter()
+    try:
+        response = executor.call(
+            lambda: get_client().models.generate_content(model=model, contents=contents, config=config),
+            model=model,
+            task=task,
+        )
+    except Exception:
+        metrics.record_error(task, model)
+        raise
+    _record_usage(task, response, time.perf_counter() - start, _payload_size(contents), model=model)
+    return response
+
+
+async def _generate_async(task, contents, config=None, model=MODEL):
+    start = time.perf_counter()
+    try:
+        response = await executor.call_async(
+            lambda: get_client().aio.models.generate_content(
+                model=model, contents=contents, config=config
             ),
-        ],
-        config={'response_mime_type': 'application/json',
-                'response_schema': SupermarketInvoice
-        }
+            model=model,
+            task=task,
+        )
+    except Exception:
+        metrics.record_error(task, model)
+        raise
+    _record_usage(task, response, time.perf_counter() - start, _payload_size(contents), model=model)
+    return response
+
+
+def _tiers(config):
+    # Cached contexts belong to one model, requests referencing them can't switch
+    if not USE_MODEL_TIERS or (config and "cached_content" in config):
+        return (MODEL,)
+    return (FAST_MODEL, MODEL)
+
+
+def _route(task, model, problems, seconds, last):
+    if not problems:
+        decision = "accepted"
+    else:
+        decision = "failed" if last else "escalated"
+        logger.info("%s answer of %s for %s: %s", decision, model, task, "; ".join(problems))
+    routing_log.append({
+        "task": task,
+        "model": model,
+        "decision": decision,
+        "problems": problems,
+        "seconds": seconds,
+    })
+    metrics.record_route(task, model, decision)
+
+
+def _generate_tiered(task, contents, config, check):
+    """Returns the response of the first model whose answer passes check(response).
+
+    check returns a list of problems. The answer of the last tier is returned
+    even if it fails the checks, there is nothing left to escalate to.
+    """
+    tiers = _tiers(config)
+    for model in tiers:
+        last = model == tiers[-1]
+        start = time.perf_counter()
+        try:
+            response = _generate(task, contents, config, model)
+        except Exception as e:
+            if last:
+                raise
+            # A failing fast tier (e.g. an open circuit) escalates like a wrong answer
+            _route(task, model, [f"{type(e).__name__}: {e}"], time.perf_counter() - start, last)
+            continue
+        problems = check(response)
+        _route(task, model, problems, time.perf_counter() - start, last)
+        if not problems or last:
+            return response
+
+
+async def _generate_tiered_async(task, contents, config, check):
+    tiers = _tiers(config)
+    for model in tiers:
+        last = model == tiers[-1]
+        start = time.perf_counter()
+        try:
+            response = await _generate_async(task, contents, config, model)
+        except Exception as e:
+            if last:
+                raise
+            _route(task, model, [f"{type(e).__name__}: {e}"], time.perf_counter() - start, last)
+            continue
+        problems = check(response)
+        _route(task, model, problems, time.perf_counter() - start, last)
+        if not problems or last:
+            return response
+
+
+def _parsed(response):
+    return None if response.parsed is None else response.parsed.model_dump()
+
+
+def _check_invoice(response):
+    return validation.check_invoice(_parsed(response))
+
+
+def _check_page_chunk(response):
+    return validation.check_page_chunk(_parsed(response))
+
+
+def _check_fused(response):
+    return validation.check_fused(_parsed(response))
+
+
+def _check_text(response):
+    return validation.check_text(response.text)
+
+
+def document_sha256(document) -> str:
+    """Returns the SHA-256 hex digest of bytes or of a seekable binary file.
+
+    A file is hashed in chunks from its current position, which is restored
+    afterwards.
+    """
+    if isinstance(document, bytes):
+        return hashlib.sha256(document).hexdigest()
+    position = document.tell()
+    digest = hashlib.sha256()
+    while chunk := document.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    document.seek(position)
+    return digest.hexdigest()
+
+
+def _file_size(file):
+    position = file.tell()
+    size = file.seek(0, io.SEEK_END) - position
+    file.seek(position)
+    return size
+
+
+def _load_document(document):
+    """Reads small files into memory. Large files stay files and are streamed on upload."""
+    if isinstance(document, bytes) or _file_size(document) >= STREAMING_UPLOAD_THRESHOLD:
+        return document
+    return document.read()
+
+
+def _pdf_key(document, task="analyze_pdf", schema_hash=SCHEMA_HASH):
+    return make_key(
+        task, MODEL, schema_hash, str(PREPROCESS_PDFS), bytes.fromhex(document_sha256(document))
     )
-    
-    return response.parsed.model_dump()
 
 
-def analyze_unhealthy_items(invoice_data):
-    response = client.models.generate_content(
-        model=MODEL,
-        contents=f"Which items are unhealthy?\n{invoice_data}",
+class _UploadReader(io.RawIOBase):
+    """Wraps a file for files.upload and frees the chunks that were already sent.
+
+    The SDK sends 8 MB chunks, and each one stays referenced from a cycle of
+    request objects until the next full garbage collection. Without the
+    collections a 1 GB upload peaks at about 250 MB instead of about 40 MB.
+    """
+
+    def __init__(self, file):
+        self._file = file
+        self._unreleased = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, size=-1):
+        if self._unreleased >= UPLOAD_COLLECT_BYTES:
+            gc.collect()
+            self._unreleased = 0
+        data = self._file.read(size)
+        self._unreleased += len(data)
+        return data
+
+
+def upload_document(document, mime_type="application/pdf"):
+    """Uploads a document through the Files API, once per content hash.
+
+    The document can be bytes or a seekable binary file. Files are streamed
+    in chunks, so a large file is never held in memory as a whole.
+
+    Returns the File handle, which can be used in `contents` of any later call
+    until it expires on the server.
+    """
+    key = document_sha256(document)
+    handle = uploaded_files.get(key)
+    if handle is None:
+        file = io.BytesIO(document) if isinstance(document, bytes) else document
+        position = file.tell()
+        try:
+            handle = get_client().files.upload(
+                file=_UploadReader(file),
+                config={"mime_type": mime_type, "display_name": key[:16]},
+            )
+        finally:
+            file.seek(position)
+        uploaded_files.put(key, handle, handle.expiration_time)
+    return handle
+
+
+def get_cached_context(key, contents):
+    """Returns a cached-content handle for contents, creating it if needed.
+
+    Returns None if the contents can't be cached, e.g. because they are too
+    small. The caller then has to send the contents inline.
+    """
+    from google.genai import errors, types
+
+    handle = cached_contexts.get(key)
+    if handle is not None or key in _uncacheable:
+        return handle
+    try:
+        handle = get_client().caches.create(
+            model=MODEL,
+            config=types.CreateCachedContentConfig(
+                contents=contents, ttl=f"{CONTEXT_CACHE_TTL}s"
+            ),
+        )
+    except errors.APIError:
+        _uncacheable.add(key)
+        return None
+    cached_contexts.put(key, handle, handle.expire_time)
+    return handle
+
+
+EXTRACT_PROMPT = "Extract the structured data from the following invoice"
+
+
+def _pdf_contents(document, prompt=EXTRACT_PROMPT):
+    from google.genai import types
+
+    if not isinstance(document, bytes):
+        # A large file, pre-processing would need all of it in memory
+        return [prompt, upload_document(document)]
+
+    data_bytes = document
+    if PREPROCESS_PDFS:
+        preprocessed = preprocess_pdf(data_bytes)
+        if preprocessed["kind"] == "text":
+            return [prompt, preprocessed["text"]]
+        data_bytes = preprocessed["pdf"]
+
+    if USE_FILES_API or len(data_bytes) >= STREAMING_UPLOAD_THRESHOLD:
+        return [prompt, upload_document(data_bytes)]
+
+    return [
+        prompt,
+        types.Part.from_bytes(
+            data=data_bytes,
+            mime_type='application/pdf',
+        ),
+    ]
+
+
+PDF_CONFIG = {'response_mime_type': 'application/json',
+              'response_schema': SupermarketInvoice
+}
+
+
+PAGES_PROMPT = (
+    "Extract the structured data from pages {first}-{last} of a {pages} page invoice. "
+    "List every item on these pages, including an item that is cut off at the top of "
+    "the first or the bottom of the last page."
+)
+
+PAGES_CONFIG = {'response_mime_type': 'application/json',
+                'response_schema': InvoicePages
+}
+
+# Prices are rounded to cents, anything above is a real difference
+RECONCILE_TOLERANCE = 0.011
+# Items this close to a page break are checked for duplicates
+BOUNDARY_WINDOW = 3
+# How a name cut off at a page break may end
+TRUNCATION_MARKS = ("...", "…", "-")
+
+
+def _pdf_chunks(document):
+    """Returns [(first page, last page, contents)] for long PDFs, [] for short ones."""
+    if not isinstance(document, bytes):
+        return []
+    chunks = split_pdf(document, PAGES_PER_CHUNK, min_pages=PARALLEL_MIN_PAGES)
+    if not chunks:
+        return []
+    pages = chunks[-1][1]
+    return [
+        (first, last, _pdf_contents(chunk, PAGES_PROMPT.format(first=first, last=last, pages=pages)))
+        for first, last, chunk in chunks
+    ]
+
+
+def _item_key(name):
+    # Unlike health_index.normalize this keeps sizes, "MILCH 1.5L" and "MILCH 3.5L" are different lines
+    return "".join(character for character in name.lower() if character.isalnum())
+
+
+def _same_item(a, b):
+    """Whether two items are the same line, extracted from both sides of a page break.
+
+    The half that is cut off often comes with a truncated name or no price.
+    A full name that starts another one is a different product: "MILCH 0.99"
+    and "MILCHREIS 0.99" are two lines.
+    """
+    name_a = _item_key(a["item_name"])
+    name_b = _item_key(b["item_name"])
+    if not name_a or not name_b:
+        return False
+    unpriced = not a["item_cost"] or not b["item_cost"]
+    if name_a != name_b:
+        shorter, longer = sorted(((name_a, a), (name_b, b)), key=lambda pair: len(pair[0]))
+        if not longer[0].startswith(shorter[0]):
+            return False
+        if not unpriced and not shorter[1]["item_name"].rstrip().endswith(TRUNCATION_MARKS):
+            return False
+    return unpriced or abs(a["item_cost"] - b["item_cost"]) < 0.005
+
+
+def _better_item(a, b):
+    # Prefer the half with a price, then the one with the longer name
+    return max((a, b), key=lambda item: (bool(item["item_cost"]), len(_item_key(item["item_name"]))))
+
+
+def _merge_pages(results):
+    """Merges the InvoicePages dicts of consecutive chunks into a SupermarketInvoice dict."""
+    items, boundaries = [], []
+    merged = []  # (position, both halves) of items merged with a priced copy from the next chunk
+    for result in results:
+        new_items = list(result["items"])
+        if items and new_items:
+            # The longest run of items at the end of the previous chunk that
+            # is repeated at the start of this one
+            for overlap in range(min(BOUNDARY_WINDOW, len(items), len(new_items)), 0, -1):
+                pairs = zip(items[-overlap:], new_items[:overlap])
+                if all(_same_item(a, b) for a, b in pairs):
+                    for i in range(overlap):
+                        j = len(items) - overlap + i
+                        if items[j]["item_cost"] and new_items[i]["item_cost"]:
+                            merged.append((j, [items[j], new_items[i]]))
+                        items[j] = _better_item(items[j], new_items[i])
+                    new_items = new_items[overlap:]
+                    break
+        boundaries.append(len(items))
+        items.extend(new_items)
+
+    # The date is on the first page, the total on the last one
+    date = next((result["date"] for result in results if result["date"]), "")
+    total_cost = next((result["total_cost"] for result in reversed(results) if result["total_cost"]), 0.0)
+    items = _reconcile(items, total_cost, boundaries[1:], merged)
+    return SupermarketInvoice(
+        items=items, date=date, total_cost=total_cost or sum(item["item_cost"] for item in items)
+    ).model_dump()
+
+
+def _reconcile(items, total_cost, boundaries, merged=()):
+    """Fixes a wrong guess at a page break if it explains the difference to the total.
+
+    Items add up to too much: drops a page-break duplicate that the name
+    matching missed. Too little: restores a merged item, which was bought
+    twice (e.g. "MILCH 1.50" as the last line of one page and the first of
+    the next).
+    """
+    if not total_cost:
+        return items
+    excess = sum(item["item_cost"] for item in items) - total_cost
+    if abs(excess) <= RECONCILE_TOLERANCE:
+        return items
+
+    if excess > 0:
+        for boundary in boundaries:
+            for i in range(max(0, boundary - BOUNDARY_WINDOW), min(len(items), boundary + BOUNDARY_WINDOW)):
+                duplicates = [
+                    j for j in range(max(0, i - BOUNDARY_WINDOW), min(len(items), i + BOUNDARY_WINDOW + 1))
+                    if j != i and abs(items[j]["item_cost"] - items[i]["item_cost"]) < 0.005
+                ]
+                if duplicates and abs(items[i]["item_cost"] - excess) <= RECONCILE_TOLERANCE:
+                    return items[:i] + items[i + 1:]
+    else:
+        for j, halves in merged:
+            dropped = halves[0] if halves[1] is items[j] else halves[1]
+            if abs(dropped["item_cost"] + excess) <= RECONCILE_TOLERANCE:
+                return items[:j] + halves + items[j + 1:]
+
+    logger.warning(
+        "Items add up to %.2f, but the invoice total is %.2f", total_cost + excess, total_cost
     )
-    
+    return items
+
+
+def _analyze_pdf_pages(chunks):
+    workers = min(len(chunks), MAX_PARALLEL_CHUNKS)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        responses = list(pool.map(
+            lambda chunk: _generate_tiered("analyze_pdf_pages", chunk[2], PAGES_CONFIG, _check_page_chunk), chunks
+        ))
+    return _merge_pages([response.parsed.model_dump() for response in responses])
+
+
+async def _analyze_pdf_pages_async(chunks):
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_CHUNKS)
+
+    async def extract(contents):
+        async with semaphore:
+            return await _generate_tiered_async(
+                "analyze_pdf_pages", contents, PAGES_CONFIG, _check_page_chunk
+            )
+
+    responses = await asyncio.gather(*(extract(contents) for _, _, contents in chunks))
+    return _merge_pages([response.parsed.model_dump() for response in responses])
+
+
+def analyze_pdf(document):
+    """Extracts a SupermarketInvoice dict from PDF bytes or a binary file."""
+    document = _load_document(document)
+    key = _pdf_key(document)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Long invoices are extracted in page chunks, so the latency depends on
+    # the slowest chunk instead of the page count
+    chunks = _pdf_chunks(document)
+    result = _analyze_pdf_pages(chunks) if chunks else None
+    if not result or not result["items"]:
+        # Short invoices, and long ones where no chunk found an item
+        response = _generate_tiered("analyze_pdf", _pdf_contents(document), PDF_CONFIG, _check_invoice)
+        result = response.parsed.model_dump()
+
+    cache.set(key, result)
+    return result
+
+
+async def analyze_pdf_async(document):
+    # Hashing and pre-processing are CPU bound, keep them off the event loop
+    document = await asyncio.to_thread(_load_document, document)
+    key = await asyncio.to_thread(_pdf_key, document)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    chunks = await asyncio.to_thread(_pdf_chunks, document)
+    result = await _analyze_pdf_pages_async(chunks) if chunks else None
+    if not result or not result["items"]:
+        contents = await asyncio.to_thread(_pdf_contents, document)
+        response = await _generate_tiered_async("analyze_pdf", contents, PDF_CONFIG, _check_invoice)
+        result = response.parsed.model_dump()
+
+    cache.set(key, result)
+    return result
+
+
+FUSED_PROMPT = (
+    "Extract the structured data from the following invoice. "
+    "For every item, flag whether it is unhealthy and say why in a few words. "
+    "Then suggest a few recipes based on the items."
+)
+
+FUSED_CONFIG = {'response_mime_type': 'application/json',
+                'response_schema': FusedInvoiceAnalysis
+}
+
+
+def analyze_pdf_fused(document):
+    """Extracts the invoice, flags unhealthy items and suggests recipes in one call.
+
+    Returns a FusedInvoiceAnalysis dict: the SupermarketInvoice fields with
+    `is_unhealthy`/`health_note` on every item, plus a list of `recipes`.
+    """
+    document = _load_document(document)
+    key = _pdf_key(document, "analyze_pdf_fused", FUSED_SCHEMA_HASH)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    response = _generate_tiered(
+        "analyze_pdf_fused", _pdf_contents(document, FUSED_PROMPT), FUSED_CONFIG, _check_fused
+    )
+
+    result = response.parsed.model_dump()
+    cache.set(key, result)
+    return result
+
+
+UNHEALTHY_PROMPT = "Which items are unhealthy?"
+RECIPES_PROMPT = "Suggest a few recipes based on those items:"
+
+
+def _text_request(prompt, invoice_data):
+    """Returns the contents and config for a question about an invoice.
+
+    With USE_CONTEXT_CACHE the invoice is sent once into a cached context and
+    every question only references it. Small invoices are always sent inline.
+    """
+    invoice_text = str(invoice_data)
+    if USE_CONTEXT_CACHE and len(invoice_text) // 4 >= MIN_CONTEXT_CACHE_TOKENS:
+        key = make_key("invoice_context", MODEL, canonical_json(invoice_data))
+        handle = get_cached_context(key, [invoice_text])
+        if handle is not None:
+            return prompt, {"cached_content": handle.name}
+    return f"{prompt}\n{invoice_text}", None
+
+
+def _generate_text(task, prompt, invoice_data):
+    key = make_key(task, MODEL, canonical_json(invoice_data))
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    contents, config = _text_request(prompt, invoice_data)
+    response = _generate_tiered(task, contents, config, _check_text)
+
+    cache.set(key, response.text)
     return response.text
 
 
-def suggest_recipes(invoice_data):
-    response = client.models.generate_content(
+async def _generate_text_async(task, prompt, invoice_data):
+    key = make_key(task, MODEL, canonical_json(invoice_data))
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    contents, config = await asyncio.to_thread(_text_request, prompt, invoice_data)
+    response = await _generate_tiered_async(task, contents, config, _check_text)
+
+    cache.set(key, response.text)
+    return response.text
+
+
+async def _open_stream_async(contents, config):
+    """Starts a stream and waits for its first chunk.
+
+    Errors like 429 or 503 arrive with the first chunk, so this is the part
+    of a stream that can be retried. Streams are never hedged.
+    """
+    stream = await get_client().aio.models.generate_content_stream(
         model=MODEL,
-        contents=f"Suggest a few recipes based on those items:\n{invoice_data}",
+        contents=contents,
+        config=config,
     )
-    
-    return response.text
+    return stream, await anext(stream, None)
+
+
+async def _prepend(first_chunk, stream):
+    yield first_chunk
+    async for chunk in stream:
+        yield chunk
+
+
+async def _stream_text_async(task, prompt, invoice_data, timings=None):
+    """Yields the answer in chunks as they are generated.
+
+    If a timings dict is given, it receives "first_token" and "last_token",
+    the seconds from the start of the request to the first and last chunk.
+    """
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    key = make_key(task, MODEL, canonical_json(invoice_data))
+    cached = cache.get(key)
+    if cached is not None:
+        timings["first_token"] = timings["last_token"] = time.perf_counter() - start
+        yield cached
+        return
+
+    contents, config = await asyncio.to_thread(_text_request, prompt, invoice_data)
+    chunks, last_chunk = [], None
+    try:
+        stream, first_chunk = await executor.call_async(
+            lambda: _open_stream_async(contents, config), model=MODEL, task=task, hedge=False
+        )
+        if first_chunk:
+            stream = _prepend(first_chunk, stream)
+        async for chunk in stream:
+            last_chunk = chunk
+            if not chunk.text:
+                continue
+            timings.setdefault("first_token", time.perf_counter() - start)
+            chunks.append(chunk.text)
+            yield chunk.text
+    except Exception:
+        metrics.record_error(task, MODEL)
+        raise
+    timings["last_token"] = time.perf_counter() - start
+    timings.setdefault("first_token", timings["last_token"])
+    if last_chunk is not None:
+        # The usage metadata of a stream arrives with its final chunk
+        _record_usage(
+            task,
+            last_chunk,
+            timings["last_token"],
+            request_bytes=_payload_size(contents),
+            response_bytes=sum(len(chunk.encode("utf-8")) for chunk in chunks),
+            ttfb=timings["first_token"],
+        )
+
+    # Only complete answers are cached, an abandoned stream never gets here
+    cache.set(key, "".join(chunks))
+
+
+class ProductHealth(BaseModel):
+    item_name: str = Field(description="The product, exactly as given")
+    category: Literal["healthy", "neutral", "unhealthy"] = Field(description="How healthy the product is")
+
+class ProductHealthList(BaseModel):
+    products: list[ProductHealth] = Field(description="One entry per product")
+
+
+CLASSIFY_PROMPT = (
+    "Classify each of the following supermarket products as healthy, neutral or unhealthy. "
+    "Keep the product names exactly as given.\n{names}"
+)
+
+CLASSIFY_CONFIG = {'response_mime_type': 'application/json',
+                   'response_schema': ProductHealthList
+}
+
+
+def _classify_locally(invoice_data):
+    """Returns ({item name: category} for known items, [unknown item names])."""
+    known, unknown = {}, []
+    for item in invoice_data["items"]:
+        name = item["item_name"]
+        if name in known or name in unknown:
+            continue
+        category = health_index.lookup(name)
+        if category is None:
+            unknown.append(name)
+        else:
+            known[name] = category
+    return known, unknown
+
+
+def _check_classification(names, response):
+    products = _parsed(response)
+    return validation.check_classification(names, products and products["products"])
+
+
+def _learn(unknown, response, known):
+    # An unparsable answer learns nothing, _health_report lists those items as unclassified
+    products = _parsed(response)
+    for product in (products and products["products"]) or []:
+        if product["item_name"] in unknown:
+            known[product["item_name"]] = product["category"]
+            health_index.learn(product["item_name"], product["category"])
+
+
+def _health_report(invoice_data, categories):
+    unhealthy = [
+        item["item_name"] for item in invoice_data["items"]
+        if categories.get(item["item_name"]) == "unhealthy"
+    ]
+    unclassified = [
+        item["item_name"] for item in invoice_data["items"]
+        if item["item_name"] not in categories
+    ]
+    if not unhealthy:
+        report = "None of the items look unhealthy."
+    else:
+        report = "These items are potentially unhealthy:\n\n" + "\n".join(
+            f"- {name}" for name in unhealthy
+        )
+    if unclassified:
+        report += "\n\nCouldn't classify: " + ", ".join(unclassified)
+    return report
+
+
+def classify_items(invoice_data):
+    """Returns {item name: category}, asking the model only about unknown items."""
+    known, unknown = _classify_locally(invoice_data)
+    if unknown:
+        response = _generate_tiered(
+            "classify_products",
+            CLASSIFY_PROMPT.format(names="\n".join(unknown)),
+            CLASSIFY_CONFIG,
+            lambda response: _check_classification(unknown, response),
+        )
+        _learn(unknown, response, known)
+    return known
+
+
+async def classify_items_async(invoice_data):
+    known, unknown = _classify_locally(invoice_data)
+    if unknown:
+        response = await _generate_tiered_async(
+            "classify_products",
+            CLASSIFY_PROMPT.format(names="\n".join(unknown)),
+            CLASSIFY_CONFIG,
+            lambda response: _check_classification(unknown, response),
+        )
+        _learn(unknown, response, known)
+    return known
+
+
+def analyze_unhealthy_items(invoice_data):
+    if USE_HEALTH_INDEX:
+        return _health_report(invoice_data, classify_items(invoice_data))
+    return _generate_text("analyze_unhealthy_items", UNHEALTHY_PROMPT, invoice_data)
+
+
+def _basket(invoice_data):
+    return [item["item_name"] for item in invoice_data["items"]]
+
+
+def suggest_recipes(invoice_data):
+    basket = _basket(invoice_data)
+    cached = recipe_cache.get(basket)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    text = _generate_text("suggest_recipes", RECIPES_PROMPT, invoice_data)
+    recipe_cache.set(basket, text, time.perf_counter() - start)
+    return text
+
+
+async def analyze_unhealthy_items_async(invoice_data):
+    if USE_HEALTH_INDEX:
+        return _health_report(invoice_data, await classify_items_async(invoice_data))
+    return await _generate_text_async("analyze_unhealthy_items", UNHEALTHY_PROMPT, invoice_data)
+
+
+async def suggest_recipes_async(invoice_data):
+    basket = _basket(invoice_data)
+    cached = recipe_cache.get(basket)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    text = await _generate_text_async("suggest_recipes", RECIPES_PROMPT, invoice_data)
+    recipe_cache.set(basket, text, time.perf_counter() - start)
+    return text
+
+
+async def _stream_report_async(report_fn, invoice_data, timings):
+    # The report is short and built locally, so it arrives as one chunk
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    report = await report_fn(invoice_data)
+    timings["first_token"] = timings["last_token"] = time.perf_counter() - start
+    yield report
+
+
+def stream_unhealthy_items_async(invoice_data, timings=None):
+    if USE_HEALTH_INDEX:
+        return _stream_report_async(analyze_unhealthy_items_async, invoice_data, timings)
+    return _stream_text_async("analyze_unhealthy_items", UNHEALTHY_PROMPT, invoice_data, timings)
+
+
+async def stream_recipes_async(invoice_data, timings=None):
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    basket = _basket(invoice_data)
+    cached = recipe_cache.get(basket)
+    if cached is not None:
+        timings["first_token"] = timings["last_token"] = time.perf_counter() - start
+        yield cached
+        return
+
+    chunks = []
+    async for chunk in _stream_text_async("suggest_recipes", RECIPES_PROMPT, invoice_data, timings):
+        chunks.append(chunk)
+        yield chunk
+    recipe_cache.set(basket, "".join(chunks), timings["last_token"])
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def run_coroutine(coro) -> concurrent.futures.Future:
+    """Schedules a coroutine on a long-lived background event loop.
+
+    Streamlit reruns the script on every interaction. Running the aio calls on
+    one persistent loop (instead of asyncio.run per rerun) lets the async HTTP
+    client keep its connections alive between reruns.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop)
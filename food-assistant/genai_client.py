@@ -0,0 +1,64 @@
+"""Process-wide, lazily created Gemini client.
+
+Importing google.genai takes most of a second, so nothing is imported or
+created until the first call to get_client(). The client is then shared by
+every caller in the process (and survives Streamlit reruns, which re-execute
+the script but keep imported modules), so its HTTP connections are reused.
+"""
+import os
+import threading
+
+
+# Connection pool and timeouts of the underlying httpx clients
+MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "32"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GEMINI_MAX_KEEPALIVE_CONNECTIONS", "16"))
+KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "60"))  # seconds
+TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))  # seconds
+# HTTP/2 multiplexes concurrent requests over one connection, needs `pip install h2`
+HTTP2 = os.getenv("GEMINI_HTTP2", "") != ""
+# Overrides the API endpoint, e.g. to point the app at benchmarks/stub_server.py
+BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the shared genai.Client, creating it on the first call."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def set_client(client):
+    """Replaces the shared client, e.g. with one configured for tests or benchmarks."""
+    global _client
+    with _lock:
+        _client = client
+
+
+def _create_client():
+    import httpx
+    from dotenv import load_dotenv
+    from google import genai
+    from google.genai import types
+
+    load_dotenv()
+
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    client_args = {"limits": limits, "http2": HTTP2}
+    return genai.Client(
+        http_options=types.HttpOptions(
+            base_url=BASE_URL,
+            timeout=int(TIMEOUT * 1000),  # milliseconds
+            client_args=client_args,
+            async_client_args=client_args,
+        )
+    )
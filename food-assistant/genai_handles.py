@@ -0,0 +1,64 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+
+class HandleRegistry:
+    """Remembers server-side handles (uploaded files, cached contents) by content hash.
+
+    Entries are dropped a little before the server expires them, so a handle
+    returned by get() is still valid when the request using it arrives. When
+    more than max_entries handles are tracked, the least recently used one is
+    evicted and passed to on_evict, e.g. to delete it on the server.
+    """
+
+    def __init__(self, max_entries: int = 100, safety_margin: float = 60.0, on_evict=None):
+        self.max_entries = max_entries
+        self.safety_margin = safety_margin
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._handles = OrderedDict()  # key -> (handle, expires_at)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry is None:
+                return None
+            handle, expires_at = entry
+            if expires_at is not None and time.time() > expires_at - self.safety_margin:
+                del self._handles[key]  # expired on the server, nothing to clean up
+                return None
+            self._handles.move_to_end(key)
+            return handle
+
+    def put(self, key: str, handle, expires_at: datetime.datetime | float | None):
+        if isinstance(expires_at, datetime.datetime):
+            expires_at = expires_at.timestamp()
+        evicted = []
+        with self._lock:
+            self._handles[key] = (handle, expires_at)
+            self._handles.move_to_end(key)
+            while len(self._handles) > self.max_entries:
+                evicted.append(self._handles.popitem(last=False)[1][0])
+        for old_handle in evicted:
+            self._evict(old_handle)
+
+    def clear(self):
+        with self._lock:
+            handles = [handle for handle, _ in self._handles.values()]
+            self._handles.clear()
+        for handle in handles:
+            self._evict(handle)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._handles)
+
+    def _evict(self, handle):
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(handle)
+        except Exception:
+            pass  # the server expires it eventually anyway
@@ -0,0 +1,238 @@
+"""Local index of product names mapped to health categories.
+
+Invoice item names like "COLA 1.5L" repeat across thousands of invoices, so we
+classify them locally where possible and only ask the model about names we
+haven't seen before. The model's answers are written back, so the hit rate
+grows over time.
+
+The index is a file of fixed-size records sorted by normalized name. It is
+memory-mapped and searched with binary search, so opening it costs the same
+for ten or ten million names. It is (re)built from health_index_seed.json and
+the learned answers whenever one of those is newer than the index file.
+"""
+import difflib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+
+
+SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "health_index_seed.json")
+# The learned answers are data, not a cache, so they live next to the invoice store
+INDEX_DIR = os.getenv("HEALTH_INDEX_DIR", ".food_assistant")
+
+CATEGORIES = ("healthy", "neutral", "unhealthy")
+
+MAGIC = b"HIDX1\0"
+HEADER = struct.Struct("<6sI")  # magic, record count
+NAME_SIZE = 63
+RECORD_SIZE = NAME_SIZE + 1  # name (NUL padded) + category code
+
+FUZZY_CUTOFF = 0.85
+FUZZY_WINDOW = 8
+
+# Known stems and receipt abbreviations, expanded by normalize(). A name is
+# never matched by a plain prefix: "TOMATEN" is not "tomatensauce".
+ABBREVIATIONS = {
+    "bur": "burger",
+    "schoko": "schokolade",
+    "choc": "chocolate",
+    "vollm": "vollmilch",
+    "kart": "kartoffel",
+    "tom": "tomate",
+    "gem": "gemuese",
+    "bio": "",
+}
+
+# Words that describe the size, pack or variant of a product but not what it
+# is, so "COLA ZERO" may match "cola". Any other trailing word can change the
+# category ("MILCH SCHOKOLADE" is not milk), those names go to the model.
+MODIFIERS = {
+    "zero", "light", "classic", "original", "natur", "frisch", "mini", "gross", "klein", "xxl",
+    "family", "pack", "dose", "flasche", "glas", "lose", "tk", "extra", "fein", "mild",
+    "jung", "mittelalt", "alt", "rot", "gruen", "gelb", "weiss", "regional", "premium",
+}
+
+_UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+# Sizes, counts and weights: "1.5L", "500 G", "4ER", "6X0,33L", "2 STK"
+_QUANTITY = re.compile(r"\b(\d+\s*x\s*)?\d+([.,]\d+)?\s*(x|l|ml|cl|g|gr|kg|er|st|stk|pck)?\b")
+_NON_WORD = re.compile(r"[^a-z ]+")
+
+
+def normalize(name: str) -> str:
+    """Normalizes a product name for lookups.
+
+    "COLA 1.5L" -> "cola", "Süßkartoffel" -> "suesskartoffel",
+    "SENSATIONAL BUR." -> "sensational burger".
+    """
+    name = name.lower().translate(_UMLAUTS)
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    name = _QUANTITY.sub(" ", name)
+    name = _NON_WORD.sub(" ", name)
+    words = [ABBREVIATIONS.get(word, word) for word in name.split()]
+    return " ".join(word for word in words if word)[:NAME_SIZE]
+
+
+def build_index(entries: dict, path: str):
+    """Writes entries ({normalized name: category}) as a sorted index file."""
+    records = sorted(
+        (name.encode("utf-8")[:NAME_SIZE], CATEGORIES.index(category))
+        for name, category in entries.items()
+        if name and category in CATEGORIES
+    )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        for name, code in records:
+            f.write(name.ljust(NAME_SIZE, b"\0") + bytes([code]))
+    os.replace(tmp_path, path)
+
+
+class HealthIndex:
+    def __init__(self, directory: str = INDEX_DIR, seed_path: str = SEED_PATH):
+        self.index_path = os.path.join(directory, "health_index.bin")
+        self.learned_path = os.path.join(directory, "health_index_learned.jsonl")
+        self.seed_path = seed_path
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._count = 0
+        self._learned = {}  # answers learned since the index file was built
+        self.version = 0  # bumped by every learned answer
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, name: str, record_stats: bool = True) -> str | None:
+        """Returns the category of a product name, or None if it is unknown.
+
+        Lookups that don't stand in for a model call, like those of the
+        invoice store, pass record_stats=False to keep them out of the hit rate.
+        """
+        self._ensure_open()
+        query = normalize(name)
+        category = self._lookup_normalized(query) if query else None
+        if not record_stats:
+            return category
+        with self._lock:
+            if category is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return category
+
+    def learn(self, name: str, category: str):
+        """Adds a classification, e.g. a model answer, to the index."""
+        query = normalize(name)
+        if not query or category not in CATEGORIES:
+            return
+        self._ensure_open()
+        with self._lock:
+            if self._learned.get(query) == category:
+                return
+            self._learned[query] = category
+            self.version += 1
+            os.makedirs(os.path.dirname(self.learned_path) or ".", exist_ok=True)
+            with open(self.learned_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"name": query, "category": category}) + "\n")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._count + len(self._learned),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _lookup_normalized(self, query):
+        with self._lock:
+            if query in self._learned:
+                return self._learned[query]
+
+        # Exact match, then the longest known prefix of the words if only
+        # modifiers follow ("cola zero" -> "cola")
+        words = query.split()
+        for n in range(len(words), 0, -1):
+            if n < len(words) and words[n] not in MODIFIERS:
+                break
+            category = self._exact(" ".join(words[:n]))
+            if category is not None:
+                return category
+
+        # Typos and other spellings: compare with the neighbours in sort order
+        position = self._bisect(query.encode("utf-8"))
+        best, best_ratio = None, FUZZY_CUTOFF
+        for i in range(max(0, position - FUZZY_WINDOW), min(self._count, position + FUZZY_WINDOW)):
+            name, code = self._record(i)
+            ratio = difflib.SequenceMatcher(None, query, name.decode("utf-8")).ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = CATEGORIES[code], ratio
+        return best
+
+    def _exact(self, query):
+        with self._lock:
+            if query in self._learned:
+                return self._learned[query]
+        key = query.encode("utf-8")
+        position = self._bisect(key)
+        if position < self._count:
+            name, code = self._record(position)
+            if name == key:
+                return CATEGORIES[code]
+        return None
+
+    def _record(self, i):
+        offset = HEADER.size + i * RECORD_SIZE
+        record = self._mmap[offset:offset + RECORD_SIZE]
+        return record[:NAME_SIZE].rstrip(b"\0"), record[NAME_SIZE]
+
+    def _bisect(self, key):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _ensure_open(self):
+        if self._mmap is not None:
+            return
+        with self._lock:
+            if self._mmap is not None:
+                return
+            if self._is_stale():
+                build_index(self._load_sources(), self.index_path)
+            with open(self.index_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self._count = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{self.index_path} is not a health index file")
+
+    def _is_stale(self):
+        if not os.path.exists(self.index_path):
+            return True
+        built = os.path.getmtime(self.index_path)
+        return any(
+            os.path.exists(path) and os.path.getmtime(path) > built
+            for path in (self.seed_path, self.learned_path)
+        )
+
+    def _load_sources(self):
+        entries = {}
+        if os.path.exists(self.seed_path):
+            with open(self.seed_path, encoding="utf-8") as f:
+                for name, category in json.load(f).items():
+                    entries[normalize(name)] = category
+        if os.path.exists(self.learned_path):
+            with open(self.learned_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[entry["name"]] = entry["category"]
+        return entries
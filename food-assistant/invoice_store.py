@@ -0,0 +1,228 @@
+"""Local columnar store of extracted invoices for spending analytics.
+
+Every extracted invoice is written to a DuckDB database, one row per invoice
+and one row per line item, so the analytics page can answer questions like
+"how much did I spend on unhealthy food per month" without calling Gemini
+again. DuckDB stores the tables column by column with min/max statistics per
+block, so aggregations over millions of line items run in milliseconds.
+
+Line items are stored with their normalized name (see health_index.py), so
+"COLA 1.5L" and "Cola 1,5l" share one price history, and with the health
+category of the product. Products the health index doesn't know yet are
+stored as "unknown" and updated once it has learned them from the model.
+"""
+import datetime
+import os
+import threading
+
+from health_index import HealthIndex, normalize
+
+
+# Not in .gemini_cache: clearing the cache must not delete the spending history
+STORE_PATH = os.getenv("INVOICE_STORE_PATH", os.path.join(".food_assistant", "invoices.duckdb"))
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y", "%d/%m/%Y", "%m/%d/%Y", "%Y/%m/%d", "%d-%m-%Y")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_id VARCHAR PRIMARY KEY,
+    source VARCHAR,
+    date DATE,
+    total_cost DOUBLE,
+    added_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS line_items (
+    invoice_id VARCHAR,
+    date DATE,
+    item_name VARCHAR,
+    product VARCHAR,
+    category VARCHAR,
+    item_cost DOUBLE
+);
+CREATE INDEX IF NOT EXISTS line_items_date ON line_items (date);
+CREATE INDEX IF NOT EXISTS line_items_product ON line_items (product);
+"""
+
+
+def parse_date(value) -> datetime.date | None:
+    """Parses an invoice date as the model returns it, None if it can't."""
+    if isinstance(value, datetime.date):
+        return value
+    value = str(value or "").strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+class InvoiceStore:
+    def __init__(self, path: str = STORE_PATH, health_index: HealthIndex | None = None):
+        import duckdb
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.health_index = health_index or HealthIndex()
+        self._connection = duckdb.connect(path)
+        self._connection.execute(SCHEMA)
+        self._lock = threading.Lock()
+        self._classified_version = None  # health index version of the last category update
+
+    def add(self, invoice: dict, invoice_id: str, source: str | None = None) -> bool:
+        """Stores an extracted invoice.
+
+        Args:
+            invoice: A SupermarketInvoice as a dict, e.g. the result of analyze_pdf.
+            invoice_id: A stable id such as the hash of the PDF. Adding the
+                same invoice twice is a no-op.
+            source: Where the invoice came from, e.g. its file name.
+
+        Returns:
+            True if the invoice was new.
+        """
+        return self.add_many([(invoice, invoice_id, source)]) == 1
+
+    def add_many(self, records) -> int:
+        """Stores (invoice, invoice_id, source) tuples, returns the number of new invoices."""
+        now = datetime.datetime.now()
+        with self._lock:
+            cursor = self._connection.cursor()
+            ids = [invoice_id for _, invoice_id, _ in records]
+            existing = {
+                row[0] for row in cursor.execute(
+                    "SELECT invoice_id FROM invoices WHERE invoice_id IN (SELECT unnest(?))", [ids]
+                ).fetchall()
+            }
+            invoice_rows, item_rows = [], []
+            for invoice, invoice_id, source in records:
+                if invoice_id in existing:
+                    continue
+                existing.add(invoice_id)
+                date = parse_date(invoice.get("date"))
+                invoice_rows.append((invoice_id, source, date, invoice.get("total_cost"), now))
+                for item in invoice.get("items", []):
+                    item_rows.append((
+                        invoice_id,
+                        date,
+                        item["item_name"],
+                        normalize(item["item_name"]),
+                        self.health_index.lookup(item["item_name"], record_stats=False) or "unknown",
+                        item["item_cost"],
+                    ))
+            if not invoice_rows:
+                return 0
+            cursor.execute("BEGIN TRANSACTION")
+            cursor.executemany("INSERT INTO invoices VALUES (?, ?, ?, ?, ?)", invoice_rows)
+            if item_rows:
+                cursor.executemany("INSERT INTO line_items VALUES (?, ?, ?, ?, ?, ?)", item_rows)
+            cursor.execute("COMMIT")
+            return len(invoice_rows)
+
+    def spend_by_category(self, start=None, end=None):
+        """Returns a DataFrame with the spend per month and health category."""
+        self._update_categories()
+        return self._query(
+            """
+            SELECT date_trunc('month', date) AS month, category, sum(item_cost) AS spend
+            FROM line_items
+            WHERE date IS NOT NULL AND date >= coalesce(?, DATE '0001-01-01')
+                AND date < coalesce(?, DATE '9999-12-31')
+            GROUP BY ALL
+            ORDER BY month, category
+            """,
+            [parse_date(start), parse_date(end)],
+        )
+
+    def price_history(self, item_name: str):
+        """Returns a DataFrame with every price paid for a product, oldest first."""
+        return self._query(
+            """
+            SELECT date, item_name, item_cost
+            FROM line_items
+            WHERE product = ?
+            ORDER BY date
+            """,
+            [normalize(item_name)],
+        )
+
+    def top_items(self, limit: int = 10, by: str = "spend"):
+        """Returns a DataFrame with the products with the highest spend or purchase count."""
+        if by not in ("spend", "purchases"):
+            raise ValueError(f"Can't rank items by {by!r}")
+        self._update_categories()
+        return self._query(
+            f"""
+            SELECT product, any_value(item_name) AS item_name, any_value(category) AS category,
+                count(*) AS purchases, sum(item_cost) AS spend, avg(item_cost) AS average_price
+            FROM line_items
+            GROUP BY product
+            ORDER BY {by} DESC
+            LIMIT ?
+            """,
+            [limit],
+        )
+
+    def products(self) -> list[str]:
+        """Returns the normalized names of all stored products."""
+        rows = self._connection.cursor().execute(
+            "SELECT DISTINCT product FROM line_items ORDER BY product"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def stats(self) -> dict:
+        invoices, first, last = self._connection.cursor().execute(
+            "SELECT count(*), min(date), max(date) FROM invoices"
+        ).fetchone()
+        items = self._connection.cursor().execute("SELECT count(*) FROM line_items").fetchone()[0]
+        return {"invoices": invoices, "line_items": items, "first_date": first, "last_date": last}
+
+    def close(self):
+        self._connection.close()
+
+    def _update_categories(self):
+        """Classifies the "unknown" products the health index has learned since the last call."""
+        version = self.health_index.version
+        if version == self._classified_version:
+            return
+        with self._lock:
+            cursor = self._connection.cursor()
+            unknown = cursor.execute(
+                "SELECT DISTINCT product FROM line_items WHERE category = 'unknown'"
+            ).fetchall()
+            updates = [
+                (category, product)
+                for (product,) in unknown
+                if (category := self.health_index.lookup(product, record_stats=False))
+            ]
+            if updates:
+                cursor.executemany(
+                    "UPDATE line_items SET category = ? WHERE product = ? AND category = 'unknown'", updates
+                )
+            self._classified_version = version
+
+    def _query(self, sql, parameters):
+        # A cursor is a separate connection to the same database, so queries
+        # from different Streamlit sessions don't block each other
+        return self._connection.cursor().execute(sql, parameters).df()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> InvoiceStore:
+    """Returns the process-wide store, opening it on the first call.
+
+    DuckDB allows only one process to open a database for writing, so the app
+    and its pages share this instance.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                # The index the app classifies with, so the store sees what it learns
+                from gemini_service import health_index
+
+                _store = InvoiceStore(health_index=health_index)
+    return _store
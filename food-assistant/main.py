@@ -1,6 +1,26 @@
 import json
+import os
+import queue
+
 import streamlit as st
-from gemini_service import analyze_pdf, analyze_unhealthy_items, suggest_recipes
+from gemini_service import (
+    analyze_pdf,
+    analyze_pdf_fused,
+    stream_unhealthy_items_async,
+    stream_recipes_async,
+    run_coroutine,
+    cache,
+    document_sha256,
+    STREAMING_UPLOAD_THRESHOLD,
+    health_index,
+    recipe_cache,
+)
+from invoice_store import get_store
+from pdf_preprocess import bytes_saved
+import metrics
+
+if os.getenv("METRICS_PORT"):
+    metrics.start_metrics_server(int(os.getenv("METRICS_PORT")))
 
 
 st.header("Gemini Supermarket Assistant")
@@ -12,26 +32,150 @@ st.markdown("""Upload a PDF with your supermarket invoice and Gemini will:
 3. Suggest a few recipes          
 """)
 
+mode = st.sidebar.radio(
+    "Analysis mode",
+    ["Staged", "Fused"],
+    help="Staged makes three calls and streams the answers. "
+         "Fused gets everything in a single structured-output call.",
+)
+
 uploaded_file = st.file_uploader('Choose your .pdf file', type="pdf")
 
-if uploaded_file is not None:
-    bytes_data = uploaded_file.getvalue()
+
+async def pump(name, stream, updates):
+    """Forwards the chunks of one stream to the script thread."""
+    try:
+        async for chunk in stream:
+            updates.put((name, chunk))
+    finally:
+        updates.put((name, None))
+
+
+def read_document(uploaded_file):
+    """Returns the bytes of the PDF, or the file itself if it is large.
+
+    Large files are streamed to the Files API in chunks instead of being
+    copied (and base64 encoded) in memory.
+    """
+    if uploaded_file.size >= STREAMING_UPLOAD_THRESHOLD:
+        uploaded_file.seek(0)
+        return uploaded_file
+    return uploaded_file.getvalue()
+
+
+def store_invoice(document, invoice):
+    """Saves the invoice for the Spending page, re-uploads are stored once."""
+    get_store().add(invoice, document_sha256(document), source=uploaded_file.name)
+
+
+def fused_invoice(analysis):
+    invoice = {key: analysis[key] for key in ("items", "date", "total_cost")}
+    invoice["items"] = [
+        {"item_name": item["item_name"], "item_cost": item["item_cost"]}
+        for item in analysis["items"]
+    ]
+    return invoice
+
+
+def render_fused(analysis):
+    st.text(json.dumps(fused_invoice(analysis), indent=4))
+
+    st.subheader("Potentially unhealthy items")
+    unhealthy = [item for item in analysis["items"] if item["is_unhealthy"]]
+    st.markdown(
+        "\n".join(f"- **{item['item_name']}**: {item['health_note']}" for item in unhealthy)
+        or "No unhealthy items found."
+    )
+
+    st.subheader("Recipe suggestions")
+    for recipe in analysis["recipes"]:
+        st.markdown(f"**{recipe['name']}**")
+        st.markdown("\n".join(f"- {ingredient}" for ingredient in recipe["ingredients"]))
+        st.markdown(recipe["instructions"])
+
+
+if uploaded_file is not None and mode == "Fused":
+    document = read_document(uploaded_file)
+    with st.spinner("Analyzing invoice...", show_time=True):
+        analysis = analyze_pdf_fused(document)
+    st.success("Analyzing invoice done!")
+    store_invoice(document, fused_invoice(analysis))
+    render_fused(analysis)
+
+elif uploaded_file is not None:
+    document = read_document(uploaded_file)
     with st.spinner("Extracting invoice items...", show_time=True):
-        invoice_items = analyze_pdf(bytes_data)
+        invoice_items = analyze_pdf(document)
     st.success("Extracting invoice items done!")
     st.text(json.dumps(invoice_items, indent=4))
 
-    with st.spinner("Finding potentially unhealthy items...", show_time=True):
-        text = analyze_unhealthy_items(invoice_items)
-    st.success("Finding potentially unhealthy items done!")
-    st.markdown(text)
+    # Both follow-up calls only depend on the invoice, so they run concurrently
+    # on the background loop. Their chunks are rendered here as they arrive.
+    sections = {
+        "unhealthy": (
+            st.empty(),
+            "Finding potentially unhealthy items...",
+            "Finding potentially unhealthy items done!",
+            stream_unhealthy_items_async,
+        ),
+        "recipes": (
+            st.empty(),
+            "Suggest recipes...",
+            "Generating recipe suggestions done!",
+            stream_recipes_async,
+        ),
+    }
+    updates = queue.Queue()
+    texts = {name: "" for name in sections}
+    timings = {name: {} for name in sections}
+    futures = []
+    for name, (section, pending_message, _, stream_fn) in sections.items():
+        section.info(pending_message)
+        stream = stream_fn(invoice_items, timings[name])
+        futures.append(run_coroutine(pump(name, stream, updates)))
 
-    with st.spinner("Suggest recipes...", show_time=True):
-        text = suggest_recipes(invoice_items)
-    st.success("Generating recipe suggestions done!")
-    st.markdown(text)
+    running = len(sections)
+    while running:
+        name, chunk = updates.get()
+        section, _, done_message, _ = sections[name]
+        if chunk is not None:
+            texts[name] += chunk
+            section.markdown(texts[name] + " ▌")
+            continue
 
+        running -= 1
+        with section.container():
+            st.success(done_message)
+            st.markdown(texts[name])
+            if "last_token" in timings[name]:
+                st.caption(
+                    f"First token after {timings[name]['first_token']:.2f}s, "
+                    f"done after {timings[name]['last_token']:.2f}s"
+                )
 
+    for future in futures:
+        future.result()  # surface errors raised inside the streams
 
+    # Stored after the classification, so its answers are in the health index
+    store_invoice(document, invoice_items)
 
+if uploaded_file is not None:
+    stats = cache.stats()
+    st.sidebar.caption(
+        f"Cache: {stats['memory_hits'] + stats['disk_hits']} hits, "
+        f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)"
+    )
+    st.sidebar.caption(f"PDF pre-processing saved {bytes_saved() / 1024:.0f} KB")
+    index_stats = health_index.stats()
+    st.sidebar.caption(
+        f"Health index: {index_stats['entries']} products, "
+        f"{index_stats['hit_rate']:.0%} classified locally"
+    )
+    recipe_stats = recipe_cache.stats()
+    st.sidebar.caption(
+        f"Recipe cache: {recipe_stats['hit_rate']:.0%} of baskets reused, "
+        f"{recipe_stats['seconds_saved']:.1f}s saved"
+    )
 
+if st.sidebar.checkbox("Show call metrics"):
+    st.sidebar.dataframe(metrics.summary(), hide_index=True)
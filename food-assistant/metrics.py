@@ -0,0 +1,208 @@
+"""Latency and token metrics for every Gemini call.
+
+The metrics are kept in-process and can be exposed in the Prometheus text
+format, either through render_prometheus() or a small /metrics HTTP server:
+
+    import metrics
+    metrics.start_metrics_server(9464)
+"""
+import collections
+import http.server
+import threading
+
+
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RECENT_SAMPLES = 500
+
+_lock = threading.Lock()
+
+
+def percentile(values, q):
+    """The q-th percentile of values, the nearest of them by rank. 0.0 without values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = collections.defaultdict(float)
+
+    def inc(self, labels, amount=1.0):
+        with _lock:
+            self.values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.counts = {}  # labels -> per-bucket counts, the last one is +Inf
+        self.sums = collections.defaultdict(float)
+        # Raw recent samples, used for percentiles in the UI
+        self.recent = collections.defaultdict(lambda: collections.deque(maxlen=RECENT_SAMPLES))
+
+    def observe(self, labels, value):
+        with _lock:
+            counts = self.counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.sums[labels] += value
+            self.recent[labels].append(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self.counts.items()):
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                le = bound if bound == "+Inf" else f"{bound:g}"
+                bucket_labels = _format_labels((*self.label_names, "le"), (*labels, le))
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {self.sums[labels]:g}")
+            lines.append(f"{self.name}_count{label_text} {counts[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+REQUESTS = Counter("gemini_requests_total", "Gemini calls by outcome.", ("task", "model", "status"))
+RETRIES = Counter("gemini_retries_total", "Retried Gemini calls.", ("task", "model"))
+HEDGES = Counter(
+    "gemini_hedged_requests_total", "Calls that got a duplicate request.", ("task", "model", "winner")
+)
+ROUTES = Counter(
+    "gemini_routing_decisions_total",
+    "Answers of tiered calls by model and whether they passed the local checks.",
+    ("task", "model", "decision"),
+)
+TOKENS = Counter("gemini_tokens_total", "Tokens used by Gemini calls.", ("task", "model", "type"))
+REQUEST_BYTES = Counter("gemini_request_bytes_total", "Request payload size.", ("task", "model"))
+RESPONSE_BYTES = Counter("gemini_response_bytes_total", "Response payload size.", ("task", "model"))
+DURATION = Histogram("gemini_request_duration_seconds", "Wall time of Gemini calls.", ("task", "model"))
+TTFB = Histogram("gemini_time_to_first_byte_seconds", "Time until the first response chunk.", ("task", "model"))
+
+ALL_METRICS = (REQUESTS, RETRIES, HEDGES, ROUTES, TOKENS, REQUEST_BYTES, RESPONSE_BYTES, DURATION, TTFB)
+
+
+def record_call(
+    task,
+    model,
+    wall_s,
+    ttfb_s=None,
+    prompt_tokens=0,
+    output_tokens=0,
+    cached_tokens=0,
+    request_bytes=0,
+    response_bytes=0,
+):
+    labels = (task, model)
+    REQUESTS.inc((task, model, "ok"))
+    DURATION.observe(labels, wall_s)
+    if ttfb_s is not None:  # only streamed calls have a first byte before the end
+        TTFB.observe(labels, ttfb_s)
+    TOKENS.inc((task, model, "prompt"), prompt_tokens)
+    TOKENS.inc((task, model, "output"), output_tokens)
+    TOKENS.inc((task, model, "cached"), cached_tokens)
+    REQUEST_BYTES.inc(labels, request_bytes)
+    RESPONSE_BYTES.inc(labels, response_bytes)
+
+
+def record_error(task, model):
+    REQUESTS.inc((task, model, "error"))
+
+
+def record_retry(task, model):
+    RETRIES.inc((task, model))
+
+
+def record_hedge(task, model, hedge_won):
+    HEDGES.inc((task, model, "hedge" if hedge_won else "primary"))
+
+
+def record_route(task, model, decision):
+    """decision is "accepted", "escalated" (to a stronger model) or "failed" (nothing left to escalate to)."""
+    ROUTES.inc((task, model, decision))
+
+
+def render_prometheus() -> str:
+    with _lock:
+        lines = [line for metric in ALL_METRICS for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> list[dict]:
+    """Returns one row per (task, model) with the main numbers, for display."""
+    with _lock:
+        rows = []
+        for labels, samples in sorted(DURATION.recent.items()):
+            task, model = labels
+            first_bytes = TTFB.recent.get(labels)
+            rows.append({
+                "task": task,
+                "model": model,
+                "calls": int(REQUESTS.values[(task, model, "ok")]),
+                "errors": int(REQUESTS.values[(task, model, "error")]),
+                "retries": int(RETRIES.values[labels]),
+                "hedges": int(HEDGES.values[(task, model, "primary")] + HEDGES.values[(task, model, "hedge")]),
+                "escalated": int(ROUTES.values[(task, model, "escalated")]),
+                "p50_s": round(percentile(samples, 50), 3),
+                "p95_s": round(percentile(samples, 95), 3),
+                "ttfb_p50_s": round(percentile(first_bytes, 50), 3) if first_bytes else None,
+                "prompt_tokens": int(TOKENS.values[(task, model, "prompt")]),
+                "output_tokens": int(TOKENS.values[(task, model, "output")]),
+                "cached_tokens": int(TOKENS.values[(task, model, "cached")]),
+                "request_kb": round(REQUEST_BYTES.values[labels] / 1024, 1),
+                "response_kb": round(RESPONSE_BYTES.values[labels] / 1024, 1),
+            })
+        return rows
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # don't log every scrape
+
+
+_server = None
+
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1"):
+    """Serves /metrics in a background thread. Calling it again is a no-op."""
+    global _server
+    with _lock:
+        if _server is not None:
+            return _server
+        _server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
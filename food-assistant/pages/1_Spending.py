@@ -0,0 +1,36 @@
+import streamlit as st
+
+from invoice_store import get_store
+
+
+st.header("Spending")
+
+store = get_store()
+stats = store.stats()
+if not stats["invoices"]:
+    st.info("No invoices yet. Analyze an invoice on the main page and it will show up here.")
+    st.stop()
+
+st.caption(
+    f"{stats['invoices']} invoices with {stats['line_items']} items "
+    f"from {stats['first_date']} to {stats['last_date']}"
+)
+
+st.subheader("Spend per month")
+spend = store.spend_by_category()
+if spend.empty:
+    st.write("None of the invoices has a readable date.")
+else:
+    by_month = spend.pivot_table(index="month", columns="category", values="spend", fill_value=0)
+    st.bar_chart(by_month)
+
+st.subheader("Top items")
+by = st.radio("Rank by", ["spend", "purchases"], horizontal=True)
+st.dataframe(store.top_items(limit=20, by=by), hide_index=True)
+
+st.subheader("Price history")
+product = st.selectbox("Product", store.products())
+if product:
+    history = store.price_history(product)
+    st.line_chart(history.dropna(subset=["date"]), x="date", y="item_cost")
+    st.dataframe(history, hide_index=True)
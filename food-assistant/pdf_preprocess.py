@@ -0,0 +1,159 @@
+"""Shrinks invoice PDFs locally before they are sent to Gemini.
+
+1. If the PDF has a text layer, the text of the pages with line items is sent
+   instead of the PDF.
+2. Otherwise pages without line items (ads, terms, ...) are dropped and the
+   embedded images are downsampled, and the trimmed PDF is sent.
+
+The first and the last page are always kept: they often hold only the
+date or only the total, which have too few prices to count as line items.
+
+Needs `pypdf` (and `pillow` for the image downsampling). Without it, or when a
+PDF can't be parsed, the original bytes are sent unchanged.
+"""
+import io
+import re
+import threading
+
+
+# Prices like "1,79" or "12.99". A page with line items has a few of them.
+PRICE_PATTERN = re.compile(r"\d+[.,]\d{2}\b")
+MIN_PRICES_PER_PAGE = 2
+# Below this many characters the text layer is probably just a header or
+# footer on top of a scanned image, so we don't trust it.
+MIN_TEXT_CHARS = 100
+MAX_IMAGE_SIZE = 1600
+IMAGE_QUALITY = 60
+
+_stats_lock = threading.Lock()
+stats = {
+    "documents": 0,
+    "text_documents": 0,
+    "pages_total": 0,
+    "pages_sent": 0,
+    "bytes_in": 0,
+    "bytes_sent": 0,
+}
+
+
+def preprocess_pdf(data_bytes: bytes) -> dict:
+    """Returns the most compact representation of an invoice PDF.
+
+    Returns:
+        A dictionary with "kind" ("text", "pdf" or "original"), the "text" or
+        the "pdf" bytes to send, and "pages_total"/"pages_sent".
+    """
+    try:
+        result = _preprocess(data_bytes)
+    except Exception:
+        result = None
+    if result is None:
+        result = {"kind": "original", "pdf": data_bytes, "pages_total": 0, "pages_sent": 0}
+
+    sent = result["text"].encode("utf-8") if result["kind"] == "text" else result["pdf"]
+    with _stats_lock:
+        stats["documents"] += 1
+        stats["text_documents"] += result["kind"] == "text"
+        stats["pages_total"] += result["pages_total"]
+        stats["pages_sent"] += result["pages_sent"]
+        stats["bytes_in"] += len(data_bytes)
+        stats["bytes_sent"] += len(sent)
+    return result
+
+
+def bytes_saved() -> int:
+    with _stats_lock:
+        return stats["bytes_in"] - stats["bytes_sent"]
+
+
+def split_pdf(data_bytes: bytes, pages_per_chunk: int, min_pages: int = 1) -> list[tuple[int, int, bytes]]:
+    """Splits a PDF into chunks of consecutive pages.
+
+    Returns:
+        A list of (first page, last page, PDF bytes), pages counted from 1.
+        Empty if the PDF has fewer than min_pages pages, can't be parsed or
+        pypdf isn't installed.
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+        reader = PdfReader(io.BytesIO(data_bytes))
+        page_count = len(reader.pages)
+    except Exception:
+        return []
+    if page_count < min_pages:
+        return []
+
+    chunks = []
+    for start in range(0, page_count, pages_per_chunk):
+        end = min(start + pages_per_chunk, page_count)
+        writer = PdfWriter()
+        for i in range(start, end):
+            writer.add_page(reader.pages[i])
+        out = io.BytesIO()
+        writer.write(out)
+        chunks.append((start + 1, end, out.getvalue()))
+    return chunks
+
+
+def _preprocess(data_bytes):
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        return None
+
+    reader = PdfReader(io.BytesIO(data_bytes))
+    texts = [page.extract_text() or "" for page in reader.pages]
+    item_pages = [
+        i for i, text in enumerate(texts)
+        if len(PRICE_PATTERN.findall(text)) >= MIN_PRICES_PER_PAGE
+    ]
+
+    # No line items found (e.g. a scan), so we can't tell which pages hold them and keep all
+    keep = sorted({0, len(texts) - 1, *item_pages}) if item_pages else list(range(len(texts)))
+
+    if item_pages and all(len(texts[i].strip()) >= MIN_TEXT_CHARS for i in item_pages):
+        text = "\n\n".join(
+            f"--- Page {i + 1} ---\n{texts[i].strip()}" for i in keep if texts[i].strip()
+        )
+        return {
+            "kind": "text",
+            "text": text,
+            "pages_total": len(texts),
+            "pages_sent": len(keep),
+        }
+
+    writer = PdfWriter()
+    for i in keep:
+        writer.add_page(reader.pages[i])
+    for page in writer.pages:
+        _downsample_images(page)
+        page.compress_content_streams()
+    writer.compress_identical_objects()
+
+    out = io.BytesIO()
+    writer.write(out)
+    trimmed = out.getvalue()
+    if len(trimmed) >= len(data_bytes):
+        return None
+    return {
+        "kind": "pdf",
+        "pdf": trimmed,
+        "pages_total": len(reader.pages),
+        "pages_sent": len(keep),
+    }
+
+
+def _downsample_images(page):
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+
+    for image_file in page.images:
+        image = image_file.image
+        if image is None or max(image.size) <= MAX_IMAGE_SIZE:
+            continue
+        image.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE), Image.LANCZOS)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image_file.replace(image, quality=IMAGE_QUALITY)
@@ -0,0 +1,123 @@
+"""Recipe suggestions shared between similar baskets.
+
+Most invoices contain nearly the same groceries (milk, bread, eggs, pasta...),
+so the exact-match result cache rarely helps for recipes. Here every basket is
+turned into a bag-of-ingredients vector (normalized item names, hashed into a
+fixed number of buckets) and a new basket reuses the suggestions of the most
+similar cached one if their cosine similarity is above a threshold.
+
+Entries are evicted when they are older than max_age or, once the cache is
+full, least recently used first.
+"""
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+from health_index import normalize
+
+
+DIMENSIONS = 1024
+SIMILARITY_THRESHOLD = 0.8
+MAX_ENTRIES = 512
+MAX_AGE = 7 * 24 * 3600  # seconds
+
+
+def _bucket(word):
+    digest = hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "little") % DIMENSIONS
+
+
+def basket_vector(item_names) -> np.ndarray:
+    """Returns the unit-length bag-of-ingredients vector of a basket.
+
+    Quantities, sizes and brands' spelling variants are removed by
+    health_index.normalize, and every product counts once however often
+    it is on the invoice.
+    """
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for name in {normalize(name) for name in item_names}:
+        if name:
+            vector[_bucket(name)] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class RecipeCache:
+    def __init__(
+        self,
+        threshold: float = SIMILARITY_THRESHOLD,
+        max_entries: int = MAX_ENTRIES,
+        max_age: float = MAX_AGE,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((max_entries, DIMENSIONS), dtype=np.float32)
+        self._entries = [None] * max_entries  # (text, generation seconds, created, last used)
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def get(self, item_names):
+        """Returns the suggestions for the most similar cached basket, or None."""
+        if not self.enabled:
+            return None
+        vector = basket_vector(item_names)
+        now = time.time()
+        with self._lock:
+            similarities = self._vectors @ vector
+            for slot, entry in enumerate(self._entries):
+                if entry is None or now - entry[2] > self.max_age:
+                    similarities[slot] = -1.0
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                self.misses += 1
+                return None
+            text, seconds, created, _ = self._entries[slot]
+            self._entries[slot] = (text, seconds, created, now)
+            self.hits += 1
+            self.seconds_saved += seconds
+            return text
+
+    def set(self, item_names, text: str, seconds: float):
+        """Stores suggestions that took `seconds` to generate."""
+        if not self.enabled:
+            return
+        vector = basket_vector(item_names)
+        if not vector.any():
+            return
+        now = time.time()
+        with self._lock:
+            slot = self._free_slot(now)
+            self._vectors[slot] = vector
+            self._entries[slot] = (text, seconds, now, now)
+
+    def clear(self):
+        with self._lock:
+            self._vectors[:] = 0.0
+            self._entries = [None] * self.max_entries
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(entry is not None for entry in self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": self.seconds_saved,
+            }
+
+    def _free_slot(self, now):
+        # An empty or expired slot, otherwise the least recently used one
+        oldest_slot, oldest_use = 0, float("inf")
+        for slot, entry in enumerate(self._entries):
+            if entry is None or now - entry[2] > self.max_age:
+                return slot
+            if entry[3] < oldest_use:
+                oldest_slot, oldest_use = slot, entry[3]
+        return oldest_slot
@@ -0,0 +1,355 @@
+"""Retries, hedging and circuit breaking for model calls.
+
+    executor = RequestExecutor(hedge=True)
+    response = executor.call(
+        lambda: client.models.generate_content(model=MODEL, contents=contents),
+        model=MODEL,
+        task="summarize",
+    )
+
+- Transient errors (429, 5xx, timeouts, dropped connections) are retried with
+  exponential backoff and full jitter, as long as the next attempt can still
+  start before the deadline.
+- With hedging, a call that takes longer than the observed p95 of its task
+  gets a duplicate request, and whichever answers first wins.
+- A model that keeps failing gets its circuit opened: calls fail immediately
+  with CircuitOpenError for a while instead of piling up on a broken backend,
+  then a single trial call decides whether it is closed again.
+- With a rate limiter, every request waits for its slot, retries and hedges
+  included.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import random
+import threading
+import time
+
+from metrics import percentile
+
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# A list a caller can set to collect the (start, end) of its rate limit waits
+rate_limit_waits = contextvars.ContextVar("rate_limit_waits", default=None)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit is open."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed call is worth repeating."""
+    code = getattr(error, "code", None)  # google.genai.errors.APIError
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures, retries after reset_timeout seconds."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        return self.begin() is not None
+
+    def begin(self) -> bool | None:
+        """Like allow(), but tells the trial call apart.
+
+        Returns None if the call must not go through, True if it is the trial
+        of a half-open circuit, else False.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                return None
+            self._trial_running = True  # let exactly one call through to test the model
+            return True
+
+    def release_trial(self):
+        """Lets another call test the model, after a trial that ended without a result."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class RateLimiter:
+    """Spaces out requests evenly to stay within a requests-per-minute budget.
+
+    Shared by threads (wait) and coroutines (wait_async).
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _reserve(self):
+        """Takes the next free slot and returns the seconds until it starts."""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        waits = rate_limit_waits.get()
+        if delay > 0 and waits is not None:
+            waits.append((now, now + delay))
+        return delay
+
+
+class LatencyTracker:
+    """Recent successful call durations, to decide when to hedge."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds: float):
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def percentile(self, key, q: float) -> float | None:
+        """Returns the q-th percentile, None until there are enough samples."""
+        with self._lock:
+            samples = list(self._samples[key])
+        if len(samples) < self.min_samples:
+            return None
+        return percentile(samples, q)
+
+
+class RequestExecutor:
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        deadline: float = 180.0,
+        hedge: bool = False,
+        hedge_quantile: float = 95,
+        min_hedge_delay: float = 0.05,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        on_retry=None,
+        on_hedge=None,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        """
+        Args:
+            max_attempts: Attempts per call, including the first one.
+            base_delay: Backoff before the first retry, doubled for every further one.
+            max_delay: Upper bound of a single backoff.
+            deadline: Seconds after which no new attempt is started.
+            hedge: Whether to send a duplicate request when a call is slow.
+            hedge_quantile: The percentile of recent latencies after which to hedge.
+            min_hedge_delay: Never hedge earlier than this many seconds.
+            failure_threshold: Consecutive failures that open a model's circuit.
+            reset_timeout: Seconds an open circuit rejects calls.
+            on_retry: Called with (task, model) before every retry.
+            on_hedge: Called with (task, model, hedge_won) after every hedged call.
+            rate_limiter: Waited for before every request. The wait doesn't count
+                towards the latencies that decide when to hedge.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_retry = on_retry
+        self.on_hedge = on_hedge
+        self.rate_limiter = rate_limiter
+        self.latencies = LatencyTracker()
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[model]
+
+    def call(self, fn, model: str, task: str = "default", hedge: bool | None = None):
+        """Calls fn() with retries (and hedging) and returns its result."""
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            trial = self._check_circuit(model)
+            try:
+                result = self._attempt(fn, model, task, self.hedge if hedge is None else hedge)
+                self.breaker(model).record_success()
+                return result
+            except Exception as e:
+                delay = self._handle_failure(e, model, task, attempt, start)
+                time.sleep(delay)
+            finally:
+                if trial:
+                    # A cancelled trial (e.g. by a timeout around the call)
+                    # recorded nothing and would keep the circuit open for good
+                    self.breaker(model).release_trial()
+
+    async def call_async(self, fn, model: str, task: str = "default", hedge: bool | None = None):
+        """Like call(), fn() returns an awaitable."""
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            trial = self._check_circuit(model)
+            try:
+                result = await self._attempt_async(fn, model, task, self.hedge if hedge is None else hedge)
+                self.breaker(model).record_success()
+                return result
+            except Exception as e:
+                delay = self._handle_failure(e, model, task, attempt, start)
+                await asyncio.sleep(delay)
+            finally:
+                if trial:
+                    # A cancelled trial (e.g. by a timeout around the call)
+                    # recorded nothing and would keep the circuit open for good
+                    self.breaker(model).release_trial()
+
+    def _check_circuit(self, model):
+        """Returns whether the call is the trial of a half-open circuit."""
+        trial = self.breaker(model).begin()
+        if trial is None:
+            raise CircuitOpenError(f"{model} failed repeatedly, not calling it for a while")
+        return trial
+
+    def _handle_failure(self, error, model, task, attempt, start):
+        """Returns the backoff before the next attempt, or re-raises the error."""
+        if not is_retryable(error):
+            # The model answered, the request itself is wrong
+            self.breaker(model).record_success()
+            raise error
+        self.breaker(model).record_failure()
+        # Exponential backoff with full jitter
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if attempt == self.max_attempts - 1 or time.monotonic() - start + delay > self.deadline:
+            raise error
+        if self.on_retry is not None:
+            self.on_retry(task, model)
+        return delay
+
+    def _hedge_delay(self, model, task):
+        p = self.latencies.percentile((model, task), self.hedge_quantile)
+        return None if p is None else max(p, self.min_hedge_delay)
+
+    def _timed(self, fn, model, task):
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        start = time.monotonic()
+        result = fn()
+        self.latencies.observe((model, task), time.monotonic() - start)
+        return result
+
+    def _attempt(self, fn, model, task, hedge):
+        delay = self._hedge_delay(model, task) if hedge else None
+        if delay is None:
+            return self._timed(fn, model, task)
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=32, thread_name_prefix="hedge"
+                )
+        primary = self._pool.submit(self._timed, fn, model, task)
+        try:
+            return primary.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+        # The primary is slow: race it against a duplicate. The loser can't
+        # be cancelled mid-request, its result is dropped.
+        backup = self._pool.submit(self._timed, fn, model, task)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if self.on_hedge is not None:
+                        self.on_hedge(task, model, future is backup)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _attempt_async(self, fn, model, task, hedge):
+        async def timed():
+            if self.rate_limiter is not None:
+                await self.rate_limiter.wait_async()
+            start = time.monotonic()
+            result = await fn()
+            self.latencies.observe((model, task), time.monotonic() - start)
+            return result
+
+        delay = self._hedge_delay(model, task) if hedge else None
+        if delay is None:
+            return await timed()
+
+        primary = asyncio.ensure_future(timed())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        backup = asyncio.ensure_future(timed())
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if self.on_hedge is not None:
+                            self.on_hedge(task, model, future is backup)
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
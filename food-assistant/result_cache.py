@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+CACHE_DIR = os.getenv("GEMINI_CACHE_DIR", ".gemini_cache")
+MEMORY_MAX_BYTES = 32 * 1024 * 1024
+DISK_MAX_BYTES = 512 * 1024 * 1024
+
+
+def make_key(*parts) -> str:
+    """Builds a SHA-256 cache key from strings and bytes.
+
+    Every part is length-prefixed so that ("ab", "c") and ("a", "bc")
+    produce different keys.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(str(len(part)).encode("ascii") + b":")
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def canonical_json(data) -> str:
+    """Serializes data the same way regardless of key order or whitespace."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+class ResultCache:
+    """Two-tier (memory + disk) LRU cache for JSON-serializable results.
+
+    Both tiers are bounded by size in bytes. Disk entries are stored as one
+    JSON file per key; the file mtime is used as the LRU timestamp so the
+    eviction order survives restarts.
+    """
+
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        memory_max_bytes: int = MEMORY_MAX_BYTES,
+        disk_max_bytes: int = DISK_MAX_BYTES,
+    ):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.enabled = os.getenv("GEMINI_CACHE_DISABLED", "") == ""
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (value, size)
+        self._memory_bytes = 0
+        self._disk_bytes = None  # computed lazily on first disk write
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        """Returns the cached value, or None on a miss."""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key][0]
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            os.utime(path)  # mark as recently used
+            value = json.loads(raw)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, value, len(raw))
+        return value
+
+    def set(self, key: str, value):
+        if not self.enabled:
+            return
+
+        raw = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._remember(key, value, len(raw))
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            existing = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+        except OSError:
+            return  # the disk tier is best effort
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_bytes += len(raw) - existing
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for path, _, _ in self._disk_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+
+    def _remember(self, key, value, size):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        if size > self.memory_max_bytes:
+            return
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def _disk_entries(self):
+        """Yields (path, size, mtime) for every file in the disk tier."""
+        if not os.path.isdir(self.directory):
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _evict_disk(self):
+        # Evict down to 90% of the budget so we don't rescan on every write.
+        target = self.disk_max_bytes * 0.9
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
@@ -0,0 +1,84 @@
+"""Local checks of model answers, used to decide whether to escalate.
+
+Every check returns a list of problems, an empty list means the answer is
+accepted. The checks only catch answers that are wrong in a way we can see
+without the document: missing fields, items that don't add up to the total,
+dates that don't parse, products the model skipped.
+"""
+from invoice_store import parse_date
+
+
+# Receipts round every line, so the sum of the items is exact up to rounding
+SUM_TOLERANCE = 0.02
+# Shorter text answers are refusals or truncated
+MIN_TEXT_CHARS = 40
+
+
+def check_items(items) -> list[str]:
+    problems = []
+    for item in items:
+        if not str(item.get("item_name") or "").strip():
+            problems.append("item without a name")
+        if item.get("item_cost") is None:
+            problems.append(f"{item.get('item_name')!r} has no cost")
+    return problems
+
+
+def check_invoice(invoice) -> list[str]:
+    """Checks a SupermarketInvoice dict (or one with more fields per item)."""
+    if invoice is None:
+        return ["no parsable answer"]
+    problems = check_items(invoice.get("items") or [])
+    if not invoice.get("items"):
+        problems.append("no items")
+    if parse_date(invoice.get("date")) is None:
+        problems.append(f"unreadable date {invoice.get('date')!r}")
+    total_cost = invoice.get("total_cost")
+    if not total_cost:
+        problems.append("no total")
+    elif not problems:
+        items_sum = sum(item["item_cost"] for item in invoice["items"])
+        if abs(items_sum - total_cost) > SUM_TOLERANCE:
+            problems.append(f"items add up to {items_sum:.2f}, the total is {total_cost:.2f}")
+    return problems
+
+
+def check_page_chunk(chunk) -> list[str]:
+    """Checks the InvoicePages dict of a page chunk.
+
+    Date and total are optional there, and so are items: a page may hold
+    only the header or the totals. The item count is checked on the merged
+    invoice.
+    """
+    if chunk is None:
+        return ["no parsable answer"]
+    problems = check_items(chunk.get("items") or [])
+    if chunk.get("date") and parse_date(chunk["date"]) is None:
+        problems.append(f"unreadable date {chunk['date']!r}")
+    return problems
+
+
+def check_fused(analysis) -> list[str]:
+    if analysis is None:
+        return ["no parsable answer"]
+    problems = check_invoice(analysis)
+    if any(not str(item.get("health_note") or "").strip() for item in analysis.get("items") or []):
+        problems.append("item without a health note")
+    if not analysis.get("recipes"):
+        problems.append("no recipes")
+    return problems
+
+
+def check_classification(names, products) -> list[str]:
+    """Checks that every product in names got a category."""
+    if products is None:
+        return ["no parsable answer"]
+    classified = {product["item_name"] for product in products}
+    missing = [name for name in names if name not in classified]
+    return [f"unclassified {name!r}" for name in missing]
+
+
+def check_text(text) -> list[str]:
+    if len((text or "").strip()) < MIN_TEXT_CHARS:
+        return ["answer too short"]
+    return []
@@ -0,0 +1,235 @@
+"""Local store of calendar events, kept current with Calendar sync tokens.
+
+The first sync lists every event of the calendar, recurring events expanded
+into their instances, and keeps the nextSyncToken of the listing. Every
+later sync lists only what changed since, cancelled events included. The
+sync itself lives in google_api_service.py, this module only stores.
+
+Events are kept in SQLite, so a restarted agent continues where it left
+off, and in memory with an index on their start and end times, so a range
+query touches neither the network nor the disk. Every calendar has its own
+store, see get_store().
+"""
+import bisect
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zoneinfo
+
+
+STORE_PATH = os.getenv("CALENDAR_STORE_PATH", os.path.join(".calendar_cache", "events.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    start_ts REAL,
+    end_ts REAL,
+    event TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def timestamp(value: datetime.datetime) -> float:
+    """POSIX timestamp of a datetime, naive ones are UTC like in date_helper.py."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def event_bounds(event, time_zone: str | None = None) -> tuple[float, float]:
+    """Returns the start and end of an event as POSIX timestamps.
+
+    All-day events only have dates, they start at midnight in the time zone
+    of the calendar (UTC if it isn't known).
+    """
+    bounds = []
+    for when in (event["start"], event["end"]):
+        if "dateTime" in when:
+            value = datetime.datetime.fromisoformat(when["dateTime"].replace("Z", "+00:00"))
+        else:
+            zone = zoneinfo.ZoneInfo(time_zone) if time_zone else datetime.timezone.utc
+            value = datetime.datetime.fromisoformat(when["date"]).replace(tzinfo=zone)
+        bounds.append(timestamp(value))
+    return bounds[0], bounds[1]
+
+
+class EventIndex:
+    """Events sorted by start, for overlap queries.
+
+    An event overlaps [time_min, time_max) if it starts before time_max and
+    ends after time_min. It can't start earlier than the longest event lasts
+    before time_min, so a query bisects the sorted starts down to that and
+    only checks the ends of the events in between.
+    """
+
+    def __init__(self):
+        self._starts = []  # (start, id), sorted
+        self._events = {}  # id -> (start, end, event)
+        # Only grows, a removed long event leaves a wider search than needed
+        self._max_duration = 0.0
+
+    def __len__(self):
+        return len(self._events)
+
+    def add(self, event_id, start, end, event):
+        self.remove(event_id)
+        bisect.insort(self._starts, (start, event_id))
+        self._events[event_id] = (start, end, event)
+        self._max_duration = max(self._max_duration, end - start)
+
+    def remove(self, event_id):
+        entry = self._events.pop(event_id, None)
+        if entry is not None:
+            del self._starts[bisect.bisect_left(self._starts, (entry[0], event_id))]
+
+    def overlapping(
+        self, time_min: float, time_max: float | None, limit: int | None = None, starts: bool = False
+    ) -> list:
+        """Returns the events overlapping [time_min, time_max), ordered by start.
+
+        With starts, returns (start, event) tuples.
+        """
+        low = bisect.bisect_left(self._starts, (time_min - self._max_duration,))
+        high = len(self._starts) if time_max is None else bisect.bisect_left(self._starts, (time_max,))
+        events = []
+        for i in range(low, high):
+            start, end, event = self._events[self._starts[i][1]]
+            if end > time_min:
+                events.append((start, event) if starts else event)
+                if limit is not None and len(events) >= limit:
+                    break
+        return events
+
+
+class CalendarStore:
+    def __init__(self, path: str = STORE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # Held by whoever syncs the store, see google_api_service.py
+        self.sync_lock = threading.Lock()
+        # time.monotonic() of the last sync in this process
+        self.synced_at = None
+        self._index = EventIndex()
+        for event_id, start, end, event in self._connection.execute("SELECT * FROM events"):
+            self._index.add(event_id, start, end, json.loads(event))
+
+    @property
+    def sync_token(self) -> str | None:
+        """The nextSyncToken of the last sync, None before the first one."""
+        return self._state("sync_token")
+
+    @property
+    def time_zone(self) -> str | None:
+        return self._state("time_zone")
+
+    def replace(self, events, sync_token: str, time_zone: str | None):
+        """Replaces everything with the result of a full sync."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM events")
+            self._index = EventIndex()
+            self._upsert(events, time_zone)
+            self._set_state(sync_token=sync_token, time_zone=time_zone or "")
+        self.synced_at = time.monotonic()
+
+    def apply(self, events, sync_token: str):
+        """Applies the changed events of an incremental sync, cancelled ones are removed."""
+        cancelled = [event["id"] for event in events if event.get("status") == "cancelled"]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM events WHERE id = ?", [(event_id,) for event_id in cancelled]
+            )
+            for event_id in cancelled:
+                self._index.remove(event_id)
+            self._upsert(
+                [event for event in events if event.get("status") != "cancelled"],
+                self._state("time_zone", locked=True),
+            )
+            self._set_state(sync_token=sync_token)
+        self.synced_at = time.monotonic()
+
+    def query(
+        self,
+        time_min: datetime.datetime,
+        time_max: datetime.datetime | None = None,
+        limit: int | None = None,
+        starts: bool = False,
+    ) -> list:
+        """Returns the events overlapping [time_min, time_max), ordered by start.
+
+        The events are the stored objects, don't modify them. With starts,
+        returns (start timestamp, event) tuples, e.g. to merge calendars.
+        """
+        with self._lock:
+            return self._index.overlapping(
+                timestamp(time_min), timestamp(time_max) if time_max else None, limit, starts
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._index)
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM events")
+            self._connection.execute("DELETE FROM sync_state")
+            self._index = EventIndex()
+        self.synced_at = None
+
+    def close(self):
+        self._connection.close()
+
+    def _upsert(self, events, time_zone):
+        rows = []
+        for event in events:
+            start, end = event_bounds(event, time_zone or None)
+            self._index.add(event["id"], start, end, event)
+            rows.append((event["id"], start, end, json.dumps(event)))
+        self._connection.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)", rows)
+
+    def _state(self, key, locked=False):
+        if not locked:
+            with self._lock:
+                return self._state(key, locked=True)
+        row = self._connection.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row and row[0] else None
+
+    def _set_state(self, **values):
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()],
+        )
+
+
+_stores = {}  # calendar id -> CalendarStore
+_store_lock = threading.Lock()
+
+
+def store_path(calendar_id: str) -> str:
+    """STORE_PATH for the primary calendar, a file next to it for every other one."""
+    if calendar_id == "primary":
+        return STORE_PATH
+    digest = hashlib.sha1(calendar_id.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.dirname(STORE_PATH), f"events-{digest}.sqlite")
+
+
+def get_store(calendar_id: str = "primary") -> CalendarStore:
+    """Returns the process-wide store of a calendar, opened on first use."""
+    store = _stores.get(calendar_id)
+    if store is not None:
+        return store
+    with _store_lock:
+        if calendar_id not in _stores:
+            _stores[calendar_id] = CalendarStore(store_path(calendar_id))
+        return _stores[calendar_id]
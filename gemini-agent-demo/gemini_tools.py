@@ -1,11 +1,5 @@
 from typing import Dict
 
-from google import genai
-from google.genai import types
-
-from dotenv import load_dotenv
-load_dotenv()
-
 import google_api_service
 
 
@@ -33,16 +27,27 @@ def get_calendar_events(
     return event_details
 
 
-# Configure the client and model
-client = genai.Client()
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from google import genai
+    from google.genai import types
+
+    load_dotenv()
 
-config = types.GenerateContentConfig(tools=[get_calendar_events])
+    # Configure the client and model, the client retries 429 and 5xx with backoff
+    client = genai.Client(
+        http_options=types.HttpOptions(
+            retry_options=types.HttpRetryOptions(attempts=5, initial_delay=1.0, max_delay=30.0)
+        )
+    )
+
+    config = types.GenerateContentConfig(tools=[get_calendar_events])
 
-# Make the request
-response = client.models.generate_content(
-    model="gemini-2.5-flash-preview-04-17",
-    contents="Get this week's meetings",
-    config=config,
-)
+    # Make the request
+    response = client.models.generate_content(
+        model="gemini-2.5-flash-preview-04-17",
+        contents="Get this week's meetings",
+        config=config,
+    )
 
-print(response.text)
+    print(response.text)
@@ -0,0 +1,165 @@
+"""Local SQLite store of email metadata, kept current with the Gmail history.
+
+The first sync stores the newest messages with the mailbox's historyId.
+Every later sync asks users.history.list for what changed since that id
+and applies it, so listing the inbox again costs one small request. The
+sync itself lives in google_api_service.py, this module only stores.
+
+Only what the email listing shows is stored: id, thread, date, sender,
+subject, snippet and labels. Email text is fetched when it is read.
+"""
+import os
+import sqlite3
+import threading
+
+
+STORE_PATH = os.getenv("GMAIL_STORE_PATH", os.path.join(".gmail_cache", "messages.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    internal_date INTEGER,
+    sender TEXT,
+    subject TEXT,
+    snippet TEXT,
+    label_ids TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (internal_date DESC);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class GmailStore:
+    def __init__(self, path: str = STORE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @property
+    def history_id(self) -> str | None:
+        """The historyId the store is current with, None before the first sync."""
+        return self._state("history_id")
+
+    @property
+    def complete(self) -> bool:
+        """Whether the store holds every message, not only the newest ones."""
+        return self._state("complete") == "1"
+
+    @property
+    def window_start(self) -> int:
+        """The internalDate of the oldest message of the last full sync."""
+        return int(self._state("window_start") or 0)
+
+    def replace(self, messages, history_id: str, complete: bool):
+        """Replaces everything with the result of a full sync."""
+        window_start = min((message["internal_date"] for message in messages), default=0)
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM messages")
+            self._insert(messages)
+            self._set_state(
+                history_id=history_id, complete="1" if complete else "0", window_start=window_start
+            )
+
+    def apply(self, upserts, deletes, history_id: str):
+        """Applies the changes of an incremental sync.
+
+        Messages older than the window of the last full sync are ignored
+        (e.g. an old email taken out of the trash), unless the store is
+        complete: the store only ever holds the newest messages without gaps.
+        """
+        if not self.complete:
+            window_start = self.window_start
+            upserts = [message for message in upserts if message["internal_date"] >= window_start]
+        with self._lock, self._connection:
+            if deletes:
+                self._connection.executemany(
+                    "DELETE FROM messages WHERE id = ?", [(message_id,) for message_id in deletes]
+                )
+            self._insert(upserts)
+            self._set_state(history_id=history_id)
+
+    def latest(self, limit: int) -> list[dict]:
+        """Returns the newest messages, newest first."""
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT id, thread_id, internal_date, sender, subject, snippet, label_ids
+                FROM messages ORDER BY internal_date DESC LIMIT ?
+                """,
+                (limit,),
+            ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "thread_id": row[1],
+                "internal_date": row[2],
+                "from": row[3],
+                "subject": row[4],
+                "snippet": row[5],
+                "label_ids": row[6].split(",") if row[6] else [],
+            }
+            for row in rows
+        ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM messages").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM messages")
+            self._connection.execute("DELETE FROM sync_state")
+
+    def close(self):
+        self._connection.close()
+
+    def _insert(self, messages):
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    message["id"],
+                    message.get("thread_id"),
+                    message["internal_date"],
+                    message.get("from"),
+                    message.get("subject"),
+                    message.get("snippet"),
+                    ",".join(message.get("label_ids", [])),
+                )
+                for message in messages
+            ],
+        )
+
+    def _state(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM sync_state WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, **values):
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()],
+        )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> GmailStore:
+    """Returns the process-wide store, opened on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = GmailStore()
+    return _store
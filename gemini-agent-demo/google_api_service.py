@@ -1,14 +1,18 @@
 import base64
+import concurrent.futures
 import datetime
-import os.path
+import email.utils
+import heapq
+import itertools
+import operator
+import threading
+import time
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+import calendar_store, email_text, gmail_store
 from date_helper import convert_strings_to_datetime
+from google_clients import CredentialsProvider, ServiceCache
 
 
 # If modifying these scopes, delete the file token.json.
@@ -18,69 +22,109 @@ SCOPES = [
 ]
 
 
-def _get_google_oauth_creds():
-    """Get the OAuth credentials for the Google APIs."""
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
-
-    return creds
+# Answer event queries from the local store, synced with Calendar sync tokens
+USE_CALENDAR_STORE = True
+# Queries within this many seconds of the last sync don't ask Calendar for changes
+CALENDAR_SYNC_INTERVAL = 30.0
+# Events per page of events.list, the API allows up to 2500
+CALENDAR_PAGE_SIZE = 2500
+# Calendars fetched at once when get_calendar_events includes all of them
+MAX_CONCURRENT_CALENDARS = 16
+
+# Message ids per page of messages.list, the API allows up to 500
+LIST_PAGE_SIZE = 500
+# Messages per batch request, Gmail allows 100 but throttles large batches
+BATCH_SIZE = 50
+MAX_CONCURRENT_BATCHES = 4
+MAX_BATCH_ATTEMPTS = 3
+BATCH_RETRY_DELAY = 1.0  # seconds, doubled for every further attempt
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# What the email listing fetches, the text is fetched per message with get_email_body()
+METADATA_HEADERS = ["From", "Subject"]
+METADATA_FIELDS = "id,threadId,labelIds,snippet,internalDate,payload/headers"
+# Answer the email listing from the local store, synced with users.history.list
+USE_GMAIL_STORE = True
+# Messages the first sync stores, a listing that asks for more syncs more
+FULL_SYNC_MESSAGES = 200
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+# messages.list leaves these out, so the store does too
+HIDDEN_LABELS = {"SPAM", "TRASH"}
+# Hand the agents compacted email text, see email_text.py, instead of the raw body
+COMPACT_EMAILS = True
+# Estimated tokens of text per email, the rest is cut
+EMAIL_TOKEN_BUDGET = 1000
+
+# Loaded once and refreshed in the background, see google_clients.py
+credentials = CredentialsProvider(SCOPES)
+services = ServiceCache(credentials.get)
+
+_pool = None
+_fanout_pool = None
+_pool_lock = threading.Lock()
+_calendar_list = None  # (time.monotonic() when listed, calendar ids)
+_calendar_list_lock = threading.Lock()
+_sync_lock = threading.Lock()
+_emails_synced_from = None  # time.monotonic() when the last successful sync started
 
 
 def get_calendar_events(
     time_min: str = None,
     time_max: str = None,
     max_items: int = 200,
+    all_calendars: bool = False,
 ):
     """Fetches calendar events within a specified time window.
 
+    The events are looked up in a local store per calendar (see
+    calendar_store.py), which asks Calendar for the changes since the last
+    sync at most every CALENDAR_SYNC_INTERVAL seconds.
+
+    With all_calendars, every calendar in the user's calendar list is
+    fetched, MAX_CONCURRENT_CALENDARS at a time, and the events are merged
+    by start time. The call takes about as long as the slowest calendar. A
+    calendar that can't be read (e.g. a 403 on a shared calendar) is left
+    out and listed under "failed_calendars".
+
     Args:
         time_min: Optional start time in ISO format (e.g. "2025-02-20T10:00:00Z")
         time_max: Optional end time in ISO format. Defaults to current time if not provided.
         max_items: Maximum number of items to return.
+        all_calendars: Whether to include shared and other calendars, not only the primary one.
 
     Returns:
         A dictionary containing the list of events or an error message.
     """
 
     try:
-        creds = _get_google_oauth_creds()
-        service = build("calendar", "v3", credentials=creds)
-
-        # Call the Calendar API
         time_min, time_max = convert_strings_to_datetime(time_min, time_max)
+        max_items = int(max_items if max_items else 200)
 
-        events_result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=time_min.strftime("%Y-%m-%dT%H:%M:%SZ"),
-                timeMax=time_max.strftime("%Y-%m-%dT%H:%M:%SZ") if time_max else None,
-                maxResults=int(max_items if max_items else 200),
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-        )
-
-        events = events_result.get("items", [])
+        failed = {}  # calendar id -> error
+        if not all_calendars:
+            events = [event for _, event in _calendar_events("primary", time_min, time_max, max_items)]
+        else:
+            futures = {
+                calendar_id: _calendar_pool().submit(_calendar_events, calendar_id, time_min, time_max, max_items)
+                for calendar_id in _calendar_ids()
+            }
+            results = []
+            for calendar_id, future in futures.items():
+                try:
+                    results.append(future.result())
+                except Exception as error:
+                    failed[calendar_id] = str(error)
+            # Every calendar is ordered by start already, a k-way merge keeps
+            # that and stops after max_items instead of sorting them all
+            merged = heapq.merge(*results, key=operator.itemgetter(0))
+            events = [event for _, event in itertools.islice(merged, max_items)]
 
         if not events:
+            if failed:
+                return {"status": "error", "message": "No events found.", "failed_calendars": failed}
             return {"status": "error", "message": "No upcoming events found."}
 
+        if failed:
+            return {"status": "success", "events": events, "failed_calendars": failed}
         return {"status": "success", "events": events}
 
     except HttpError as error:
@@ -95,72 +139,463 @@ def get_calendar_events(
         }
 
 
-def get_emails(max_items: int = 10):
+def _calendar_pool():
+    global _fanout_pool
+    with _pool_lock:
+        if _fanout_pool is None:
+            _fanout_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENT_CALENDARS, thread_name_prefix="calendar"
+            )
+        return _fanout_pool
+
+
+def _calendar_ids():
+    """Ids of the calendars in the user's calendar list, listed again every CALENDAR_SYNC_INTERVAL."""
+    global _calendar_list
+    with _calendar_list_lock:
+        if _calendar_list is None or time.monotonic() - _calendar_list[0] >= CALENDAR_SYNC_INTERVAL:
+            resource = services.get("calendar", "v3").calendarList()
+            calendar_ids, page_token = [], None
+            while True:
+                response = resource.list(pageToken=page_token).execute(
+                    num_retries=MAX_BATCH_ATTEMPTS - 1
+                )
+                # The primary calendar goes by "primary", like everywhere else
+                calendar_ids += [
+                    "primary" if item.get("primary") else item["id"]
+                    for item in response.get("items", [])
+                ]
+                page_token = response.get("nextPageToken")
+                if not page_token:
+                    break
+            _calendar_list = (time.monotonic(), calendar_ids)
+        return _calendar_list[1]
+
+
+def _calendar_events(calendar_id, time_min, time_max, max_items):
+    """Returns the events of a calendar in the window as (start timestamp, event), ordered by start."""
+    if USE_CALENDAR_STORE:
+        return _stored_calendar_events(calendar_id, time_min, time_max, max_items)
+
+    # Call the Calendar API, page by page until max_items
+    resource = services.get("calendar", "v3").events()
+    events, page_token = [], None
+    while len(events) < max_items:
+        response = resource.list(
+            calendarId=calendar_id,
+            timeMin=time_min.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            timeMax=time_max.strftime("%Y-%m-%dT%H:%M:%SZ") if time_max else None,
+            maxResults=min(max_items - len(events), CALENDAR_PAGE_SIZE),
+            singleEvents=True,
+            orderBy="startTime",
+            pageToken=page_token,
+        ).execute(num_retries=MAX_BATCH_ATTEMPTS - 1)
+        time_zone = response.get("timeZone")
+        events += [
+            (calendar_store.event_bounds(event, time_zone)[0], event)
+            for event in response.get("items", [])
+        ]
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+    return events[:max_items]
+
+
+def _list_calendar_events(calendar_id, sync_token=None):
+    """Lists every event of a calendar, or the events changed since sync_token.
+
+    Returns:
+        (events, nextSyncToken, the time zone of the calendar)
+    """
+    resource = services.get("calendar", "v3").events()
+    events, page_token = [], None
+    while True:
+        response = resource.list(
+            calendarId=calendar_id,
+            singleEvents=True,
+            maxResults=CALENDAR_PAGE_SIZE,
+            syncToken=sync_token,
+            pageToken=page_token,
+        ).execute(num_retries=MAX_BATCH_ATTEMPTS - 1)
+        events += response.get("items", [])
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            # Only the last page has the sync token
+            return events, response["nextSyncToken"], response.get("timeZone")
+
+
+def _sync_calendar(store, calendar_id):
+    """Brings the store up to date, from scratch if it has no valid sync token."""
+    if store.sync_token is not None:
+        try:
+            events, sync_token, _ = _list_calendar_events(calendar_id, store.sync_token)
+            store.apply(events, sync_token)
+            return
+        except HttpError as error:
+            # 410 Gone: the sync token expired, start over
+            if error.resp.status != 410:
+                raise
+    events, sync_token, time_zone = _list_calendar_events(calendar_id)
+    store.replace(events, sync_token, time_zone)
+
+
+def _stored_calendar_events(calendar_id, time_min, time_max, max_items):
+    """Syncs the store of a calendar if needed, returns its events in the window like _calendar_events."""
+    store = calendar_store.get_store(calendar_id)
+    with store.sync_lock:
+        if store.synced_at is None or time.monotonic() - store.synced_at >= CALENDAR_SYNC_INTERVAL:
+            _sync_calendar(store, calendar_id)
+    return store.query(time_min, time_max, max_items, starts=True)
+
+
+def _message_text(payload):
+    """Returns the text of a message payload for the agents."""
+    if COMPACT_EMAILS:
+        return email_text.message_text(payload, EMAIL_TOKEN_BUDGET)
+    return _raw_message_text(payload)
+
+
+def _raw_message_text(payload):
+    """Returns the plain text of a message payload, or its HTML if there is no plain text."""
+    if "parts" in payload:
+        plain_text, html_text = None, None
+        for p in payload["parts"]:
+            if p["mimeType"] == "text/plain":
+                plain_text = base64.urlsafe_b64decode(p["body"]["data"]).decode(
+                    "utf-8"
+                )
+            if p["mimeType"] == "text/html":
+                html_text = base64.urlsafe_b64decode(p["body"]["data"]).decode(
+                    "utf-8"
+                )
+
+        if plain_text:
+            return plain_text
+        return html_text  # use HTML as fallback if no text is available
+    # no parts, use body data directly, this is possibly HTML
+    return base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
+
+
+def _parse_message(result):
+    parsed_message = {}
+    parsed_message["id"] = result["id"]
+    if "threadId" in result:
+        parsed_message["thread_id"] = result["threadId"]
+    parsed_message["snippet"] = result["snippet"]
+    parsed_message["date"] = str(
+        datetime.datetime.fromtimestamp(int(result["internalDate"]) / 1000.0)
+    )
+
+    payload = result["payload"]
+
+    if "headers" in payload:
+        for values in payload["headers"]:
+            if values["name"] == "From":
+                parsed_message["from"] = values["value"]
+            if values["name"] == "Subject":
+                parsed_message["subject"] = values["value"]
+
+    # Metadata-only messages have no body
+    if "parts" in payload or "data" in payload.get("body", {}):
+        text = _message_text(payload)
+        if text:
+            parsed_message["text"] = text
+
+    return parsed_message
+
+
+def _list_message_ids(max_items):
+    """Yields the ids of the newest max_items messages, one page at a time."""
+    service = services.get("gmail", "v1")
+    page_token = None
+    remaining = max_items
+    while remaining > 0:
+        results = (
+            service.users()
+            .messages()
+            .list(userId="me", maxResults=min(remaining, LIST_PAGE_SIZE), pageToken=page_token)
+            .execute(num_retries=MAX_BATCH_ATTEMPTS - 1)
+        )
+        ids = [message["id"] for message in results.get("messages", [])][:remaining]
+        if ids:
+            yield ids
+        remaining -= len(ids)
+        page_token = results.get("nextPageToken")
+        if not ids or not page_token:
+            return
+
+
+def _get_messages(ids, include_body=False, not_found=None):
+    """Fetches messages with Gmail batch requests, returns {id: message}.
+
+    Without include_body only the headers in METADATA_HEADERS and the
+    fields in METADATA_FIELDS are requested.
+
+    Messages that fail with a transient error (e.g. 429 when a batch is too
+    fast for the per-user quota) are retried in another batch, up to
+    MAX_BATCH_ATTEMPTS times, and left out after that. Messages that don't
+    exist (anymore) are left out too, and added to not_found if given.
+    """
+    # One client per thread. Every users()/messages() call builds a new
+    # resource object, which costs more than serializing the request
+    resource = services.get("gmail", "v1").users().messages()
+    if include_body:
+        options = {"format": "full"}
+    else:
+        options = {
+            "format": "metadata",
+            "metadataHeaders": METADATA_HEADERS,
+            "fields": METADATA_FIELDS,
+        }
+    messages = {}
+    for attempt in range(MAX_BATCH_ATTEMPTS):
+        if attempt:
+            time.sleep(BATCH_RETRY_DELAY * 2 ** (attempt - 1))
+        failed = []
+
+        def collect(request_id, response, exception):
+            if exception is None:
+                messages[request_id] = response
+            elif isinstance(exception, HttpError) and exception.resp.status in RETRYABLE_STATUS_CODES:
+                failed.append(request_id)
+            elif isinstance(exception, HttpError) and exception.resp.status == 404:
+                # Deleted since it was listed is fine, anything else isn't
+                if not_found is not None:
+                    not_found.add(request_id)
+            else:
+                raise exception
+
+        batch = services.new_batch_http_request("gmail", "v1", callback=collect)
+        for message_id in ids:
+            batch.add(
+                resource.get(userId="me", id=message_id, **options),
+                request_id=message_id,
+            )
+        batch.execute()
+        if not failed:
+            break
+        ids = failed
+    return messages
+
+
+def _batch_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENT_BATCHES, thread_name_prefix="gmail-batch"
+            )
+        return _pool
+
+
+def _fetch_messages(ids, include_body=False, not_found=None):
+    """Fetches messages in batches of BATCH_SIZE, several at once. Returns futures of {id: message}."""
+    return [
+        _batch_pool().submit(_get_messages, ids[i:i + BATCH_SIZE], include_body, not_found)
+        for i in range(0, len(ids), BATCH_SIZE)
+    ]
+
+
+def _list_and_fetch(max_items, include_body=False):
+    """Lists the newest messages and fetches them, returns (ids, {id: message}).
+
+    The batches of a page are fetched while the next page is listed.
+    """
+    ids, batches = [], []
+    for page in _list_message_ids(max_items):
+        ids += page
+        batches += _fetch_messages(page, include_body)
+    results = {}
+    for batch in batches:
+        results.update(batch.result())
+    return ids, results
+
+
+def _store_record(result):
+    """The row of a metadata-only message in the store."""
+    parsed = _parse_message(result)
+    return {
+        "id": result["id"],
+        "thread_id": result.get("threadId"),
+        "internal_date": int(result["internalDate"]),
+        "from": parsed.get("from"),
+        "subject": parsed.get("subject"),
+        "snippet": result.get("snippet"),
+        "label_ids": result.get("labelIds", []),
+    }
+
+
+def _listed_message(record):
+    """A stored message, in the shape _parse_message() returns."""
+    parsed_message = {
+        "id": record["id"],
+        "thread_id": record["thread_id"],
+        "snippet": record["snippet"],
+        "date": str(datetime.datetime.fromtimestamp(record["internal_date"] / 1000.0)),
+    }
+    for key in ("from", "subject"):
+        if record[key] is not None:
+            parsed_message[key] = record[key]
+    return parsed_message
+
+
+def _full_sync(store, depth):
+    """Replaces the store with the newest depth messages."""
+    # The historyId comes first: changes made while listing are applied by the next sync
+    profile = (
+        services.get("gmail", "v1")
+        .users()
+        .getProfile(userId="me")
+        .execute(num_retries=MAX_BATCH_ATTEMPTS - 1)
+    )
+    ids, results = _list_and_fetch(depth)
+    store.replace(
+        [_store_record(results[message_id]) for message_id in ids if message_id in results],
+        profile["historyId"],
+        complete=len(ids) < depth,
+    )
+
+
+def _incremental_sync(store):
+    """Applies the changes since the store's historyId.
+
+    Raises HttpError 404 if Gmail no longer has the history since then
+    (it keeps about a week of it).
+    """
+    history = services.get("gmail", "v1").users().history()
+    changed, deleted = set(), set()
+    history_id, page_token = store.history_id, None
+    while True:
+        response = history.list(
+            userId="me",
+            startHistoryId=store.history_id,
+            historyTypes=HISTORY_TYPES,
+            maxResults=LIST_PAGE_SIZE,
+            pageToken=page_token,
+        ).execute(num_retries=MAX_BATCH_ATTEMPTS - 1)
+        for record in response.get("history", []):
+            # Added or relabelled messages are fetched again, only the last change counts
+            for key in ("messagesAdded", "labelsAdded", "labelsRemoved"):
+                for change in record.get(key, []):
+                    changed.add(change["message"]["id"])
+                    deleted.discard(change["message"]["id"])
+            for change in record.get("messagesDeleted", []):
+                deleted.add(change["message"]["id"])
+                changed.discard(change["message"]["id"])
+        history_id = response.get("historyId", history_id)
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+    results, not_found = {}, set()
+    for batch in _fetch_messages(sorted(changed), not_found=not_found):
+        results.update(batch.result())
+    upserts = []
+    for message_id in changed:
+        result = results.get(message_id)
+        if result is not None and not HIDDEN_LABELS & set(result.get("labelIds", [])):
+            upserts.append(_store_record(result))
+        elif result is not None or message_id in not_found:
+            deleted.add(message_id)  # moved to spam or trash, or deleted since
+    if len(upserts) + len(deleted & changed) < len(changed):
+        # Some fetches failed for good, stay at the old historyId to fetch them next time
+        history_id = store.history_id
+    store.apply(upserts, deleted, history_id)
+
+
+def _stored_emails(max_items):
+    """Syncs the store and returns the newest max_items messages from it.
+
+    The first call stores at least FULL_SYNC_MESSAGES messages, later calls
+    only fetch what changed. A store that has fewer messages than asked for
+    (and not because the mailbox has no more) is synced again from scratch.
+    Concurrent calls share a sync: one that started after a call came in
+    is as good as its own.
+    """
+    global _emails_synced_from
+    store = gmail_store.get_store()
+    requested = time.monotonic()
+    with _sync_lock:
+        started = time.monotonic()
+        if store.history_id is None or (store.count() < max_items and not store.complete):
+            _full_sync(store, max(max_items, FULL_SYNC_MESSAGES))
+            _emails_synced_from = started
+        elif _emails_synced_from is None or _emails_synced_from < requested:
+            try:
+                _incremental_sync(store)
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                _full_sync(store, max(max_items, FULL_SYNC_MESSAGES))
+            _emails_synced_from = started
+    return [_listed_message(record) for record in store.latest(max_items)]
+
+
+def get_emails(max_items: int = 10, include_body: bool = False):
     """Fetches emails.
 
+    Messages are listed page by page and fetched in batch requests of
+    BATCH_SIZE, several batches at once, while the next page is listed.
+    By default only the id, sender, subject, date and snippet of every
+    message are fetched, get_email_body() fetches the text of one.
+
+    Those listings are answered from a local store (see gmail_store.py),
+    which is brought up to date with the Gmail history on every call.
+
     Args:
         max_items: Maximum number of items to return.
+        include_body: Whether to fetch the full messages, including their text.
 
     Returns:
         A dictionary containing the list of emails or an error message.
     """
     try:
-        # Call the Gmail API
-        creds = _get_google_oauth_creds()
-        service = build("gmail", "v1", credentials=creds)
-        results = service.users().messages().list(userId="me", maxResults=10).execute()
+        max_items = int(max_items if max_items else 10)
+        if USE_GMAIL_STORE and not include_body:
+            parsed_messages = _stored_emails(max_items)
+        else:
+            # Call the Gmail API
+            ids, results = _list_and_fetch(max_items, include_body)
+            parsed_messages = [
+                _parse_message(results[message_id]) for message_id in ids if message_id in results
+            ]
 
-        messages = results.get("messages", [])
-        if not messages:
+        if not parsed_messages:
             return {"status": "error", "message": "No messages found."}
 
-        parsed_messages = []
+        return {"status": "success", "messages": parsed_messages}
 
-        for message in messages:
-            result = (
-                service.users().messages().get(userId="me", id=message["id"]).execute()
-            )
+    except HttpError as error:
+        return {
+            "status": "error",
+            "message": f"An error occurred: {error}.",
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"An unexpected error occurred: {e}.",
+        }
 
-            parsed_message = {}
-            parsed_message["snippet"] = result["snippet"]
-            parsed_message["date"] = str(
-                datetime.datetime.fromtimestamp(int(result["internalDate"]) / 1000.0)
-            )
 
-            payload = result["payload"]
-
-            if "headers" in payload:
-                for values in payload["headers"]:
-                    if values["name"] == "From":
-                        parsed_message["from"] = values["value"]
-                    if values["name"] == "Subject":
-                        parsed_message["subject"] = values["value"]
-
-            # Get the email text
-            if "parts" in payload:
-                plain_text, html_text = None, None
-                for p in payload["parts"]:
-                    if p["mimeType"] == "text/plain":
-                        plain_text = base64.urlsafe_b64decode(p["body"]["data"]).decode(
-                            "utf-8"
-                        )
-                    if p["mimeType"] == "text/html":
-                        html_text = base64.urlsafe_b64decode(p["body"]["data"]).decode(
-                            "utf-8"
-                        )
-
-                if plain_text:
-                    parsed_message["text"] = plain_text
-                elif html_text:  # use HTML as fallback if no text is available
-                    parsed_message["text"] = html_text
-            else:
-                # no parts, use body data directly, this is possibly HTML
-                data = base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
-                parsed_message["text"] = data
+def get_email_body(message_id: str):
+    """Fetches the text of one email.
 
-            parsed_messages.append(parsed_message)
+    Args:
+        message_id: The id of the message, as returned by get_emails().
 
-        return {"status": "success", "messages": parsed_messages}
+    Returns:
+        A dictionary containing the text of the email or an error message.
+    """
+    try:
+        service = services.get("gmail", "v1")
+        result = (
+            service.users()
+            .messages()
+            .get(userId="me", id=message_id, format="full", fields="id,payload")
+            .execute()
+        )
+        text = _message_text(result["payload"]) or ""
+        return {"status": "success", "id": result["id"], "text": text}
 
     except HttpError as error:
         return {
@@ -174,6 +609,86 @@ def get_emails(max_items: int = 10):
         }
 
 
+def get_email_thread(thread_id: str):
+    """Fetches an email thread as one record, without the quoted history of every reply.
+
+    Args:
+        thread_id: The thread id of a message, as returned by get_emails().
+
+    Returns:
+        A dictionary with the subject, participants and size of the thread,
+        its latest message in full and only the new text of every earlier
+        message, oldest first, or an error message.
+    """
+    try:
+        service = services.get("gmail", "v1")
+        result = (
+            service.users()
+            .threads()
+            .get(userId="me", id=thread_id, format="full", fields="id,messages")
+            .execute()
+        )
+        messages = [
+            message for message in result.get("messages", [])
+            if not HIDDEN_LABELS.intersection(message.get("labelIds", []))
+        ]
+        if not messages:
+            return {"status": "error", "message": "No messages found."}
+        messages.sort(key=lambda message: int(message["internalDate"]))
+
+        # Without the budget first, a quote that was cut wouldn't be found in later replies
+        texts = [email_text.message_text(message["payload"], None) or "" for message in messages]
+        new_texts = email_text.new_content(texts)
+        participants = {}  # lowercase address -> "Name <address>"
+        for message in messages:
+            headers = _headers(message["payload"])
+            addresses = [headers.get(name, "") for name in ("from", "to", "cc")]
+            for name, address in email.utils.getaddresses(addresses):
+                if address and address.lower() not in participants:
+                    participants[address.lower()] = f"{name} <{address}>" if name else address
+
+        return {
+            "status": "success",
+            "thread_id": result["id"],
+            "subject": _headers(messages[0]["payload"]).get("subject", ""),
+            "participants": list(participants.values()),
+            "message_count": len(messages),
+            "latest": {
+                **_thread_message(messages[-1]),
+                "text": email_text.truncate(texts[-1], EMAIL_TOKEN_BUDGET),
+            },
+            "earlier_messages": [
+                {**_thread_message(message), "new_text": email_text.truncate(new_text, EMAIL_TOKEN_BUDGET)}
+                for message, new_text in zip(messages[:-1], new_texts[:-1])
+            ],
+        }
+
+    except HttpError as error:
+        return {
+            "status": "error",
+            "message": f"An error occurred: {error}.",
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"An unexpected error occurred: {e}.",
+        }
+
+
+def _headers(payload):
+    """The headers of a message payload by lowercase name."""
+    return {header["name"].lower(): header["value"] for header in payload.get("headers", [])}
+
+
+def _thread_message(message):
+    """Id, sender and date of a message of a thread."""
+    return {
+        "id": message["id"],
+        "from": _headers(message["payload"]).get("from", ""),
+        "date": str(datetime.datetime.fromtimestamp(int(message["internalDate"]) / 1000.0)),
+    }
+
+
 if __name__ == "__main__":
     import json
 
@@ -5,7 +5,7 @@ from . import google_api_service
 
 def get_emails(max_items: int) -> Dict:
     """
-    Fetches gmail messages.
+    Fetches gmail messages: id, thread id, sender, subject, date and a short snippet, without the text.
 
     Args:
         max_items: The maximum number of messages to retrieve from the inbox.
@@ -17,7 +17,35 @@ def get_emails(max_items: int) -> Dict:
     return emails
 
 
-def get_calendar_events(date_time_min: str, date_time_max: str, max_items: int) -> Dict:
+def get_email_body(message_id: str) -> Dict:
+    """
+    Fetches the text of one gmail message.
+
+    Args:
+        message_id: The id of the message, as returned by get_emails.
+
+    Returns:
+        A dictionary containing the text of the message or an error message.
+    """
+    return google_api_service.get_email_body(message_id)
+
+
+def get_email_thread(thread_id: str) -> Dict:
+    """
+    Fetches a whole gmail conversation: participants, the latest message in full and only the new text of every earlier message.
+
+    Args:
+        thread_id: The thread id of a message, as returned by get_emails.
+
+    Returns:
+        A dictionary containing the thread or an error message.
+    """
+    return google_api_service.get_email_thread(thread_id)
+
+
+def get_calendar_events(
+    date_time_min: str, date_time_max: str, max_items: int, all_calendars: bool = False
+) -> Dict:
     """
     Fetches google calendar events within a specified time window.
 
@@ -25,14 +53,17 @@ def get_calendar_events(date_time_min: str, date_time_max: str, max_items: int)
         date_time_min: start time in ISO format (e.g. "2025-02-20T10:00:00Z") or you can use magic words like "next week start" or "last month start".
         date_time_max: end time in ISO format or you can use magic words like "next week end" or "last month end".
         max_items: The maximum number of events to retrieve from the calendar.
+        all_calendars: Whether to include the user's other and shared calendars, not only the primary one.
 
     Returns:
-        A dictionary containing the list of events or an error message.
+        A dictionary containing the list of events or an error message. Calendars that
+        couldn't be read are listed under "failed_calendars".
     """
     event_details = google_api_service.get_calendar_events(
         time_min=date_time_min,
         time_max=date_time_max,
         max_items=max_items,
+        all_calendars=all_calendars,
     )
     return event_details
 
@@ -59,12 +90,17 @@ root_agent = Agent(
     1. If you have low confidence in the date range, ask the user to confirm the date range.
     2. If required, use the `get_calendar_events` tool to fetch the calendar events. Be sure to use the correct date range in ISO format.
        If the user does not specify the number of meetings, use max_items=200 as default.
+       Use all_calendars=True only if the user asks about shared, team or all of their calendars.
     3. If required, use the `get_emails` tool to fetch the latest emails. If the user does not specify the number of emails, use max_items=10 as default.
+       It only returns sender, subject, date and a snippet. Use the `get_email_body` tool with the message id only for the emails you need to read in full.
+       To read a conversation with several replies, use the `get_email_thread` tool with the thread id instead.
     4. Present the information in an easy to digest way.
 
     Retrieval tools:
     - If the 'get_calendar_events' tool returns an error message, inform the user and provide troubleshooting steps.
     - If the 'get_emails' tool returns an error message, inform the user and provide troubleshooting steps.
+    - If the 'get_email_body' tool returns an error message, inform the user and provide troubleshooting steps.
+    - If the 'get_email_thread' tool returns an error message, inform the user and provide troubleshooting steps.
     """,
-    tools=[get_calendar_events, get_emails],
+    tools=[get_calendar_events, get_emails, get_email_body, get_email_thread],
 )
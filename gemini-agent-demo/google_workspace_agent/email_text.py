@@ -0,0 +1,283 @@
+"""Turns Gmail message payloads into short plain text for the agents.
+
+    text = message_text(result["payload"], max_tokens=1000)
+
+- Nested multipart payloads are walked recursively. Of the alternatives of
+  the same content the plain text is used, HTML is converted to text when
+  there is no plain text. Attachments and other MIME types are skipped.
+- Quoted replies, forwarded history below an "Original Message" line,
+  signatures, and newsletter headers and footers (unsubscribe, view in
+  browser, legal notices) are cut. Links lose their tracking parameters.
+- What's left is cut to a token budget at a line break, with a note of
+  how much was cut.
+
+For a thread, new_content() keeps of every reply only what the earlier
+messages don't already have.
+
+Tokens are estimated from the length of the text, without a request.
+"""
+import base64
+import html.parser
+import re
+import urllib.parse
+
+
+CHARS_PER_TOKEN = 4  # rough average for English text
+DEFAULT_TOKEN_BUDGET = 1000
+# Shorter lines, like "Thanks," or a name, repeat without being quoted
+MIN_REPEATED_CHARS = 20
+
+# Everything below one of these lines is quoted history or a signature
+_CUT_BELOW = re.compile(
+    r"^(--|-- |_{10,}|-+ ?Original Message ?-+|Sent from my \w+.*|Get Outlook for \w+.*)$",
+    re.IGNORECASE,
+)
+_REPLY_HEADER = re.compile(r"^On .{0,300}wrote:$", re.IGNORECASE | re.DOTALL)
+# Outlook quotes the previous message under a From:/Sent: block. Forwarded
+# messages have From:/Date: and are kept, they are the content
+_OUTLOOK_HEADER = re.compile(r"^From: .+\nSent: ", re.IGNORECASE)
+# Header and footer paragraphs of newsletters and notifications
+_BOILERPLATE = re.compile(
+    r"unsubscribe|view (this email |it )?in (your |a )?browser|manage (your )?(email )?preferences"
+    r"|privacy policy|terms of (service|use)|all rights reserved|©|you('re| are) receiving this"
+    r"|you received this (email|message)|this (email|message) was sent to|confidentiality notice"
+    r"|intended (solely )?for the (named )?(addressee|recipient)|update your (email )?settings"
+    r"|^invitation from google calendar$|forwarding this invitation could allow",
+    re.IGNORECASE,
+)
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|mc_[ce]id|fbclid|gclid|_hsenc|_hsmi|mkt_tok|trk|ref)$")
+_URL = re.compile(r"https?://[^\s<>\"')\]]+")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def message_text(payload, max_tokens: int | None = DEFAULT_TOKEN_BUDGET) -> str | None:
+    """Returns the compacted text of a message payload, None if it has no text."""
+    text = payload_text(payload)
+    if text is None:
+        return None
+    text = compact(text)
+    return truncate(text, max_tokens) if max_tokens else text
+
+
+def payload_text(payload) -> str | None:
+    """Returns the text of a payload or one of its parts, HTML converted to text."""
+    mime_type = payload.get("mimeType", "").lower()
+    if payload.get("filename"):
+        return None  # an attachment
+    if mime_type.startswith("multipart/"):
+        parts = payload.get("parts", [])
+        if mime_type == "multipart/alternative":
+            # The same content in several formats, richest last
+            for part in parts:
+                if part.get("mimeType", "").lower() == "text/plain":
+                    text = payload_text(part)
+                    if text and text.strip():
+                        return text
+            for part in reversed(parts):
+                text = payload_text(part)
+                if text and text.strip():
+                    return text
+            return None
+        # mixed, related, ...: the text of every part
+        texts = [text for text in map(payload_text, parts) if text and text.strip()]
+        return "\n\n".join(texts) if texts else None
+    if mime_type == "text/plain":
+        return _decode(payload)
+    if mime_type == "text/html":
+        data = _decode(payload)
+        return html_to_text(data) if data is not None else None
+    return None
+
+
+def html_to_text(markup: str) -> str:
+    parser = _HtmlText()
+    parser.feed(markup)
+    parser.close()
+    return parser.text()
+
+
+def compact(text: str) -> str:
+    """Cuts quoted history, signatures, boilerplate and tracking from a text."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\u00a0", " ")
+    lines = text.split("\n")
+    kept = []
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if _CUT_BELOW.match(stripped) or _OUTLOOK_HEADER.match("\n".join(lines[i:i + 2]).strip()):
+            break
+        # "On <date>, <name> wrote:" is often wrapped over two lines
+        if stripped.startswith("On ") and (
+            _REPLY_HEADER.match(stripped)
+            or (i + 1 < len(lines) and _REPLY_HEADER.match(f"{stripped} {lines[i + 1].strip()}"))
+        ):
+            break
+        if stripped.startswith(">"):
+            continue
+        kept.append(_URL.sub(lambda match: _clean_link(match.group(0)), line.rstrip()))
+
+    paragraphs = [
+        re.sub(r"[ \t]+", " ", paragraph).strip()
+        for paragraph in re.split(r"\n\s*\n", "\n".join(kept))
+    ]
+    paragraphs = [paragraph for paragraph in paragraphs if paragraph]
+    # Only at the start and the end: a reply may well mention "unsubscribe"
+    while paragraphs and _BOILERPLATE.search(paragraphs[0]):
+        paragraphs.pop(0)
+    while paragraphs and _BOILERPLATE.search(paragraphs[-1]):
+        paragraphs.pop()
+    return "\n\n".join(paragraphs)
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Cuts a text to about max_tokens, at a line break if there is one nearby."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(max_tokens - 10, 1) * CHARS_PER_TOKEN  # room for the note
+    cut = text.rfind("\n", 0, limit)
+    if cut < limit // 2:
+        cut = text.rfind(" ", 0, limit)
+    if cut < limit // 2:
+        cut = limit
+    return f"{text[:cut].rstrip()}\n[... {estimate_tokens(text[cut:])} more tokens cut]"
+
+
+def new_content(texts: list[str]) -> list[str]:
+    """Returns every text without the paragraphs, lines and sentences of the texts before it.
+
+    For the compacted messages of a thread, oldest first. Catches the quotes
+    compact() doesn't recognize, like a reply that pastes a paragraph of an
+    earlier message or quotes it without a marker. Whitespace and
+    punctuation don't matter, so a rewrapped quote is found as well.
+    """
+    seen = set()
+    new_texts = []
+    for text in texts:
+        paragraphs = []
+        for paragraph in text.split("\n\n"):
+            if _repeated(paragraph, seen):
+                continue
+            lines = [line for line in paragraph.split("\n") if not _repeated(line, seen)]
+            sentences = _sentences(" ".join(lines))
+            if any(_repeated(sentence, seen) for sentence in sentences):
+                # Loses the line breaks, of a paragraph that is partly quoted
+                lines = [" ".join(sentence for sentence in sentences if not _repeated(sentence, seen))]
+            if any(lines):
+                paragraphs.append("\n".join(lines))
+        for paragraph in text.split("\n\n"):
+            lines = paragraph.split("\n")
+            seen.add(_key(paragraph))
+            seen.update(map(_key, lines))
+            seen.update(map(_key, _sentences(" ".join(lines))))
+        new_texts.append("\n\n".join(paragraphs))
+    return new_texts
+
+
+def _sentences(text: str) -> list[str]:
+    return re.split(r"(?<=[.!?:])\s+", text)
+
+
+def _key(text: str) -> str:
+    return re.sub(r"\W+", " ", text).strip().lower()
+
+
+def _repeated(text: str, seen: set) -> bool:
+    key = _key(text)
+    return len(key) >= MIN_REPEATED_CHARS and key in seen
+
+
+def _decode(payload) -> str | None:
+    data = payload.get("body", {}).get("data")
+    if data is None:
+        return None  # e.g. a large part that has to be fetched by attachmentId
+    charset = "utf-8"
+    for header in payload.get("headers", []):
+        if header["name"].lower() == "content-type":
+            match = re.search(r"charset=\"?([\w.:-]+)", header["value"], re.IGNORECASE)
+            if match:
+                charset = match.group(1)
+    raw = base64.urlsafe_b64decode(data)
+    try:
+        return raw.decode(charset, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def _clean_link(url: str) -> str:
+    """Drops the tracking parameters of a link, the rest is kept so the link still works."""
+    parts = urllib.parse.urlsplit(url)
+    query = [
+        (name, value)
+        for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not _TRACKING_PARAMS.match(name)
+    ]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query), fragment=""))
+
+
+class _HtmlText(html.parser.HTMLParser):
+    """Collects the text of an HTML email, with line breaks where the layout has them."""
+
+    SKIPPED = {"script", "style", "head", "title", "noscript", "template"}
+    BLOCKS = {
+        "p", "div", "br", "table", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6",
+        "blockquote", "hr", "section", "article", "header", "footer", "center", "pre",
+    }
+    VOID = {"br", "img", "hr", "meta", "link", "input", "wbr", "col", "area", "base", "source"}
+    # Elements that hold the quoted earlier messages of a reply
+    QUOTE_CLASSES = ("gmail_quote", "yahoo_quoted", "moz-cite-prefix")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._chunks = []
+        # The tag of the skipped element we are in, and how deep elements of
+        # the same tag are nested in it. Other tags are ignored: emails often
+        # leave a <p> or <td> unclosed, which must not keep the skip open
+        self._skip_tag = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        attributes = dict(attrs)
+        classes = attributes.get("class") or ""
+        style = (attributes.get("style") or "").replace(" ", "").lower()
+        if tag not in self.VOID and (
+            tag in self.SKIPPED
+            or (tag == "blockquote" and attributes.get("type") == "cite")
+            or any(name in classes for name in self.QUOTE_CLASSES)
+            or attributes.get("id") in ("divRplyFwdMsg", "appendonsend")
+            or "display:none" in style  # e.g. the preview text of newsletters
+        ):
+            self._skip_tag, self._skip_depth = tag, 1
+            return
+        if tag == "li":
+            self._chunks.append("\n- ")
+        elif tag == "tr":
+            self._chunks.append("\n")  # rows one per line, not as paragraphs
+        elif tag in ("td", "th"):
+            self._chunks.append(" ")
+        elif tag in self.BLOCKS:
+            self._chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._skip_tag = None
+            return
+        if tag in self.BLOCKS or tag == "li":
+            self._chunks.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_tag:
+            # Whitespace in HTML is layout, line breaks come from the tags
+            self._chunks.append(re.sub(r"\s+", " ", data))
+
+    def text(self) -> str:
+        lines = (line.strip() for line in "".join(self._chunks).split("\n"))
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
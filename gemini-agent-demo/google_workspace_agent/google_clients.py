@@ -0,0 +1,206 @@
+"""Cached OAuth credentials and Google API clients for the tools.
+
+    credentials = CredentialsProvider(SCOPES)
+    services = ServiceCache(credentials.get)
+    service = services.get("calendar", "v3")
+
+- The credentials are read from token.json once per process and refreshed
+  in a background thread a few minutes before they expire, so a tool call
+  neither reads the file nor waits for a refresh.
+- If a caller still finds them about to expire (e.g. after the laptop slept
+  through the scheduled refresh), concurrent callers share one refresh.
+- API clients are built from the discovery documents bundled with
+  google-api-python-client, once per thread: the HTTP transport (httplib2)
+  isn't thread-safe.
+"""
+import datetime
+import functools
+import json
+import logging
+import os.path
+import threading
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import BatchHttpRequest
+
+
+# Refresh this long before the access token expires
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+# Wait at least this long between background refreshes, also after a failed one
+RETRY_DELAY = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow():
+    # google-auth keeps expiry as a naive UTC datetime
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class CredentialsProvider:
+    def __init__(
+        self,
+        scopes,
+        token_path: str = "token.json",
+        client_secrets_path: str = "credentials.json",
+        refresh_margin: datetime.timedelta = REFRESH_MARGIN,
+        request: Request | None = None,
+    ):
+        """
+        Args:
+            scopes: The OAuth scopes. If you change them, delete the token file.
+            token_path: Stores the user's access and refresh tokens, created
+                when the authorization flow completes for the first time.
+            client_secrets_path: The OAuth client, used when there is no usable token.
+            refresh_margin: How long before the expiry the token is refreshed.
+            request: The HTTP transport for refreshes, a new requests session by default.
+        """
+        self.scopes = scopes
+        self.token_path = token_path
+        self.client_secrets_path = client_secrets_path
+        self.refresh_margin = refresh_margin
+        self.refreshes = 0
+        self._creds = None
+        self._lock = threading.Lock()
+        self._timer = None
+        self._request = request
+
+    def get(self) -> Credentials:
+        """Returns valid credentials, loading or refreshing them only when needed."""
+        creds = self._creds
+        if creds is not None and not self._needs_refresh(creds):
+            return creds
+        # Single flight: the first caller loads or refreshes, the others wait
+        # for the lock and then find fresh credentials
+        with self._lock:
+            if self._creds is None:
+                self._creds = self._load()
+            elif self._needs_refresh(self._creds):
+                self._refresh(self._creds)
+            self._schedule_refresh()
+            return self._creds
+
+    def close(self):
+        """Stops the background refresh."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _needs_refresh(self, creds):
+        if not creds.valid:
+            return True
+        if creds.expiry is None or not creds.refresh_token:
+            return False
+        return creds.expiry - _utcnow() < self.refresh_margin
+
+    def _load(self):
+        creds = None
+        if os.path.exists(self.token_path):
+            creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+        if creds and creds.refresh_token and self._needs_refresh(creds):
+            self._refresh(creds)
+        elif not creds or not creds.valid:
+            # No usable credentials, let the user log in
+            flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets_path, self.scopes)
+            creds = flow.run_local_server(port=0)
+            self._save(creds)
+        return creds
+
+    def _refresh(self, creds):
+        if self._request is None:
+            self._request = Request()
+        creds.refresh(self._request)
+        self.refreshes += 1
+        self._save(creds)
+
+    def _save(self, creds):
+        with open(self.token_path, "w") as token:
+            token.write(creds.to_json())
+
+    def _schedule_refresh(self, delay=None):
+        """Starts a timer that refreshes the credentials before they expire. Needs the lock."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if delay is None:
+            if self._creds.expiry is None or not self._creds.refresh_token:
+                return  # nothing to refresh
+            delay = (self._creds.expiry - self.refresh_margin - _utcnow()).total_seconds()
+        self._timer = threading.Timer(max(delay, RETRY_DELAY), self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            try:
+                if self._needs_refresh(self._creds):
+                    self._refresh(self._creds)
+            except Exception:
+                logger.warning("Refreshing the Google credentials failed", exc_info=True)
+                self._schedule_refresh(RETRY_DELAY)
+                return
+            self._schedule_refresh()
+
+
+@functools.lru_cache(maxsize=None)
+def _discovery_document(name, version):
+    document = discovery_cache.get_static_doc(name, version)
+    if document is None:
+        raise ValueError(f"No bundled discovery document for {name} {version}")
+    return document
+
+
+@functools.lru_cache(maxsize=None)
+def _batch_paths(name, version):
+    """Returns (rootUrl, servicePath, batchPath) of an API."""
+    document = json.loads(_discovery_document(name, version))
+    return document["rootUrl"], document["servicePath"], document.get("batchPath", "batch")
+
+
+class ServiceCache:
+    """API clients per thread, built once from the bundled discovery documents."""
+
+    def __init__(self, get_credentials, endpoints: dict | None = None):
+        """
+        Args:
+            get_credentials: Returns the credentials, e.g. CredentialsProvider.get.
+            endpoints: Optional API endpoint per service name, e.g. for a local stub.
+        """
+        self.get_credentials = get_credentials
+        self.endpoints = endpoints or {}
+        self._local = threading.local()
+
+    def get(self, name: str, version: str):
+        creds = self.get_credentials()
+        services = self._local.__dict__.setdefault("services", {})
+        cached = services.get((name, version))
+        # Refreshes update the credentials in place, only new ones need a new client
+        if cached is None or cached[0] is not creds:
+            endpoint = self.endpoints.get(name)
+            service = build_from_document(
+                _discovery_document(name, version),
+                credentials=creds,
+                client_options={"api_endpoint": endpoint} if endpoint else None,
+            )
+            cached = services[(name, version)] = (creds, service)
+        return cached[1]
+
+    def new_batch_http_request(self, name: str, version: str, callback=None) -> BatchHttpRequest:
+        """Like service.new_batch_http_request(), but sent to the configured endpoint.
+
+        The client library always sends batches to the rootUrl of the
+        discovery document, even when the api_endpoint is set.
+        """
+        root_url, service_path, batch_path = _batch_paths(name, version)
+        endpoint = self.endpoints.get(name)
+        if endpoint:
+            # Endpoints include the service path, e.g. .../calendar/v3/
+            if service_path and endpoint.endswith(service_path):
+                endpoint = endpoint[:-len(service_path)]
+            root_url = endpoint if endpoint.endswith("/") else endpoint + "/"
+        return BatchHttpRequest(callback=callback, batch_uri=root_url + batch_path)